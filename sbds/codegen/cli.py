@@ -2,6 +2,7 @@
 
 import glob
 import json
+import re
 import sys
 
 import click
@@ -99,6 +100,12 @@ JSONB_TYPES = {
     'steemit::protocol::comment_options_extensions_type'
 }
 
+# `name = Column('db_name', ...` or `name = Column(...`
+COLUMN_NAME_RE = re.compile(r"""^(\w+) = Column\((?:['"](\w+)['"])?""")
+
+# `name=lambda x: expression, # comment`
+FIELD_RE = re.compile(r'^(\w+)=lambda x:\s*(.*?),\s*#')
+
 ACCOUNT_NAME_TYPES = {
     'account_name_type'
     'flat_set< account_name_type>',
@@ -117,9 +124,9 @@ def get_fields(name, _type):
     # third: lookup by type
     fields = []
     if _type == 'asset':
-        # amount_field(x.get('amount'), num_func=float)
+        # amount_field(x.get('amount'))
         fields.append(
-            f"{name}=lambda x: amount_field(x.get('{name}'), num_func=float), # steem_type:{_type}")
+            f"{name}=lambda x: amount_field(x.get('{name}')), # steem_type:{_type}")
         fields.append(
             f"{name}_symbol=lambda x: amount_symbol_field(x.get('{name}')), # steem_type:{_type}")
 
@@ -162,7 +169,7 @@ def _get_columns_by_type(name, _type):
     # account_name_type
     elif _type == 'account_name_type':
         return [
-            f'{name} = Column(String(16),nullable=True) # steem_type:{_type}']
+            f'{name} = Column(String(16)) # steem_type:{_type}']
 
     # flat_set< account_name_type>
     elif _type == 'flat_set< account_name_type>':
@@ -326,12 +333,35 @@ def op_fields(cls):
     return fields
 
 
+def op_row(cls):
+    """Return [(db column names, row builder expression)] for an op's data columns
+
+    The expression is the op's field handler inlined, or `x.get(name)`. Both
+    columns of an asset are filled from one `*asset_field(...)` parse.
+    """
+    fields = dict(FIELD_RE.match(f).groups() for f in op_fields(cls))
+    row = []
+    op_name = cls['name']
+    for prop in iter_properties_keys(cls):
+        name = prop['name']
+        columns = []
+        for col in get_columns(name, prop['type'], op_name):
+            attr_name, db_name = COLUMN_NAME_RE.match(col).groups()
+            columns.append(db_name or attr_name)
+        if prop['type'] == 'asset' and len(columns) == 2:
+            row.append((columns, f"*asset_field(x.get('{name}'))"))
+            continue
+        for column in columns:
+            row.append(([column], fields.get(column, f"x.get('{name}')")))
+    return row
+
+
 def op_source(op_name, examples_path=None):
     try:
-        with open(f'{examples_path}/{examples_path}.txt') as f:
+        with open(f'{examples_path}/{op_name}_source.txt') as f:
             print(f'loading {op_name} source', file=sys.stderr)
             return f.read()
-    except:
+    except FileNotFoundError:
         return None
 
 
@@ -373,7 +403,8 @@ def operation_class_data(op_name, cls, cache_dir=None, refs=None):
         op_table_name=op_table_name(op_name),
         op_columns=op_columns(cls),
         op_fields=op_fields(cls),
-        op_source=op_source(op_name),
+        op_row=op_row(cls),
+        op_source=op_source(op_name, examples_path=cache_dir),
         op_example=op_example,
         op_class_operation_base=op_class_operation_base(cls),
         op_rel_import_dot=op_rel_import_dot(cls),
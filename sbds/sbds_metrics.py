@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Minimal in-process metrics rendered in the Prometheus text exposition format
+
+    Metrics are plain python objects updated from the event loop, so no
+    locking is done. Label values are passed as keyword arguments:
+
+    .. code-block:: python
+
+        REQUESTS = Counter('sbds_requests_total', 'Requests', ('method',))
+        REQUESTS.inc(method='sbds.health')
+        text = REGISTRY.render()
+
+"""
+import math
+from bisect import bisect_left
+from collections import OrderedDict
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5,
+                   5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"')
+
+
+def format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ''
+    labels = ','.join(f'{name}="{escape_label_value(value)}"'
+                      for name, value in pairs)
+    return f'{{{labels}}}'
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = OrderedDict()
+        if registry is None:
+            registry = REGISTRY
+        if registry is not False:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, '
+                             f'got {tuple(labels)}')
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, format_labels(self.labelnames, key), value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name}{labels} {format_value(value)}'
+                     for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None,
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames=labelnames,
+                         registry=registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            # [per-bucket counts, sum, count]
+            state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def get(self, **labels):
+        """Return (sum, count) of observations"""
+        state = self.values.get(self._key(labels))
+        if state is None:
+            return 0.0, 0
+        return state[1], state[2]
+
+    def samples(self):
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labelnames, key,
+                                       extra=[('le', format_value(upper_bound))])
+                yield f'{self.name}_bucket', labels, cumulative
+            labels = format_labels(self.labelnames, key)
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = OrderedDict()
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'duplicate metric name: {metric.name}')
+        self.metrics[metric.name] = metric
+
+    def render(self):
+        return '\n'.join(m.render() for m in self.metrics.values()) + '\n'
+
+
+REGISTRY = Registry()
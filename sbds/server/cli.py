@@ -16,6 +16,31 @@ def server():
 @server.command(name='serve')
 @click.option('--host', type=click.STRING, default='localhost', help='host')
 @click.option('--port', type=click.INT, default=8080, help='host TCP port')
-def server_command(host, port):
+@click.option(
+    '--database_url',
+    type=str,
+    envvar='DATABASE_URL',
+    help='Database connection URL in RFC-1738 format, read from "DATABASE_URL" ENV var by default'
+)
+@click.option(
+    '--steemd_http_url',
+    metavar='STEEMD_HTTP_URL',
+    envvar='STEEMD_HTTP_URL',
+    default='https://api.steemit.com',
+    help='Steemd HTTP server URL, used by the healthcheck')
+@click.option('--db_pool_min_size', type=click.INT, default=10,
+              help='minimum number of database connections')
+@click.option('--db_pool_max_size', type=click.INT, default=20,
+              help='maximum number of database connections')
+@click.option('--ws_buffer_size', type=click.INT, default=1000,
+              help='messages queued for a websocket subscriber before it is '
+                   'disconnected')
+def server_command(host, port, database_url, steemd_http_url,
+                   db_pool_min_size, db_pool_max_size, ws_buffer_size):
     """server"""
-    run(host, port)
+    run(host, port,
+        database_url=database_url,
+        steemd_http_url=steemd_http_url,
+        db_pool_min_size=db_pool_min_size,
+        db_pool_max_size=db_pool_max_size,
+        ws_buffer_size=ws_buffer_size)
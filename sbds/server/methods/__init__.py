@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import dateutil.parser
+
+from sbds.storages.db.tables.operations import combined_ops_class_map
+from sbds.storages.db.views.count_operations import BLOCK_RANGE_FOR_TIME_SQL
+from sbds.storages.db.views.count_operations import COUNT_OPERATIONS_FOR_TYPE_SQL
+from sbds.storages.db.views.count_operations import count_operations_in_range_args
+from sbds.storages.db.views.count_operations import count_operations_in_range_sql
+
+from ..pool import register_query
+
+register_query(
+    'count_account_create_with_delegation_operations',
+    'SELECT COUNT(*) FROM sbds_op_account_create_with_delegations')
+
+register_query(
+    'recent_account_create_with_delegation_operations',
+    'SELECT * FROM sbds_op_account_create_with_delegations ORDER BY timestamp DESC LIMIT 5')
+
+register_query('count_operations', COUNT_OPERATIONS_FOR_TYPE_SQL)
+
+register_query('block_range_for_time', BLOCK_RANGE_FOR_TIME_SQL)
+
+for _op_type in combined_ops_class_map:
+    register_query(
+        f'count_operations_in_range.{_op_type}',
+        count_operations_in_range_sql(_op_type))
+
+
+async def count_account_create_with_delegation_operations(context=None):
+    """
+    This function demonstrates how to write a method to run
+    an SQL query which returns a single number
+
+    :param context:
+    :return: int
+    """
+    pool = context['aiohttp_request'].app['db']
+    async with pool.acquire() as conn:
+        return await conn.fetchval_registered(
+            'count_account_create_with_delegation_operations')
+
+
+async def recent_account_create_with_delegation_operations(context=None):
+    """
+    This function demonstrates how to write a method to run
+    an SQL query which returns rows
+
+    :param context:
+    :return: List[Dict]
+
+    """
+    pool = context['aiohttp_request'].app['db']
+    async with pool.acquire() as conn:
+        rows = await conn.fetch_registered(
+            'recent_account_create_with_delegation_operations')
+        return [dict(row) for row in rows]
+
+
+# pylint: disable=unused-argument
+async def count_operations(operation_name=None, first_block=None,
+                           last_block=None, start_time=None, end_time=None,
+                           context=None) -> int:
+    """
+        Count operations of one type from sbds_meta_operation_counts,
+        optionally in a range of block_nums or of timestamps
+
+    :param operation_name: eg "vote"
+    :param first_block: lowest block_num to count, inclusive
+    :param last_block: highest block_num to count, inclusive
+    :param start_time: ISO 8601 timestamp to count from, inclusive
+    :param end_time: ISO 8601 timestamp to count to, exclusive
+    :return: int
+    """
+    if operation_name not in combined_ops_class_map:
+        raise ValueError(f'Unknown operation_name: {operation_name}')
+    pool = context['aiohttp_request'].app['db']
+    async with pool.acquire() as conn:
+        if start_time is not None or end_time is not None:
+            if first_block is not None or last_block is not None:
+                raise ValueError(
+                    'Use either a block range or a time range, not both')
+            time_first_block, time_last_block = await conn.fetchrow_registered(
+                'block_range_for_time',
+                dateutil.parser.parse(start_time or '1970-01-01'),
+                dateutil.parser.parse(end_time or '9999-12-31'))
+            if time_first_block is None or time_last_block is None:
+                return 0
+            first_block, last_block = time_first_block, time_last_block
+        if first_block is None and last_block is None:
+            return await conn.fetchval_registered('count_operations',
+                                                  operation_name)
+        first_block = 0 if first_block is None else int(first_block)
+        last_block = 2**31 - 2 if last_block is None else int(last_block)
+        if first_block > last_block:
+            return 0
+        return await conn.fetchval_registered(
+            f'count_operations_in_range.{operation_name}',
+            *count_operations_in_range_args(first_block, last_block))
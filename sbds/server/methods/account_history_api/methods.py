@@ -10,11 +10,11 @@ async def get_ops_in_block(block_num, only_virtual, context=None):
     :param context:
     :return: int
     """
-    engine = context['aiohttp_request'].app['db']
+    pool = context['aiohttp_request'].app['db']
     query = 'FIXME'
-    async with engine.acquire() as conn:
+    async with pool.acquire() as conn:
         # FIXME
-        return await conn.scalar(query)
+        return await conn.fetchval(query)
 
 
 async def get_account_history(account_name, context=None):
@@ -26,9 +26,8 @@ async def get_account_history(account_name, context=None):
     :return: List[Dict]
 
     """
-    engine = context['aiohttp_request'].app['db']
+    pool = context['aiohttp_request'].app['db']
     query = 'FIXME'
-    async with engine.acquire() as conn:
+    async with pool.acquire() as conn:
         # FIXME
-        cursor = await conn.execute(query)
-        return await cursor.fetchall()
+        return await conn.fetch(query)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import time
+
+import asyncpg
+import asyncpg.connection
+import structlog
+
+from sbds.sbds_metrics import Histogram
+
+logger = structlog.get_logger(__name__)
+
+DB_POOL_WAIT_SECONDS = Histogram(
+    'sbds_db_pool_wait_seconds',
+    'Time spent waiting to acquire a database connection from the pool')
+
+# name -> sql of every query which should be prepared on each pool connection
+QUERIES = dict()
+
+
+def register_query(name, query):
+    """
+    Register a query to be prepared once on every pool connection
+
+    :param name: key used to look the prepared statement up
+    :param query: sql string using asyncpg's $n placeholders
+    :return: name
+    """
+    QUERIES[name] = query
+    return name
+
+
+class PreparedStatementConnection(asyncpg.connection.Connection):
+    """asyncpg connection which prepares every registered query up front
+
+    The prepared statements are kept on the connection, and survive it being
+    released back to the pool, so each registered query is only parsed and
+    planned once per connection.
+    """
+
+    async def prepare_registered(self):
+        # pylint: disable=attribute-defined-outside-init
+        self._registered = dict()
+        for name, query in QUERIES.items():
+            try:
+                self._registered[name] = await self.prepare(query)
+            except asyncpg.exceptions.PostgresError as e:
+                # eg, table doesn't exist yet, prepared on first use instead
+                logger.warning('unable to prepare query', name=name, e=e)
+
+    def registered(self, name):
+        """Return the prepared statement for name, or None if it isn't"""
+        return getattr(self, '_registered', {}).get(name)
+
+    async def fetch_registered(self, name, *args):
+        stmt = self.registered(name)
+        if stmt is None:
+            return await self.fetch(QUERIES[name], *args)
+        return await stmt.fetch(*args)
+
+    async def fetchrow_registered(self, name, *args):
+        stmt = self.registered(name)
+        if stmt is None:
+            return await self.fetchrow(QUERIES[name], *args)
+        return await stmt.fetchrow(*args)
+
+    async def fetchval_registered(self, name, *args):
+        stmt = self.registered(name)
+        if stmt is None:
+            return await self.fetchval(QUERIES[name], *args)
+        return await stmt.fetchval(*args)
+
+
+async def init_connection(conn):
+    await conn.prepare_registered()
+
+
+class PoolAcquireContext:
+    def __init__(self, pool, timeout=None):
+        self.pool = pool
+        self.timeout = timeout
+        self.conn = None
+
+    async def __aenter__(self):
+        pool = self.pool
+        pool.waiting += 1
+        start = time.perf_counter()
+        try:
+            self.conn = await pool.pool.acquire(timeout=self.timeout)
+        finally:
+            pool.waiting -= 1
+        pool.record_wait(time.perf_counter() - start)
+        pool.in_use += 1
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        self.pool.in_use -= 1
+        await self.pool.pool.release(self.conn)
+
+
+class Pool:
+    """asyncpg pool which tracks acquire wait times and saturation"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.waiting = 0
+        self.in_use = 0
+        self.acquired = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def acquire(self, timeout=None):
+        return PoolAcquireContext(self, timeout=timeout)
+
+    def record_wait(self, seconds):
+        DB_POOL_WAIT_SECONDS.observe(seconds)
+        self.acquired += 1
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def stats(self):
+        max_size = self.pool.get_max_size()
+        return dict(
+            min_size=self.pool.get_min_size(),
+            max_size=max_size,
+            size=self.pool.get_size(),
+            idle=self.pool.get_idle_size(),
+            in_use=self.in_use,
+            waiting=self.waiting,
+            saturation=self.in_use / max_size,
+            acquired=self.acquired,
+            wait_seconds=self.wait_seconds,
+            max_wait_seconds=self.max_wait_seconds)
+
+    async def close(self):
+        await self.pool.close()
+
+
+async def create_pool(database_url, min_size=10, max_size=20, **kwargs):
+    pool = await asyncpg.create_pool(
+        database_url,
+        min_size=min_size,
+        max_size=max_size,
+        connection_class=PreparedStatementConnection,
+        init=init_connection,
+        statement_cache_size=max(100, 2 * len(QUERIES)),
+        **kwargs)
+    return Pool(pool)
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import datetime
+import decimal
 import functools
 import json
 import os
+import time
 
-import aiopg.sa
+import aiohttp
 import structlog
 import uvloop
 
@@ -17,6 +19,19 @@ from sqlalchemy.engine.url import make_url
 
 from .methods.account_history_api.methods import get_ops_in_block
 from .methods.account_history_api.methods import get_account_history
+from .methods import count_operations
+from .methods import count_account_create_with_delegation_operations
+from .methods import recent_account_create_with_delegation_operations
+from .pool import create_pool
+from .pool import register_query
+from .subscriptions import WS_BUFFER_SIZE
+from .subscriptions import Fanout
+from .subscriptions import ws_handler
+from ..sbds_metrics import CONTENT_TYPE
+from ..sbds_metrics import REGISTRY
+from ..sbds_metrics import Counter
+from ..sbds_metrics import Gauge
+from ..sbds_metrics import Histogram
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
@@ -25,12 +40,48 @@ config.log_requests = False
 
 logger = structlog.get_logger(__name__)
 
+register_query('sbds.last_db_block_num',
+               'SELECT MAX(block_num) FROM sbds_core_blocks')
+
+# seconds between background refreshes of the healthcheck snapshot
+HEALTH_REFRESH_INTERVAL = 3
+
+# max allowable difference between last irreversible block and highest db block
+MAX_BLOCK_NUM_DIFF = 100
+
+DB_POOL_MIN_SIZE = 10
+DB_POOL_MAX_SIZE = 20
+
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'sbds_http_requests_in_flight',
+    'HTTP requests currently being handled')
+HTTP_REQUEST_SECONDS = Histogram(
+    'sbds_http_request_duration_seconds',
+    'HTTP request latency', ('path', 'status'))
+JSONRPC_REQUESTS = Counter(
+    'sbds_jsonrpc_requests_total',
+    'JSON-RPC method calls', ('method',))
+JSONRPC_ERRORS = Counter(
+    'sbds_jsonrpc_errors_total',
+    'JSON-RPC method calls which raised', ('method',))
+JSONRPC_REQUEST_SECONDS = Histogram(
+    'sbds_jsonrpc_request_duration_seconds',
+    'JSON-RPC method latency', ('method',))
+DB_POOL_CONNECTIONS = Gauge(
+    'sbds_db_pool_connections',
+    'Database pool connections by state', ('state',))
+DB_POOL_SATURATION = Gauge(
+    'sbds_db_pool_saturation',
+    'Fraction of the maximum pool size currently in use')
+
 # pylint: disable=redefined-outer-name
 
 
 def default_json(obj):
     if isinstance(obj, datetime.datetime):
         return str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
     raise TypeError('Unable to serialize {!r}'.format(obj))
 
 
@@ -39,19 +90,65 @@ json_response = functools.partial(web.json_response, dumps=json_dumps)
 
 
 async def init_pg(app):
-    database_url = app['config']['database_url']
-    database_extra = app['config'].get('database_extra', {})
-    parsed_db_url = make_url(database_url)
-    database_kwargs = dict(
-        database=parsed_db_url['database'],
-        user=parsed_db_url['user'],
-        password=parsed_db_url['password'],
-        host=parsed_db_url['host'],
-        port=parsed_db_url['port'],
-        **database_extra
-    )
-    engine = await aiopg.sa.create_engine(**database_kwargs, loop=app.loop)
-    app['db'] = engine
+    database_url = make_url(app['config']['database_url'])
+    database_url.drivername = 'postgresql'
+    database_extra = app['config'].get('database_extra') or {}
+    app['db'] = await create_pool(
+        str(database_url),
+        min_size=app['config']['db_pool_min_size'],
+        max_size=app['config']['db_pool_max_size'],
+        loop=app.loop,
+        **database_extra)
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+        # use the route, not the raw path, to keep label cardinality bounded
+        resource = request.match_info.route.resource
+        path = resource.canonical if resource else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, path=path, status=status)
+
+
+def instrument_jsonrpc_method(func, name):
+    """Wrap a jsonrpc method to record its call count, errors and latency"""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        JSONRPC_REQUESTS.inc(method=name)
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            JSONRPC_ERRORS.inc(method=name)
+            raise
+        finally:
+            JSONRPC_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, method=name)
+    return wrapper
+
+
+async def metrics_handler(request):
+    pool = request.app['db']
+    if pool:
+        stats = pool.stats()
+        for state in ('size', 'idle', 'in_use', 'waiting'):
+            DB_POOL_CONNECTIONS.set(stats[state], state=state)
+        DB_POOL_SATURATION.set(stats['saturation'])
+    return web.Response(body=REGISTRY.render().encode(),
+                        headers={'Content-Type': CONTENT_TYPE})
 
 
 async def handle_api(aiohttp_request):
@@ -69,72 +166,203 @@ async def handle_api(aiohttp_request):
     return json_response(jsonrpc_method_response)
 
 
-async def api_healthcheck(request):
-    db = request.config.db
-    block_cls = request.config.Block
-    rpc = request.config.rpc
-    app = request.app
-    last_db_block = block_cls.highest_block(db)
-    last_irreversible_block = rpc.last_irreversible_block_num()
-    diff = last_irreversible_block - last_db_block
-    if diff > app.config['sbds.MAX_BLOCK_NUM_DIFF']:
-        return json_response(
-            500,
+async def init_http_client(app):
+    app['http_client'] = aiohttp.ClientSession(loop=app.loop)
+
+
+async def fetch_last_db_block_num(pool):
+    async with pool.acquire() as conn:
+        last_db_block = await conn.fetchval_registered('sbds.last_db_block_num')
+    return last_db_block or 0
+
+
+async def fetch_last_irreversible_block_num(client, url):
+    jsonrpc_request = {'id': 1, 'jsonrpc': '2.0',
+                       'method': 'get_dynamic_global_properties'}
+    async with client.post(url, json=jsonrpc_request) as response:
+        jsonrpc_response = await response.json()
+    return jsonrpc_response['result']['last_irreversible_block_num']
+
+
+async def refresh_health(app):
+    """
+    Periodically refresh the healthcheck snapshot in `app['health']`
+
+    Both the db query and the steemd request are awaited here, in a
+    background task, so healthcheck requests only ever read the snapshot
+
+    :param app:
+    :return:
+    """
+    health = app['health']
+    interval = app['config']['health_refresh_interval']
+    while True:
+        try:
+            last_db_block, last_irreversible_block = await asyncio.gather(
+                fetch_last_db_block_num(app['db']),
+                fetch_last_irreversible_block_num(
+                    app['http_client'], app['config']['steemd_http_url']))
+            health.update(
+                last_db_block=last_db_block,
+                last_irreversible_block=last_irreversible_block,
+                diff=last_irreversible_block - last_db_block,
+                updated=datetime.datetime.utcnow(),
+                error=None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception('error refreshing healthcheck', e=e)
+            health['error'] = str(e)
+        await asyncio.sleep(interval)
+
+
+async def start_fanout(app):
+    database_url = make_url(app['config']['database_url'])
+    database_url.drivername = 'postgresql'
+    app['fanout'] = Fanout(app['db'], str(database_url), json_dumps)
+    app['fanout'].start(app.loop)
+
+
+async def stop_fanout(app):
+    await app['fanout'].stop()
+
+
+async def start_health_monitor(app):
+    app['health_monitor'] = app.loop.create_task(refresh_health(app))
+
+
+async def stop_health_monitor(app):
+    app['health_monitor'].cancel()
+    try:
+        await app['health_monitor']
+    except asyncio.CancelledError:
+        pass
+
+
+def health_snapshot(app):
+    """
+    Return (is_healthy, health_dict) from the most recent refresh
+
+    :param app:
+    :return: Tuple[bool, Dict]
+    """
+    health = app['health']
+    config = app['config']
+    updated = health['updated']
+    max_age = datetime.timedelta(seconds=config['health_refresh_interval'] * 5)
+    now = datetime.datetime.utcnow()
+    errors = []
+    if updated is None:
+        errors.append('healthcheck has not completed yet')
+    elif now - updated > max_age:
+        errors.append(f'healthcheck is stale, last updated {updated.isoformat()}')
+    if health['error']:
+        errors.append(health['error'])
+    if health['diff'] is not None and health['diff'] > config['max_block_num_diff']:
+        errors.append(
             'last irreversible block (%s) - highest db block (%s) = %s, > max allowable difference (%s)'
-            % (last_irreversible_block, last_db_block, diff,
-               app.config['sbds.MAX_BLOCK_NUM_DIFF']))
+            % (health['last_irreversible_block'], health['last_db_block'],
+               health['diff'], config['max_block_num_diff']))
 
-    return {
-        'status': 'OK',
+    return not errors, {
+        'status': 'ERROR' if errors else 'OK',
+        'errors': errors,
         'source_commit': os.environ.get('SOURCE_COMMIT'),
         'docker_tag': os.environ.get('DOCKER_TAG'),
-        'datetime': datetime.datetime.utcnow().isoformat(),
-        'last_db_block': last_db_block,
-        'last_irreversible_block': last_irreversible_block,
-        'diff': diff
+        'datetime': now.isoformat(),
+        'updated': updated.isoformat() if updated else None,
+        'last_db_block': health['last_db_block'],
+        'last_irreversible_block': health['last_irreversible_block'],
+        'diff': health['diff'],
+        'db_pool': app['db'].stats() if app['db'] else None
     }
 
 
+# pylint: disable=unused-argument
+async def api_healthcheck(context=None):
+    _, health = health_snapshot(context['aiohttp_request'].app)
+    return health
+
+
 async def healthcheck_handler(request):
-    return web.json_response(await api_healthcheck(request))
+    is_healthy, health = health_snapshot(request.app)
+    return json_response(health, status=200 if is_healthy else 500)
 
 
 async def on_cleanup(app):
     logger.info('executing on_cleanup signal handler')
+    await app['http_client'].close()
+    await app['db'].close()
 
 
 def run(host=None,
         port=None,
         database_url=None,
         database_extra=None,
+        steemd_http_url=None,
+        db_pool_min_size=DB_POOL_MIN_SIZE,
+        db_pool_max_size=DB_POOL_MAX_SIZE,
+        ws_buffer_size=WS_BUFFER_SIZE,
         app_extra=None,
         **kwargs):
     app_extra = app_extra or dict()
 
     # layout basic aiohttp config and context
-    app = web.Application()
-    app['config'] = dict()
+    app = web.Application(middlewares=[metrics_middleware])
+    app['config'] = dict(
+        health_refresh_interval=HEALTH_REFRESH_INTERVAL,
+        max_block_num_diff=MAX_BLOCK_NUM_DIFF)
     if kwargs:
         app['config'].update(**kwargs)
     app['config']['database_url'] = database_url
     app['config']['database_extra'] = database_extra
+    app['config']['steemd_http_url'] = steemd_http_url
+    app['config']['db_pool_min_size'] = db_pool_min_size
+    app['config']['db_pool_max_size'] = db_pool_max_size
+    app['config']['ws_buffer_size'] = ws_buffer_size
     app['db'] = None  # this will be defined by init_pg at app startup
+    app['http_client'] = None  # this will be defined by init_http_client at app startup
+    app['fanout'] = None  # this will be defined by start_fanout at app startup
+
+    # updated in place by the health monitor task
+    app['health'] = dict(
+        last_db_block=None,
+        last_irreversible_block=None,
+        diff=None,
+        updated=None,
+        error=None)
 
     # register app lifecycle callbacks
     app.on_startup.append(init_pg)
+    app.on_startup.append(init_http_client)
+    app.on_startup.append(start_health_monitor)
+    app.on_startup.append(start_fanout)
+    app.on_shutdown.append(stop_health_monitor)
+    app.on_shutdown.append(stop_fanout)
     app.on_cleanup.append(on_cleanup)
 
     # register app routes
     app.router.add_post('/', handle_api)
     app.router.add_get('/.well-known/healthcheck.json', healthcheck_handler)
     app.router.add_get('/health', healthcheck_handler)
+    app.router.add_get('/metrics', metrics_handler)
+    app.router.add_get('/ws', ws_handler)
 
     # create jsonrpc method dispatcher
     jsonrpc_methods = AsyncMethods()
 
     # register jsonrpc methods with dispatcher
-    jsonrpc_methods.add(api_healthcheck, 'sbds.health')
-    # TODO add additional methods here
+    methods = {
+        'sbds.health': api_healthcheck,
+        'sbds.count_operations': count_operations,
+        'sbds.count_account_create_with_delegation_operations':
+            count_account_create_with_delegation_operations,
+        'sbds.recent_account_create_with_delegation_operations':
+            recent_account_create_with_delegation_operations,
+        # TODO add additional methods here
+    }
+    for name, method in methods.items():
+        jsonrpc_methods.add(instrument_jsonrpc_method(method, name), name)
 
     # add jsonrpc method dispatcher to aiohttp app context
     app['jsonrpc_methods_dispatcher'] = jsonrpc_methods
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""WebSocket subscriptions to new operations
+
+    One `Fanout` per server listens to the database change feed. For each
+    stored batch it reads the new operations of the types someone is
+    subscribed to, once, serializes each operation once, and queues it for
+    every matching subscriber. Subscribers have a bounded queue each, drained
+    by their own writer, and one which falls a whole queue behind is
+    disconnected rather than slowing the rest down. Batches whose changes
+    were missed, while the fanout was behind the feed or reconnecting to it,
+    are read from the database before the next one is published.
+
+    Clients pick operations by type and/or account in the query string,
+    every operation matches if they don't:
+
+        ws://localhost:8080/ws?op_type=vote&op_type=comment&account=steemit
+
+    and receive one JSON message per operation, plus rollback notices:
+
+        {"event": "operation", "operation": {"block_num": 1, ...}}
+        {"event": "rolled_back", "first_block": 140, "last_block": 2147483647}
+
+    .. code-block:: python
+
+        async with session.ws_connect(f'{url}/ws?op_type=vote') as ws:
+            async for msg in ws:
+                change = json.loads(msg.data)
+"""
+import asyncio
+
+import structlog
+from aiohttp import WSCloseCode
+from aiohttp import web
+
+from sbds.storages.db.change_feed import ROLLED_BACK
+from sbds.storages.db.change_feed import STORED
+from sbds.storages.db.change_feed import ChangeFeed
+from sbds.storages.db.change_feed import ChangeFeedOverflow
+from sbds.storages.db.tables.meta.accounts import ACCOUNT_NAME_EXTRACTORS
+from sbds.storages.db.tables.operations import combined_ops_class_map
+
+from ..sbds_metrics import Counter
+from ..sbds_metrics import Gauge
+
+logger = structlog.get_logger(__name__)
+
+# messages queued for a subscriber before it's disconnected
+WS_BUFFER_SIZE = 1000
+
+# seconds before listening again after the change feed connection is lost
+FEED_RECONNECT_INTERVAL = 3
+
+# seconds to wait for the close handshake before dropping the connection
+WS_CLOSE_TIMEOUT = 5
+
+# blocks whose operations are read at once when catching up on missed changes
+CATCH_UP_BLOCKS = 1000
+
+WS_SUBSCRIBERS = Gauge(
+    'sbds_ws_subscribers',
+    'Connected websocket subscribers')
+WS_MESSAGES = Counter(
+    'sbds_ws_messages_total',
+    'Messages queued for websocket subscribers')
+WS_SLOW_SUBSCRIBERS = Counter(
+    'sbds_ws_slow_subscribers_total',
+    'Websocket subscribers disconnected for falling behind')
+
+
+def new_operations_query(op_type):
+    table = combined_ops_class_map[op_type].__table__
+    return f'''
+        SELECT * FROM {table.name} WHERE block_num BETWEEN $1 AND $2
+        ORDER BY block_num, transaction_num, operation_num'''
+
+
+# run as plain queries, asyncpg's statement cache prepares the ones in use
+NEW_OPERATIONS_QUERIES = {op_type: new_operations_query(op_type)
+                          for op_type in combined_ops_class_map}
+
+
+def operation_accounts(op):
+    extractor = ACCOUNT_NAME_EXTRACTORS.get(op['operation_type'])
+    if extractor is None:
+        return frozenset()
+    return frozenset(filter(None, extractor(op)))
+
+
+class Subscriber:
+    def __init__(self, ws, op_types=None, accounts=None,
+                 buffer_size=WS_BUFFER_SIZE):
+        """
+        :param op_types: op types to send, or None for all of them
+        :param accounts: accounts whose operations to send, or None for all
+        """
+        self.ws = ws
+        self.op_types = op_types
+        self.accounts = accounts
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.writer = None
+        self.slow = False
+        self.close_code = WSCloseCode.OK
+        self.close_message = b''
+
+    def wants_type(self, op_type):
+        return self.op_types is None or op_type in self.op_types
+
+    def offer(self, message):
+        """Queue a message, returning False if the subscriber is too slow"""
+        if self.slow:
+            return False
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.slow = True
+            WS_SLOW_SUBSCRIBERS.inc()
+            asyncio.ensure_future(self.disconnect(
+                WSCloseCode.TRY_AGAIN_LATER, b'subscriber fell behind'))
+            return False
+        return True
+
+    def start(self):
+        self.writer = asyncio.ensure_future(self.write())
+
+    async def write(self):
+        """Send queued messages until the subscriber is disconnected"""
+        try:
+            while True:
+                await self.ws.send_str(await self.queue.get())
+        except ConnectionResetError:
+            # the client went away, the handler cleans up
+            pass
+
+    async def disconnect(self, code, message):
+        """Close the websocket from outside its handler
+
+        Closing wakes the handler, which sends the close with this code.
+        """
+        self.close_code = code
+        self.close_message = message
+        # the writer may be stuck sending to a client which stopped reading
+        if self.writer:
+            self.writer.cancel()
+        await self.ws.close(code=code, message=message)
+
+
+class Fanout:
+    """Fans the change feed's new operations out to websocket subscribers
+
+    Subscribers without an account filter are indexed by op type, the rest
+    by account, so matching an operation only looks at the subscribers
+    which can want it.
+    """
+
+    def __init__(self, pool, database_url, dumps):
+        self.pool = pool
+        self.database_url = database_url
+        self.dumps = dumps
+        # op_type or None -> subscribers without an account filter
+        self.by_type = dict()
+        # account -> subscribers with an account filter
+        self.by_account = dict()
+        self.subscribers = set()
+        self.task = None
+        # highest block_num whose operations were published
+        self.last_block = None
+        # changes were lost to the feed overflowing or reconnecting
+        self.missed = False
+
+    def add(self, subscriber):
+        self.subscribers.add(subscriber)
+        if subscriber.accounts is None:
+            for op_type in subscriber.op_types or (None,):
+                self.by_type.setdefault(op_type, set()).add(subscriber)
+        else:
+            for account in subscriber.accounts:
+                self.by_account.setdefault(account, set()).add(subscriber)
+        WS_SUBSCRIBERS.set(len(self.subscribers))
+
+    def remove(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if subscriber.accounts is None:
+            index, keys = self.by_type, subscriber.op_types or (None,)
+        else:
+            index, keys = self.by_account, subscriber.accounts
+        for key in keys:
+            subscribers = index.get(key, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                index.pop(key, None)
+        WS_SUBSCRIBERS.set(len(self.subscribers))
+
+    def wanted_types(self, op_types):
+        """Return which of op_types any subscriber wants"""
+        wanted = set()
+        for subscriber in self.subscribers:
+            if subscriber.op_types is None:
+                return set(op_types)
+            wanted.update(subscriber.op_types)
+        return wanted.intersection(op_types)
+
+    def targets(self, op):
+        op_type = op['operation_type']
+        targets = set(self.by_type.get(None, ()))
+        targets.update(self.by_type.get(op_type, ()))
+        if self.by_account:
+            for account in operation_accounts(op):
+                targets.update(s for s in self.by_account.get(account, ())
+                               if s.wants_type(op_type))
+        return targets
+
+    def publish(self, subscribers, message):
+        WS_MESSAGES.inc(len(subscribers))
+        for subscriber in subscribers:
+            subscriber.offer(message)
+
+    async def fetch_operations(self, op_types, first_block, last_block):
+        async with self.pool.acquire() as conn:
+            ops = []
+            for op_type in sorted(op_types):
+                rows = await conn.fetch(
+                    NEW_OPERATIONS_QUERIES[op_type], first_block, last_block)
+                ops.extend(dict(row) for row in rows)
+        ops.sort(key=lambda op: (op['block_num'], op['transaction_num'],
+                                 op['operation_num']))
+        return ops
+
+    async def publish_operations(self, op_types, first_block, last_block):
+        ops = await self.fetch_operations(op_types, first_block, last_block)
+        for op in ops:
+            subscribers = self.targets(op)
+            if subscribers:
+                self.publish(subscribers, self.dumps(
+                    dict(event='operation', operation=op)))
+                # let the writers send, so only slow subscribers fill up
+                # on a batch bigger than their queue
+                await asyncio.sleep(0)
+
+    async def catch_up(self, last_block):
+        """Publish the operations stored since the last published block"""
+        first_block = self.last_block + 1
+        logger.info('catching up on missed changes', first_block=first_block,
+                    last_block=last_block)
+        for first in range(first_block, last_block + 1, CATCH_UP_BLOCKS):
+            op_types = self.wanted_types(combined_ops_class_map)
+            if op_types:
+                await self.publish_operations(
+                    op_types, first, min(first + CATCH_UP_BLOCKS - 1, last_block))
+
+    async def handle_change(self, change):
+        if change['event'] == ROLLED_BACK:
+            if self.last_block is not None:
+                self.last_block = min(self.last_block, change['first_block'] - 1)
+            self.publish(self.subscribers, self.dumps(change))
+            return
+        if change['event'] != STORED:
+            return
+        if self.missed:
+            if (self.last_block is not None
+                    and change['first_block'] > self.last_block + 1):
+                await self.catch_up(change['first_block'] - 1)
+            self.missed = False
+        op_types = self.wanted_types(change['ops'])
+        if op_types:
+            await self.publish_operations(op_types, change['first_block'],
+                                          change['last_block'])
+        self.last_block = max(self.last_block or 0, change['last_block'])
+
+    async def listen(self):
+        while True:
+            try:
+                async with ChangeFeed(self.database_url) as feed:
+                    async for change in feed:
+                        await self.handle_change(change)
+            except asyncio.CancelledError:
+                raise
+            except ChangeFeedOverflow as e:
+                logger.warning('websocket fanout fell behind the change feed',
+                               e=e)
+                self.missed = True
+            except Exception as e:
+                logger.exception('change feed error', e=e)
+                self.missed = True
+                await asyncio.sleep(FEED_RECONNECT_INTERVAL)
+
+    def start(self, loop):
+        self.task = loop.create_task(self.listen())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+        async def disconnect(subscriber):
+            try:
+                await asyncio.wait_for(subscriber.disconnect(
+                    WSCloseCode.GOING_AWAY, b'server shutdown'),
+                    WS_CLOSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                # the client stopped reading, its handler drops it
+                pass
+
+        await asyncio.gather(*map(disconnect, list(self.subscribers)))
+
+
+def query_filter(query, name):
+    values = frozenset(query.getall(name, ()))
+    return values or None
+
+
+async def ws_handler(request):
+    fanout = request.app['fanout']
+    op_types = query_filter(request.query, 'op_type')
+    if op_types and not op_types.issubset(combined_ops_class_map):
+        raise web.HTTPBadRequest(
+            text=f'unknown op_type {sorted(op_types - set(combined_ops_class_map))}')
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    subscriber = Subscriber(ws, op_types=op_types,
+                            accounts=query_filter(request.query, 'account'),
+                            buffer_size=request.app['config']['ws_buffer_size'])
+    fanout.add(subscriber)
+    subscriber.start()
+    try:
+        # subscriptions are fixed, incoming messages are only read to notice
+        # the client closing
+        async for _ in ws:
+            pass
+    finally:
+        fanout.remove(subscriber)
+        subscriber.writer.cancel()
+    try:
+        await asyncio.wait_for(ws.close(code=subscriber.close_code,
+                                        message=subscriber.close_message),
+                               WS_CLOSE_TIMEOUT)
+    except asyncio.TimeoutError:
+        # the client stopped reading, so the close frame can't be sent
+        request.transport.abort()
+    return ws
+
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""zstd compression shared by the fs and s3 storage backends
+
+    Blocks and ops are small and extremely repetitive (op names, keys,
+    account names), so they are compressed with a zstd dictionary trained
+    on a sample of them. Dictionaries live in a directory next to the data:
+
+        zstd.dict             dictionary used to compress new data
+        zstd-<dict_id>.dict   every dictionary ever used, for decompression
+
+    Each zstd frame records the id of the dictionary it was compressed
+    with, so data stays readable after retraining. Reads are transparent,
+    anything which doesn't start with the zstd magic number is returned
+    unchanged.
+
+    .. code-block:: python
+
+        codec = Codec.from_dir('blocks_archive')
+        data = codec.compress(raw_block)
+        assert codec.decompress(data) == raw_block
+"""
+import glob
+import os
+import threading
+
+import structlog
+import zstandard as zstd
+
+logger = structlog.get_logger(__name__)
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+DEFAULT_LEVEL = 3
+DEFAULT_DICT_SIZE = 112_640
+CURRENT_DICTIONARY_FILENAME = 'zstd.dict'
+
+
+def is_compressed(data):
+    return bytes(data[:4]) == ZSTD_MAGIC
+
+
+def dictionary_filename(dict_data):
+    return f'zstd-{dict_data.dict_id()}.dict'
+
+
+def train_dictionary(samples, dict_size=DEFAULT_DICT_SIZE):
+    """Train a dictionary from an iterable of bytes samples"""
+    samples = [bytes(s) for s in samples]
+    return zstd.train_dictionary(dict_size, samples)
+
+
+def save_dictionary(dict_data, path):
+    """Save dict_data to directory path and make it the current dictionary"""
+    os.makedirs(path, exist_ok=True)
+    data = dict_data.as_bytes()
+    for filename in (dictionary_filename(dict_data),
+                     CURRENT_DICTIONARY_FILENAME):
+        tmp_path = os.path.join(path, f'{filename}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(path, filename))
+
+
+def load_dictionary(path):
+    with open(path, 'rb') as f:
+        return zstd.ZstdCompressionDict(f.read())
+
+
+class Codec:
+    def __init__(self, dictionary=None, dictionaries=(), level=DEFAULT_LEVEL):
+        """
+        :param dictionary: ZstdCompressionDict to compress with, or None
+        :param dictionaries: other ZstdCompressionDicts to decompress with
+        :param level: zstd compression level
+        """
+        self.level = level
+        self.dictionary = dictionary
+        self.dictionaries = {d.dict_id(): d for d in dictionaries}
+        if dictionary is not None:
+            self.dictionaries[dictionary.dict_id()] = dictionary
+        # zstandard (de)compressors must not be shared between threads
+        self._local = threading.local()
+
+    @classmethod
+    def from_dir(cls, path, level=DEFAULT_LEVEL):
+        """Load the current and all previous dictionaries in path"""
+        current_path = os.path.join(path, CURRENT_DICTIONARY_FILENAME)
+        dictionary = None
+        if os.path.exists(current_path):
+            dictionary = load_dictionary(current_path)
+        dictionaries = [load_dictionary(p)
+                        for p in glob.glob(os.path.join(path, 'zstd-*.dict'))]
+        return cls(dictionary=dictionary, dictionaries=dictionaries,
+                   level=level)
+
+    @property
+    def dict_id(self):
+        return self.dictionary.dict_id() if self.dictionary else 0
+
+    def _compressor(self):
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            if self.dictionary is not None:
+                compressor = zstd.ZstdCompressor(level=self.level,
+                                                 dict_data=self.dictionary)
+            else:
+                compressor = zstd.ZstdCompressor(level=self.level)
+            self._local.compressor = compressor
+        return compressor
+
+    def _decompressor(self, dict_id):
+        decompressors = getattr(self._local, 'decompressors', None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = dict()
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            if not dict_id:
+                decompressor = zstd.ZstdDecompressor()
+            else:
+                try:
+                    dict_data = self.dictionaries[dict_id]
+                except KeyError:
+                    raise ValueError(f'missing zstd dictionary {dict_id}')
+                decompressor = zstd.ZstdDecompressor(dict_data=dict_data)
+            decompressors[dict_id] = decompressor
+        return decompressor
+
+    def compress(self, data):
+        return self._compressor().compress(data)
+
+    def decompress(self, data):
+        """Decompress zstd frames, return anything else unchanged"""
+        if not is_compressed(data):
+            return data
+        dict_id = zstd.get_frame_parameters(data).dict_id
+        return self._decompressor(dict_id).decompress(data)
+
+    def reload(self, path):
+        """Pick up dictionaries added to path, eg after retraining"""
+        codec = Codec.from_dir(path, level=self.level)
+        self.dictionary = codec.dictionary
+        self.dictionaries.update(codec.dictionaries)
+        self._local = threading.local()
+
+
+# decompresses frames made without a dictionary, and passes others through
+PLAIN_CODEC = Codec()
+
+
+def decompress(data, codec=None):
+    return (codec or PLAIN_CODEC).decompress(data)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Change feed of stored and rolled back blocks
+
+    populate sends a NOTIFY on CHANNEL in the transaction of every batch it
+    stores, so it's delivered when the batch commits, and
+    `rollback_blocks` sends one when reversible blocks are rolled back.
+    Payloads are small JSON objects:
+
+        {"event": "stored", "first_block": 101, "last_block": 150,
+         "blocks": 50, "ops": {"vote": 212, "comment": 40}}
+        {"event": "rolled_back", "first_block": 140, "last_block": 2147483647}
+
+    `ChangeFeed` listens on its own connection and yields them as dicts.
+
+    .. code-block:: python
+
+        async with ChangeFeed(database_url) as feed:
+            async for change in feed:
+                if change['event'] == 'stored':
+                    ...
+"""
+import asyncio
+
+import asyncpg
+import funcy
+import structlog
+
+from sbds.sbds_json import dumps
+from sbds.sbds_json import loads
+
+logger = structlog.get_logger(__name__)
+
+CHANNEL = 'sbds_changes'
+
+NOTIFY_SQL = 'SELECT pg_notify($1, $2)'
+
+STORED = 'stored'
+ROLLED_BACK = 'rolled_back'
+
+
+def stored_payload(block_nums, ops):
+    """Return the NOTIFY payload for a batch
+
+    :param block_nums: the block_nums the batch stored
+    :param ops: [(op_type, row)] of the stored blocks
+    """
+    return dumps(dict(event=STORED,
+                      first_block=min(block_nums),
+                      last_block=max(block_nums),
+                      blocks=len(block_nums),
+                      ops=dict(funcy.count_by(funcy.first, ops))))
+
+
+def rolled_back_payload(first_block, last_block):
+    return dumps(dict(event=ROLLED_BACK, first_block=first_block,
+                      last_block=last_block))
+
+
+class ChangeFeedOverflow(Exception):
+    """The subscriber fell so far behind that changes were dropped"""
+
+
+class ChangeFeed:
+    """Async iterator of the changes notified on a channel
+
+    Changes are queued as they arrive, up to max_queue of them. If the
+    consumer falls further behind, the next iteration raises
+    ChangeFeedOverflow, and it should catch up from the database. Losing
+    the connection raises ConnectionError.
+    """
+
+    def __init__(self, database_url, channel=CHANNEL, max_queue=10_000):
+        self.database_url = database_url
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.conn = None
+        self.overflowed = False
+        self.terminated = False
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def _on_terminate(self, conn):
+        self.terminated = True
+        # wake a consumer waiting on an empty queue
+        if self.queue.empty():
+            self.queue.put_nowait(None)
+
+    async def start(self):
+        self.conn = await asyncpg.connect(self.database_url)
+        self.conn.add_termination_listener(self._on_terminate)
+        await self.conn.add_listener(self.channel, self._on_notify)
+        logger.info('listening for changes', channel=self.channel)
+        return self
+
+    async def close(self):
+        if self.conn is not None and not self.conn.is_closed():
+            await self.conn.close()
+        self.conn = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.overflowed:
+            self.overflowed = False
+            # the consumer catches up from the database instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            raise ChangeFeedOverflow(
+                f'more than {self.queue.maxsize} changes were queued')
+        if self.terminated and self.queue.empty():
+            raise ConnectionError('change feed connection was lost')
+        payload = await self.queue.get()
+        if payload is None:
+            raise ConnectionError('change feed connection was lost')
+        return loads(payload)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import itertools as it
 import json
 
 import click
@@ -187,6 +188,171 @@ def find_missing_blocks(ctx, url):
             Block.find_missing(session, last_chain_block=last_chain_block)))
 
 
+@db.command(name='rebuild-operation-counts')
+@click.pass_context
+def rebuild_operation_counts(ctx):
+    """Recount operation counts and hourly rollups, run it with populate stopped"""
+    engine = ctx.obj['engine']
+    database_url = ctx.obj['database_url']
+    metadata = ctx.obj['metadata']
+    from sqlalchemy.sql import text
+    from sbds.storages.db.views.count_operations import rebuild_operation_counts_sql
+    from sbds.storages.db.views.count_operations import rebuild_operation_rollups_sql
+    # init tables first
+    init_tables(database_url, metadata)
+    with engine.begin() as conn:
+        for sql in it.chain(rebuild_operation_counts_sql(),
+                            rebuild_operation_rollups_sql()):
+            conn.execute(text(sql))
+        total = conn.execute(
+            text('SELECT SUM(count) FROM sbds_meta_operation_counts')).scalar()
+    click.echo(f'counted {total or 0} operations')
+
+
+@db.command(name='move-raw')
+@click.option('--chunksize', type=click.INT, default=100_000)
+@click.pass_context
+def move_raw(ctx, chunksize):
+    """Move raw block JSON out of sbds_core_blocks, into sbds_core_blocks_raw"""
+    engine = ctx.obj['engine']
+    database_url = ctx.obj['database_url']
+    metadata = ctx.obj['metadata']
+    from sqlalchemy.sql import text
+    # init tables first
+    init_tables(database_url, metadata)
+    with engine.connect() as conn:
+        has_raw = conn.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'sbds_core_blocks' AND column_name = 'raw'")).scalar()
+        if not has_raw:
+            click.echo('sbds_core_blocks has no raw column')
+            return
+        last_block = conn.execute(
+            text('SELECT MAX(block_num) FROM sbds_core_blocks')).scalar() or 0
+    # a transaction per chunk, so it can be stopped and run again
+    for first_block in range(1, last_block + 1, chunksize):
+        with engine.begin() as conn:
+            conn.execute(text('''
+                INSERT INTO sbds_core_blocks_raw (block_num, raw)
+                SELECT block_num, raw FROM sbds_core_blocks
+                WHERE block_num BETWEEN :first AND :last AND raw IS NOT NULL
+                ON CONFLICT DO NOTHING'''),
+                         first=first_block, last=first_block + chunksize - 1)
+        click.echo(f'moved blocks up to {first_block + chunksize - 1}', err=True)
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE sbds_core_blocks DROP COLUMN raw'))
+    click.echo('moved raw blocks, VACUUM FULL sbds_core_blocks to reclaim its space')
+
+
+@db.command(name='verify')
+@click.option('--start_block', type=int, default=1)
+@click.option('--end_block', type=int, default=None,
+              help='Defaults to the highest stored block')
+@click.option('--chunk_size', type=int, default=100_000,
+              help='Blocks fetched from the server-side cursor at a time')
+@click.option('--delete', is_flag=True,
+              help='Delete the bad blocks, so the next populate loads them again')
+@click.pass_context
+def verify(ctx, start_block, end_block, chunk_size, delete):
+    """Check the previous hash chain and operation counts of stored blocks
+
+    Prints a JSON object for each range of bad blocks.
+    """
+    import asyncio
+    import asyncpg
+    from sbds.storages.db.scripts.reversible_blocks import rollback_blocks
+    from sqlalchemy.engine.url import make_url
+    from sbds.storages.db.scripts.verify_blocks import verify_blocks
+    database_url = ctx.obj['database_url']
+    metadata = ctx.obj['metadata']
+    # init tables first
+    init_tables(database_url, metadata)
+    # asyncpg doesn't take sqlalchemy's driver names
+    url = make_url(database_url)
+    url.drivername = 'postgresql'
+
+    async def run():
+        bad_blocks = 0
+        pool = await asyncpg.create_pool(str(url), min_size=1, max_size=1)
+        try:
+            last = end_block
+            if last is None:
+                last = await pool.fetchval(
+                    'SELECT MAX(block_num) FROM sbds_core_blocks') or 0
+            bad_ranges = []
+            async for problem, first_block, last_block in verify_blocks(
+                    pool, start_block, last, chunk_size=chunk_size):
+                click.echo(json.dumps(dict(problem=problem,
+                                           first_block=first_block,
+                                           last_block=last_block)))
+                bad_blocks += last_block - first_block + 1
+                bad_ranges.append((first_block, last_block))
+            if delete:
+                # after the cursor is closed
+                for first_block, last_block in bad_ranges:
+                    await rollback_blocks(pool, first_block, last_block)
+        finally:
+            await pool.close()
+        return bad_blocks
+
+    bad_blocks = asyncio.get_event_loop().run_until_complete(run())
+    click.echo(f'{bad_blocks} bad blocks', err=True)
+    if bad_blocks:
+        ctx.exit(1)
+
+
+@db.command(name='export')
+@click.argument('out_dir', type=click.Path(file_okay=False))
+@click.option('--op_type', 'op_types', multiple=True,
+              help='Operation types to export, all of them by default')
+@click.option('--end_block', type=int, default=None,
+              help='Defaults to the highest block below which every block is stored and irreversible')
+@click.option('--partition_size', type=int, default=1_000_000,
+              help='Blocks in each Parquet file')
+@click.option('--chunk_size', type=int, default=50_000,
+              help='Rows fetched from the server-side cursor at a time')
+@click.option('--concurrency', type=int, default=4,
+              help='Tables exported at once')
+@click.pass_context
+def export(ctx, out_dir, op_types, end_block, partition_size, chunk_size,
+           concurrency):
+    """Export operation tables to Parquet files, one per range of blocks
+
+    Running it again only writes the partitions with new blocks.
+    """
+    import asyncio
+    import asyncpg
+    from sqlalchemy.engine.url import make_url
+    from sbds.storages.db.scripts.export_parquet import export_operations
+    from sbds.storages.db.tables.operations import combined_ops_class_map
+    database_url = ctx.obj['database_url']
+    metadata = ctx.obj['metadata']
+    unknown = set(op_types) - set(combined_ops_class_map)
+    if unknown:
+        raise click.BadParameter(f'unknown operation types {sorted(unknown)}')
+    # init tables first
+    init_tables(database_url, metadata)
+    # asyncpg doesn't take sqlalchemy's driver names
+    url = make_url(database_url)
+    url.drivername = 'postgresql'
+
+    async def run():
+        pool = await asyncpg.create_pool(str(url), min_size=1,
+                                         max_size=concurrency)
+        try:
+            return await export_operations(pool, out_dir,
+                                           op_types=op_types or None,
+                                           end_block=end_block,
+                                           partition_size=partition_size,
+                                           chunk_size=chunk_size,
+                                           concurrency=concurrency)
+        finally:
+            await pool.close()
+
+    written = asyncio.get_event_loop().run_until_complete(run())
+    click.echo(f'wrote {len(written)} files, {sum(rows for _, rows in written)} rows')
+
+
 @db.command(name='raw-sql')
 @click.argument('sql')
 @click.pass_context
@@ -1,28 +1,90 @@
 # -*- coding: utf-8 -*-
+import datetime
+import re
+from decimal import Decimal
+from decimal import InvalidOperation
+
+import dateutil.parser
 import structlog
 from sbds import sbds_json
 
 logger = structlog.get_logger(__name__)
 
 
-def amount_field(value, num_func=int, no_value=0):
-    if not value:
-        return num_func(no_value)
-    try:
-        return num_func(value.split()[0])
-    except Exception as e:
-        logger.error('amount handler error', original=value, num_func=num_func, no_value=no_value, error=e)
-        return num_func(no_value)
+# "1.000 STEEM", the precision is the number of digits after the point
+ASSET_RE = re.compile(r'(-?\d+)(?:\.(\d+))? ([A-Z]+)$')
 
+# symbols of the NAI (numeric asset identifier) serialization
+NAI_SYMBOLS = {
+    '@@000000013': 'SBD',
+    '@@000000021': 'STEEM',
+    '@@000000037': 'VESTS'
+}
 
-def amount_symbol_field(value, no_value=''):
-    if not value:
-        return no_value
+NO_ASSET = (Decimal(0), '')
+
+
+def parse_asset(value):
+    """Parse an asset into an exact fixed point amount in one pass
+
+    "0.634 SBD" -> (634, 3, 'SBD'), the amount being in units of
+    10**-precision. NAI assets, {"amount": "634", "precision": 3,
+    "nai": "@@000000013"} or ["634", 3, "@@000000013"], are supported too.
+
+    :return: (amount, precision, symbol), or None if value isn't an asset
+    """
+    if isinstance(value, str):
+        match = ASSET_RE.match(value)
+        if match is None:
+            return None
+        whole, fraction, symbol = match.groups()
+        if fraction is None:
+            return int(whole), 0, symbol
+        amount = int(whole + fraction)
+        return amount, len(fraction), symbol
     try:
-        return value.split()[1]
-    except Exception as e:
-        logger.error('amount_symbol handler error', original=value, no_value=no_value, error=e)
+        if isinstance(value, dict):
+            amount, precision, nai = value['amount'], value['precision'], value['nai']
+        else:
+            amount, precision, nai = value
+        return int(amount), int(precision), NAI_SYMBOLS.get(nai, nai)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def asset_field(value, no_value=NO_ASSET):
+    """Return (exact Decimal amount, symbol) for an asset's two columns"""
+    if isinstance(value, str):
+        # fast path, Decimal parses and validates the number itself, which
+        # is quicker than matching ASSET_RE first. Anything ASSET_RE wouldn't
+        # match, eg "1e5 STEEM" or "1.000 STEEM extra", goes the slow way
+        number, _, symbol = value.partition(' ')
+        try:
+            amount = Decimal(number)
+            if (symbol.isalpha() and symbol.isupper() and amount.is_finite()
+                    and amount.as_tuple().exponent <= 0):
+                return amount, symbol
+        except InvalidOperation:
+            pass
+    asset = parse_asset(value)
+    if asset is None:
+        if value:
+            logger.warning('unable to parse asset', value=value)
         return no_value
+    amount, precision, symbol = asset
+    return Decimal(amount).scaleb(-precision), symbol
+
+
+def amount_field(value, num_func=None, no_value=0):
+    """Return an asset's amount, an exact Decimal unless num_func is given"""
+    amount = asset_field(value, no_value=(Decimal(no_value), ''))[0]
+    if num_func is None:
+        return amount
+    return num_func(amount)
+
+
+def amount_symbol_field(value, no_value=''):
+    return asset_field(value, no_value=(0, no_value))[1]
 
 
 def comment_body_field(value):
@@ -45,3 +107,15 @@ def json_string_field(value):
             logger.error('json_string_field error',type=type(value),value=value,error=e)
             raise ValueError(
                 f'Unsupported JSON type: {type(value)} value:{value}')
+
+
+def datetime_field(value):
+    """Parse steemd's `2016-03-24T16:05:00` timestamps without dateutil"""
+    try:
+        return datetime.datetime(
+            int(value[0:4]), int(value[5:7]), int(value[8:10]),
+            int(value[11:13]), int(value[14:16]), int(value[17:19]))
+    except (TypeError, ValueError):
+        if not value:
+            return None
+        return dateutil.parser.parse(value)
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
+import datetime
+import operator as op
 from itertools import chain
 from itertools import starmap
 from itertools import tee
 
 import maya
+
+from .tables.meta.operation_counts import POST_ROLLUP
 '''
 24h 7d 30d with two trailing periods
 '''
@@ -56,38 +60,75 @@ def standard_trailing_windows():
     return chain.from_iterable(
         starmap(trailing_windows, STANDARD_WINDOWS_ARGS))
 
-# pylint: disable=too-many-locals
-def blockchain_stats_query(session):
-    import operator as op
-    from .tables.operations import AccountCreateOperation
-    from .tables.operations import AccountCreateWithDelegationOperation
-    from .tables.operations import CommentOperation
-    from .tables.operations import VoteOperation
-    from .tables.operations import TransferOperation
-
-    account_creates = AccountCreateOperation.standard_windowed_count(session)
-    account_creates_with_delegation = AccountCreateWithDelegationOperation.standard_windowed_count(
-        session)
-    combined_account_creates = map(op.add, account_creates,
-                                   account_creates_with_delegation)
-
-    votes = VoteOperation.standard_windowed_count(session)
-    payments = TransferOperation.standard_windowed_count(session)
-    post_count_query = CommentOperation.post_count_query(session)
-    windowed_post_queries = CommentOperation.standard_trailing_windowed_queries(
-        post_count_query)
-
-    comment_count_query = CommentOperation.comment_count_query(session)
-    windowed_comment_queries = CommentOperation.standard_trailing_windowed_queries(
-        comment_count_query)
-
-    post_counts = tuple(query.scalar() for query in windowed_post_queries)
-    comment_counts = tuple(query.scalar()
-                           for query in windowed_comment_queries)
+# rollups read by blockchain_stats_query
+BLOCKCHAIN_STATS_ROLLUPS = ('account_create', 'account_create_with_delegation',
+                            'vote', 'transfer', 'comment', POST_ROLLUP)
+
+
+def ceil_hour(when):
+    hour = when.replace(minute=0, second=0, microsecond=0)
+    return hour if hour == when else hour + datetime.timedelta(hours=1)
+
+
+def utc_trailing_windows(now=None):
+    """`standard_trailing_windows` without maya's natural language parsing"""
+    now = now or datetime.datetime.utcnow()
+    for step, units, periods in STANDARD_WINDOWS_ARGS:
+        delta = datetime.timedelta(**{units: step})
+        for period in range(periods):
+            yield {'_from': now - delta * (period + 1), 'to': now - delta * period}
+
+
+def rollup_windows(windows=None):
+    """Windows rounded up to whole hours, so the current hour is included"""
+    windows = windows or utc_trailing_windows()
+    return [(ceil_hour(w['_from']), ceil_hour(w['to'])) for w in windows]
+
+
+def blockchain_stats_sql(windows):
+    """One query summing each window of each rollup in sbds_meta_operation_rollups"""
+    sums = ',\n'.join(
+        f'COALESCE(SUM(count) FILTER (WHERE hour >= :from_{i} AND hour < :to_{i}), 0) AS window_{i}'
+        for i in range(len(windows)))
+    params = dict(since=min(_from for _from, _ in windows),
+                  names=tuple(BLOCKCHAIN_STATS_ROLLUPS))
+    for i, (_from, to) in enumerate(windows):
+        params[f'from_{i}'] = _from
+        params[f'to_{i}'] = to
+    sql = f"""
+        SELECT name, {sums}
+        FROM sbds_meta_operation_rollups
+        WHERE name IN :names AND hour >= :since
+        GROUP BY name"""
+    return sql, params
+
+
+def blockchain_stats_query(session, windows=None):
+    """Sum account creates, votes, payments, posts and comments in each window
+
+    Windows default to the standard 24h/7d/30d trailing windows, and are
+    summed from sbds_meta_operation_rollups with a single query.
+    """
+    from sqlalchemy import bindparam
+    from sqlalchemy import text
+
+    windows = rollup_windows(windows)
+    sql, params = blockchain_stats_sql(windows)
+    stmt = text(sql).bindparams(bindparam('names', expanding=True))
+    rows = {row[0]: tuple(int(c) for c in row[1:])
+            for row in session.execute(stmt, params)}
+    zeros = (0,) * len(windows)
+
+    def counts(name):
+        return rows.get(name, zeros)
+
+    comments = counts('comment')
+    posts = counts(POST_ROLLUP)
     return dict(
         labels=STANDARD_WINDOW_LABELS,
-        account_creates=tuple(combined_account_creates),
-        votes=tuple(votes),
-        payments=tuple(payments),
-        post_counts=post_counts,
-        comment_counts=comment_counts)
+        account_creates=tuple(map(op.add, counts('account_create'),
+                                  counts('account_create_with_delegation'))),
+        votes=counts('vote'),
+        payments=counts('transfer'),
+        post_counts=posts,
+        comment_counts=tuple(map(op.sub, comments, posts)))
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Block range leases for sharded backfills
+
+    `plan_leases` splits the gaps in sbds_core_blocks into leases of
+    `lease_size` block_nums, recorded in sbds_meta_backfill_leases. Any number
+    of `populate --backfill work` processes, on any number of hosts, then
+    claim leases with `SELECT ... FOR UPDATE SKIP LOCKED`, heartbeat while
+    they load them and mark them done. A lease whose heartbeat is older than
+    the lease ttl, eg because its worker died, is claimed by the next worker
+    looking for work.
+
+    .. code-block:: python
+
+        await plan_leases(pool, 1, 20_000_000, lease_size=10_000)
+        lease = await claim_lease(pool, 'host-1:1234', lease_ttl=120)
+        if lease:
+            first_block, last_block = lease
+            ...
+            await complete_lease(pool, 'host-1:1234', first_block)
+"""
+import asyncio
+import os
+import socket
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+LEASES_TABLE = 'sbds_meta_backfill_leases'
+
+# leases which still had missing blocks after this many attempts are failed
+MAX_LEASE_ATTEMPTS = 3
+
+GAPS_SQL = '''
+SELECT prev + 1, block_num - 1 FROM (
+    SELECT block_num, lag(block_num) OVER (ORDER BY block_num) AS prev
+    FROM (SELECT block_num FROM sbds_core_blocks
+          WHERE block_num BETWEEN $1 AND $2
+          UNION ALL SELECT $1 - 1
+          UNION ALL SELECT $2 + 1) AS b) AS g
+WHERE block_num - prev > 1
+ORDER BY block_num'''
+
+# a lease is only extended, never shrunk, and a finished lease which grew
+# is pending again
+PLAN_SQL = f'''
+INSERT INTO {LEASES_TABLE} (first_block, last_block, status, attempts)
+VALUES ($1, $2, 'pending', 0)
+ON CONFLICT (first_block) DO UPDATE SET
+    last_block = EXCLUDED.last_block,
+    status = CASE WHEN {LEASES_TABLE}.status IN ('done', 'failed')
+             THEN 'pending' ELSE {LEASES_TABLE}.status END
+WHERE {LEASES_TABLE}.last_block < EXCLUDED.last_block'''
+
+REOPEN_SQL = f'''
+UPDATE {LEASES_TABLE} SET status = 'pending', worker = NULL, attempts = 0
+WHERE first_block = ANY($1::int[]) AND status IN ('done', 'failed')'''
+
+CLAIM_SQL = f'''
+UPDATE {LEASES_TABLE} SET
+    status = 'leased', worker = $1, attempts = attempts + 1,
+    leased_at = now() at time zone 'utc', heartbeat_at = now() at time zone 'utc'
+WHERE first_block = (
+    SELECT first_block FROM {LEASES_TABLE}
+    WHERE status = 'pending'
+       OR (status = 'leased' AND
+           heartbeat_at < now() at time zone 'utc' - make_interval(secs => $2))
+    ORDER BY first_block
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED)
+RETURNING first_block, last_block, attempts'''
+
+HEARTBEAT_SQL = f'''
+UPDATE {LEASES_TABLE} SET heartbeat_at = now() at time zone 'utc'
+WHERE first_block = $1 AND worker = $2 AND status = 'leased'
+RETURNING first_block'''
+
+FINISH_SQL = f'''
+UPDATE {LEASES_TABLE} SET status = $3, done_at = now() at time zone 'utc'
+WHERE first_block = $1 AND worker = $2 AND status = 'leased'
+RETURNING first_block'''
+
+RELEASE_SQL = f'''
+UPDATE {LEASES_TABLE} SET status = 'pending', worker = NULL
+WHERE first_block = $1 AND worker = $2 AND status = 'leased'
+RETURNING first_block'''
+
+STATUS_SQL = f'''
+SELECT status, COUNT(*), COALESCE(SUM(last_block - first_block + 1), 0)
+FROM {LEASES_TABLE} GROUP BY status'''
+
+MISSING_SQL = '''
+SELECT n FROM generate_series($1::int, $2::int) AS n
+WHERE NOT EXISTS (SELECT 1 FROM sbds_core_blocks WHERE block_num = n)'''
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def lease_ranges(first_block, last_block, lease_size, start_block, end_block):
+    """Split a gap into leases aligned to multiples of lease_size
+
+    Leases start at 1, lease_size + 1, 2 * lease_size + 1, ... except the
+    first, which starts at start_block, and the last one ends at end_block.
+    """
+    first_lease = (first_block - 1) // lease_size
+    last_lease = (last_block - 1) // lease_size
+    for n in range(first_lease, last_lease + 1):
+        yield (max(n * lease_size + 1, start_block),
+               min((n + 1) * lease_size, end_block))
+
+
+async def plan_leases(pool, start_block, end_block, lease_size=10_000):
+    """Record a lease for every lease_size range with blocks missing
+
+    Existing leases are reused, finished leases which still have gaps are
+    pending again.
+
+    :return: the number of leases with missing blocks
+    """
+    async with pool.acquire() as conn:
+        gaps = await conn.fetch(GAPS_SQL, start_block, end_block)
+        leases = dict()
+        for first_block, last_block in gaps:
+            leases.update(lease_ranges(first_block, last_block, lease_size,
+                                       start_block, end_block))
+        async with conn.transaction():
+            await conn.executemany(PLAN_SQL, list(leases.items()))
+            await conn.execute(REOPEN_SQL, list(leases))
+    logger.info('planned backfill leases', gaps=len(gaps), leases=len(leases),
+                start_block=start_block, end_block=end_block)
+    return len(leases)
+
+
+async def claim_lease(pool, worker, lease_ttl):
+    """Claim the lowest pending or expired lease
+
+    :return: (first_block, last_block, attempts) or None if there aren't any
+    """
+    async with pool.acquire() as conn:
+        lease = await conn.fetchrow(CLAIM_SQL, worker, float(lease_ttl))
+    if lease is None:
+        return None
+    return tuple(lease)
+
+
+async def heartbeat_lease(pool, worker, first_block):
+    """Return False if the lease has been reclaimed by another worker"""
+    async with pool.acquire() as conn:
+        return await conn.fetchval(HEARTBEAT_SQL, first_block, worker) is not None
+
+
+async def complete_lease(pool, worker, first_block, status='done'):
+    async with pool.acquire() as conn:
+        return await conn.fetchval(FINISH_SQL, first_block, worker,
+                                   status) is not None
+
+
+async def release_lease(pool, worker, first_block):
+    async with pool.acquire() as conn:
+        return await conn.fetchval(RELEASE_SQL, first_block, worker) is not None
+
+
+async def lease_status(pool):
+    """Return {status: (leases, blocks)}"""
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(STATUS_SQL)
+    return {status: (count, blocks) for status, count, blocks in rows}
+
+
+async def missing_block_nums_in_lease(pool, first_block, last_block):
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(MISSING_SQL, first_block, last_block)
+    return [row[0] for row in rows]
+
+
+async def heartbeat_until_cancelled(pool, worker, first_block, interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await heartbeat_lease(pool, worker, first_block):
+                # the blocks are still stored, ON CONFLICT DO NOTHING makes
+                # the other worker's copy harmless
+                logger.warning('lease was reclaimed by another worker',
+                               first_block=first_block, worker=worker)
+                return
+        except Exception as e:
+            logger.warning('unable to heartbeat lease',
+                           first_block=first_block, e=e)
+
+
+async def work_leases(pool, worker, process_range, lease_ttl=120,
+                      idle_interval=None):
+    """Claim and load leases until every lease is done or failed
+
+    :param process_range: coroutine function called with a lease's missing
+        block_nums
+    :param lease_ttl: seconds without a heartbeat before a lease is reclaimed
+    :return: the number of leases this worker finished
+    """
+    idle_interval = idle_interval or max(1, lease_ttl / 4)
+    finished = 0
+    while True:
+        lease = await claim_lease(pool, worker, lease_ttl)
+        if lease is None:
+            status = await lease_status(pool)
+            if 'leased' not in status and 'pending' not in status:
+                return finished
+            # other workers hold the remaining leases, wait in case they
+            # expire
+            await asyncio.sleep(idle_interval)
+            continue
+        first_block, last_block, attempts = lease
+        logger.info('claimed lease', first_block=first_block,
+                    last_block=last_block, attempts=attempts, worker=worker)
+        heartbeat = asyncio.ensure_future(
+            heartbeat_until_cancelled(pool, worker, first_block,
+                                      lease_ttl / 3))
+        try:
+            missing = await missing_block_nums_in_lease(pool, first_block,
+                                                        last_block)
+            if missing:
+                await process_range(missing)
+                missing = await missing_block_nums_in_lease(pool, first_block,
+                                                            last_block)
+        except BaseException:
+            heartbeat.cancel()
+            await release_lease(pool, worker, first_block)
+            raise
+        heartbeat.cancel()
+        if not missing:
+            await complete_lease(pool, worker, first_block)
+            finished += 1
+        elif attempts >= MAX_LEASE_ATTEMPTS:
+            logger.error('lease failed', first_block=first_block,
+                         missing=len(missing), attempts=attempts)
+            await complete_lease(pool, worker, first_block, status='failed')
+        else:
+            logger.warning('lease has missing blocks, releasing it',
+                           first_block=first_block, missing=len(missing))
+            await release_lease(pool, worker, first_block)
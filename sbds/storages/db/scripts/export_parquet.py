@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Parquet exports of the operation tables for `sbds db export`
+
+    Each operation table is written to one Parquet file per partition of
+    `partition_size` block_nums, streamed from a server-side cursor a chunk
+    of rows at a time, so no table or partition is held in memory:
+
+        <out_dir>/sbds_op_votes/000000001-001000000.parquet
+        <out_dir>/sbds_op_votes/001000001-001234567.parquet
+
+    A file's name is the range of block_nums it holds. Exports only go as far
+    as every block is stored and irreversible, and a partition is only
+    written again when that has moved past the end of its file, so running
+    the export again only writes the newest partition of each table.
+
+    .. code-block:: python
+
+        written = await export_operations(pool, '/data/parquet')
+"""
+import asyncio
+import os
+import re
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sqlalchemy.types
+import structlog
+from sqlalchemy.dialects.postgresql import JSONB
+
+from sbds.storages.db.scripts.ingest_checkpoints import load_checkpoint
+from sbds.storages.db.scripts.reversible_blocks import REVERSIBLE_TABLE
+from sbds.storages.db.tables.operations import combined_ops_class_map
+
+logger = structlog.get_logger(__name__)
+
+PARTITION_SIZE = 1_000_000
+
+PARTITION_FILE = re.compile(r'^(\d+)-(\d+)\.parquet$')
+
+# most specific first, eg UnicodeText is a String
+ARROW_TYPES = (
+    (sqlalchemy.types.Boolean, lambda t: pa.bool_()),
+    (sqlalchemy.types.SmallInteger, lambda t: pa.int16()),
+    (sqlalchemy.types.BigInteger, lambda t: pa.int64()),
+    (sqlalchemy.types.Integer, lambda t: pa.int32()),
+    # unsized numerics hold uint32 and uint64 ids
+    (sqlalchemy.types.Numeric,
+     lambda t: pa.decimal128(t.precision or 20, t.scale or 0)),
+    (sqlalchemy.types.DateTime, lambda t: pa.timestamp('us')),
+    (JSONB, lambda t: pa.string()),
+    (sqlalchemy.types.Enum, lambda t: pa.string()),
+    (sqlalchemy.types.String, lambda t: pa.string()),
+)
+
+
+def arrow_type(column_type):
+    for sql_type, to_arrow in ARROW_TYPES:
+        if isinstance(column_type, sql_type):
+            return to_arrow(column_type)
+    raise TypeError(f'No Parquet type for {column_type!r}')
+
+
+def arrow_schema(table):
+    """Return the Parquet schema of a sqlalchemy table"""
+    return pa.schema([pa.field(c.name, arrow_type(c.type), nullable=c.nullable)
+                      for c in table.columns])
+
+
+def partitions(end_block, partition_size=PARTITION_SIZE):
+    """Yield (first_block, last_block) of the partitions up to end_block
+
+    The last partition ends at end_block.
+    """
+    for first_block in range(1, end_block + 1, partition_size):
+        yield first_block, min(first_block + partition_size - 1, end_block)
+
+
+def partition_filename(first_block, last_block):
+    return f'{first_block:09d}-{last_block:09d}.parquet'
+
+
+def exported_partitions(table_dir):
+    """Return {first_block: last_block} of the files in table_dir"""
+    try:
+        names = os.listdir(table_dir)
+    except FileNotFoundError:
+        return dict()
+    matches = filter(None, map(PARTITION_FILE.match, names))
+    return {int(m.group(1)): int(m.group(2)) for m in matches}
+
+
+def select_sql(table):
+    columns = ', '.join(f'"{c.name}"' for c in table.columns)
+    order = ', '.join(f'"{c.name}"' for c in table.primary_key.columns)
+    return (f'SELECT {columns} FROM {table.name} '
+            f'WHERE block_num BETWEEN $1 AND $2 ORDER BY {order}')
+
+
+async def exportable_block_num(pool):
+    """Return the highest block_num below which every block is final"""
+    checkpoint = await load_checkpoint(pool)
+    high_water = checkpoint[0] if checkpoint else 0
+    async with pool.acquire() as conn:
+        reversible = await conn.fetchval(
+            f'SELECT MIN(block_num) FROM {REVERSIBLE_TABLE}')
+    if reversible is not None:
+        high_water = min(high_water, reversible - 1)
+    return high_water
+
+
+def write_batch(writer, schema, rows):
+    columns = list(zip(*rows))
+    batch = pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type)
+         for column, field in zip(columns, schema)], schema=schema)
+    writer.write_table(pa.Table.from_batches([batch]))
+
+
+async def export_partition(pool, table, path, first_block, last_block,
+                           chunk_size=50_000, loop=None):
+    """Write a table's rows from first_block to last_block to path
+
+    The file appears under its name once it's complete.
+
+    :return: the number of rows written
+    """
+    loop = loop or asyncio.get_event_loop()
+    schema = arrow_schema(table)
+    tmp_path = f'{path}.tmp'
+    writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+    rows_count = 0
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor(select_sql(table), first_block,
+                                           last_block)
+                while True:
+                    rows = await cursor.fetch(chunk_size)
+                    if not rows:
+                        break
+                    # a row group per chunk, built off the event loop
+                    await loop.run_in_executor(None, write_batch, writer,
+                                               schema, rows)
+                    rows_count += len(rows)
+    except BaseException:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+    writer.close()
+    os.replace(tmp_path, path)
+    return rows_count
+
+
+async def export_table(pool, op_type, out_dir, end_block,
+                       partition_size=PARTITION_SIZE, chunk_size=50_000):
+    """Write the partitions of op_type's table which changed since the last export
+
+    :return: [(path, rows)] of the files written
+    """
+    table = combined_ops_class_map[op_type].__table__
+    table_dir = os.path.join(out_dir, table.name)
+    os.makedirs(table_dir, exist_ok=True)
+    exported = exported_partitions(table_dir)
+    written = []
+    for first_block, last_block in partitions(end_block, partition_size):
+        previous_last_block = exported.get(first_block)
+        if previous_last_block == last_block:
+            continue
+        path = os.path.join(table_dir, partition_filename(first_block,
+                                                          last_block))
+        rows = await export_partition(pool, table, path, first_block,
+                                      last_block, chunk_size=chunk_size)
+        if previous_last_block is not None:
+            os.remove(os.path.join(
+                table_dir, partition_filename(first_block, previous_last_block)))
+        logger.info('exported partition', path=path, rows=rows)
+        written.append((path, rows))
+    return written
+
+
+async def export_operations(pool, out_dir, op_types=None, end_block=None,
+                            partition_size=PARTITION_SIZE, chunk_size=50_000,
+                            concurrency=4):
+    """Export op tables in parallel, up to the last final block
+
+    :param end_block: export no further than this block_num
+    :param concurrency: tables exported at once
+    :return: [(path, rows)] of the files written
+    """
+    exportable = await exportable_block_num(pool)
+    if end_block is not None:
+        exportable = min(exportable, end_block)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def export(op_type):
+        async with semaphore:
+            return await export_table(pool, op_type, out_dir, exportable,
+                                      partition_size=partition_size,
+                                      chunk_size=chunk_size)
+
+    results = await asyncio.gather(*(
+        export(op_type) for op_type in sorted(op_types or combined_ops_class_map)))
+    return [written for table_written in results for written in table_written]
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Durable populate progress
+
+    A checkpoint is a high-water mark, below which every block is stored,
+    and the ranges of stored blocks above it. Each batch of blocks inserts
+    the ranges it covers in the same transaction as its rows, and
+    `compact_checkpoint` merges ranges into the high-water mark as the gaps
+    below them fill, so the blocks missing from the database are known
+    without reading sbds_core_blocks.
+
+    .. code-block:: python
+
+        checkpoint = await load_checkpoint(pool)
+        if checkpoint is None:
+            checkpoint = await seed_checkpoint(pool)
+        missing_ranges = uncovered_ranges(*checkpoint, start_block, end_block)
+"""
+import itertools as it
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+CHECKPOINT = 'populate'
+
+CHECKPOINTS_TABLE = 'sbds_meta_ingest_checkpoints'
+RANGES_TABLE = 'sbds_meta_ingest_checkpoint_ranges'
+
+RANGE_INSERT = f'''
+INSERT INTO {RANGES_TABLE} (name, first_block, last_block) VALUES ($1, $2, $3)
+ON CONFLICT (name, first_block) DO UPDATE SET
+    last_block = GREATEST({RANGES_TABLE}.last_block, EXCLUDED.last_block)'''
+
+CHECKPOINT_INSERT = f'''
+INSERT INTO {CHECKPOINTS_TABLE} (name, high_water, updated_at)
+VALUES ($1, 0, now() at time zone 'utc')
+ON CONFLICT (name) DO NOTHING'''
+
+CHECKPOINT_UPDATE = f'''
+UPDATE {CHECKPOINTS_TABLE} SET high_water = $2, updated_at = now() at time zone 'utc'
+WHERE name = $1'''
+
+# contiguous runs of stored block_nums
+STORED_RANGES_SQL = '''
+SELECT MIN(block_num), MAX(block_num) FROM (
+    SELECT block_num, block_num - row_number() OVER (ORDER BY block_num) AS run
+    FROM sbds_core_blocks) AS b
+GROUP BY run ORDER BY 1'''
+
+
+def covered_ranges(requested, stored):
+    """Return the ranges of block_nums stored by a batch
+
+    Block_nums between requested ones were already stored, so a range only
+    ends at a requested block_num which the batch didn't store.
+    """
+    stored = set(stored)
+    ranges = []
+    run = None
+    for block_num in sorted(requested):
+        if block_num in stored:
+            if run is None:
+                run = [block_num, block_num]
+            run[1] = block_num
+        elif run is not None:
+            ranges.append(tuple(run))
+            run = None
+    if run is not None:
+        ranges.append(tuple(run))
+    return ranges
+
+
+def merge_ranges(ranges, high_water=0):
+    """Merge adjacent and overlapping ranges, and those reaching high_water
+
+    :return: (high_water, [(first_block, last_block)])
+    """
+    merged = []
+    for first_block, last_block in sorted(ranges):
+        if first_block <= high_water + 1:
+            high_water = max(high_water, last_block)
+        elif merged and first_block <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last_block)
+        else:
+            merged.append([first_block, last_block])
+    return high_water, [tuple(r) for r in merged]
+
+
+def uncovered_ranges(high_water, ranges, start_block, end_block):
+    """Return the ranges between start_block and end_block not yet stored"""
+    missing = []
+    next_block = max(start_block, high_water + 1)
+    for first_block, last_block in sorted(ranges):
+        if next_block > end_block:
+            break
+        if first_block > next_block:
+            missing.append((next_block, min(first_block - 1, end_block)))
+        next_block = max(next_block, last_block + 1)
+    if next_block <= end_block:
+        missing.append((next_block, end_block))
+    return missing
+
+
+def subtract_range(high_water, ranges, first_block, last_block):
+    """Remove first_block..last_block from a checkpoint
+
+    :return: (high_water, ranges)
+    """
+    pieces = []
+    if high_water > last_block:
+        pieces.append((last_block + 1, high_water))
+    for f, l in ranges:
+        if f < first_block:
+            pieces.append((f, min(l, first_block - 1)))
+        if l > last_block:
+            pieces.append((max(f, last_block + 1), l))
+    return merge_ranges(pieces, min(high_water, first_block - 1))
+
+
+def block_nums_in_ranges(ranges):
+    return list(it.chain.from_iterable(
+        range(first_block, last_block + 1) for first_block, last_block in ranges))
+
+
+def count_blocks_in_ranges(ranges):
+    return sum(last_block - first_block + 1 for first_block, last_block in ranges)
+
+
+async def load_checkpoint(pool, name=CHECKPOINT):
+    """Return (high_water, ranges), or None if there is no checkpoint"""
+    async with pool.acquire() as conn:
+        high_water = await conn.fetchval(
+            f'SELECT high_water FROM {CHECKPOINTS_TABLE} WHERE name = $1', name)
+        if high_water is None:
+            return None
+        rows = await conn.fetch(
+            f'SELECT first_block, last_block FROM {RANGES_TABLE} '
+            'WHERE name = $1 ORDER BY first_block', name)
+    return high_water, [tuple(row) for row in rows]
+
+
+async def seed_checkpoint(pool, name=CHECKPOINT):
+    """Rebuild a checkpoint from the blocks stored in sbds_core_blocks
+
+    This reads every block_num once, it's only needed for databases loaded
+    before checkpoints existed or after blocks were deleted.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(CHECKPOINT_INSERT, name)
+            await conn.fetchval(
+                f'SELECT high_water FROM {CHECKPOINTS_TABLE} '
+                'WHERE name = $1 FOR UPDATE', name)
+            stored = await conn.fetch(STORED_RANGES_SQL)
+            high_water, ranges = merge_ranges(tuple(row) for row in stored)
+            await conn.execute(f'DELETE FROM {RANGES_TABLE} WHERE name = $1',
+                               name)
+            await conn.executemany(RANGE_INSERT,
+                                   [(name, f, l) for f, l in ranges])
+            await conn.execute(CHECKPOINT_UPDATE, name, high_water)
+    logger.info('seeded ingest checkpoint', name=name, high_water=high_water,
+                ranges=len(ranges))
+    return high_water, ranges
+
+
+async def compact_checkpoint(pool, name=CHECKPOINT):
+    """Merge a checkpoint's ranges, advancing high_water past those it reaches
+
+    :return: (high_water, ranges)
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(CHECKPOINT_INSERT, name)
+            # serializes compactions, batches only insert ranges
+            high_water = await conn.fetchval(
+                f'SELECT high_water FROM {CHECKPOINTS_TABLE} '
+                'WHERE name = $1 FOR UPDATE', name)
+            # locked, so a batch can't extend a range between it being read
+            # and deleted below
+            rows = [tuple(row) for row in await conn.fetch(
+                f'SELECT first_block, last_block FROM {RANGES_TABLE} '
+                'WHERE name = $1 FOR UPDATE', name)]
+            new_high_water, ranges = merge_ranges(rows, high_water)
+            if new_high_water == high_water and len(ranges) == len(rows):
+                return high_water, ranges
+            # ranges inserted since they were read are left alone
+            await conn.execute(
+                f'DELETE FROM {RANGES_TABLE} '
+                'WHERE name = $1 AND first_block = ANY($2::int[])',
+                name, [f for f, _ in rows])
+            await conn.executemany(RANGE_INSERT,
+                                   [(name, f, l) for f, l in ranges])
+            if new_high_water != high_water:
+                await conn.execute(CHECKPOINT_UPDATE, name, new_high_water)
+    return new_high_water, ranges
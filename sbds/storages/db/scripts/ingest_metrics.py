@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Per-stage instrumentation for populate
+
+    Each block moves through four stages:
+
+        fetch   - request blocks and ops from the source and read the response
+        decode  - parse the response JSON
+        prepare - convert raw blocks and ops into rows
+        store   - write rows to the database
+
+    Comparing time spent and items processed per stage shows whether a
+    sync is bound by steemd (fetch), CPU (decode, prepare) or Postgres
+    (store).
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+
+import structlog
+from aiohttp import web
+
+from sbds.sbds_metrics import CONTENT_TYPE
+from sbds.sbds_metrics import REGISTRY
+from sbds.sbds_metrics import Counter
+from sbds.sbds_metrics import Gauge
+from sbds.sbds_metrics import Histogram
+
+logger = structlog.get_logger(__name__)
+
+STAGES = ('fetch', 'decode', 'prepare', 'store')
+
+STAGE_SECONDS = Histogram(
+    'sbds_ingest_stage_seconds',
+    'Latency of each ingest stage', ('stage',))
+STAGE_BLOCKS = Counter(
+    'sbds_ingest_stage_blocks_total',
+    'Blocks which have completed each ingest stage', ('stage',))
+STAGE_OPS = Counter(
+    'sbds_ingest_stage_ops_total',
+    'Operations which have completed each ingest stage', ('stage',))
+STAGE_BYTES = Counter(
+    'sbds_ingest_stage_bytes_total',
+    'Bytes handled by each ingest stage', ('stage',))
+STAGE_ERRORS = Counter(
+    'sbds_ingest_stage_errors_total',
+    'Errors raised in each ingest stage', ('stage',))
+ROWS = Counter(
+    'sbds_ingest_rows_total',
+    'Rows stored per table', ('table',))
+IN_FLIGHT = Gauge(
+    'sbds_ingest_in_flight',
+    'Batches (fetch, decode) or blocks (prepare, store) currently in each stage',
+    ('stage',))
+
+
+@contextmanager
+def timed(stage, blocks=0, ops=0, nbytes=0):
+    """Record latency, throughput and errors for one pass through `stage`"""
+    IN_FLIGHT.inc(stage=stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    else:
+        STAGE_BLOCKS.inc(blocks, stage=stage)
+        STAGE_OPS.inc(ops, stage=stage)
+        STAGE_BYTES.inc(nbytes, stage=stage)
+    finally:
+        IN_FLIGHT.dec(stage=stage)
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_ops(stage, count):
+    STAGE_OPS.inc(count, stage=stage)
+
+
+def record_bytes(stage, nbytes):
+    STAGE_BYTES.inc(nbytes, stage=stage)
+
+
+def record_rows(table, count=1):
+    ROWS.inc(count, table=table)
+
+
+def snapshot():
+    return dict(
+        time=time.perf_counter(),
+        blocks={s: STAGE_BLOCKS.get(stage=s) for s in STAGES},
+        ops={s: STAGE_OPS.get(stage=s) for s in STAGES},
+        bytes={s: STAGE_BYTES.get(stage=s) for s in STAGES},
+        seconds={s: STAGE_SECONDS.get(stage=s)[0] for s in STAGES},
+        errors={s: STAGE_ERRORS.get(stage=s) for s in STAGES},
+        rows={table: count for (table,), count in ROWS.values.items()})
+
+
+def rates(previous, current):
+    """Compute per-second rates between two snapshots"""
+    elapsed = current['time'] - previous['time'] or 1
+    stages = dict()
+    for stage in STAGES:
+        blocks = current['blocks'][stage] - previous['blocks'][stage]
+        seconds = current['seconds'][stage] - previous['seconds'][stage]
+        stages[stage] = dict(
+            blocks_per_sec=round(blocks / elapsed, 1),
+            ops_per_sec=round(
+                (current['ops'][stage] - previous['ops'][stage]) / elapsed, 1),
+            bytes_per_sec=round(
+                (current['bytes'][stage] - previous['bytes'][stage]) / elapsed),
+            ms_per_block=round(1000 * seconds / blocks, 2) if blocks else None,
+            errors=current['errors'][stage] - previous['errors'][stage],
+            in_flight=IN_FLIGHT.get(stage=stage))
+    rows = {
+        table: round((count - previous['rows'].get(table, 0)) / elapsed, 1)
+        for table, count in current['rows'].items()
+        if count != previous['rows'].get(table, 0)}
+    return stages, rows
+
+
+async def report_ingest_stats(interval=10, top_tables=10):
+    """Periodically log stage and per-table throughput"""
+    previous = snapshot()
+    while True:
+        await asyncio.sleep(interval)
+        current = snapshot()
+        stages, rows = rates(previous, current)
+        busiest = sorted(rows.items(), key=lambda kv: kv[1], reverse=True)
+        logger.info('ingest stats',
+                    stages=stages,
+                    rows_per_sec=sum(rows.values()),
+                    tables_rows_per_sec=dict(busiest[:top_tables]))
+        previous = current
+
+
+async def metrics_handler(request):
+    return web.Response(body=REGISTRY.render().encode(),
+                        headers={'Content-Type': CONTENT_TYPE})
+
+
+async def start_metrics_server(host, port):
+    """Serve GET /metrics from the running event loop, returns the runner"""
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
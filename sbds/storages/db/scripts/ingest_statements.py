@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Prepared INSERT statements for populate, held by each pool connection
+
+    Every connection prepares the block, raw block, account, operation count
+    and rollup, checkpoint range and reversible block INSERTs, the change
+    feed NOTIFY, and one INSERT per op type, when the pool opens it. Op
+    statements are keyed by op type and column signature, so storing a block
+    never builds SQL or asks the server to parse it.
+
+    .. code-block:: python
+
+        pool = await create_ingest_pool(database_url)
+        async with pool.acquire() as conn:
+            sql = await conn.op_statement('vote', VoteOperation._row_columns)
+            await conn.fetchval(sql, *row)
+"""
+import asyncpg
+import asyncpg.connection
+import structlog
+
+from sbds.storages.db.change_feed import NOTIFY_SQL
+from sbds.storages.db.scripts.ingest_checkpoints import RANGE_INSERT
+from sbds.storages.db.scripts.reversible_blocks import REVERSIBLE_INSERT
+from sbds.storages.db.tables.operations import combined_ops_class_map
+from sbds.storages.db.tables.operations import op_class_for_type
+
+logger = structlog.get_logger(__name__)
+
+BLOCK_COLUMNS = ('block_num', 'previous', 'timestamp', 'witness',
+                 'witness_signature', 'transaction_merkle_root', 'block_id')
+BLOCK_RAW_COLUMNS = ('block_num', 'raw')
+
+
+def insert_sql(table, columns):
+    columns_str = ', '.join(f'"{c}"' for c in columns)
+    values_str = ', '.join(f'${i}' for i in range(1, len(columns) + 1))
+    return f'INSERT INTO {table} ({columns_str}) VALUES({values_str}) ON CONFLICT DO NOTHING'
+
+
+def op_insert_sql(op_type, columns):
+    return insert_sql(op_class_for_type(op_type).__tablename__, columns)
+
+
+BLOCK_INSERT = insert_sql('sbds_core_blocks', BLOCK_COLUMNS)
+BLOCK_RAW_INSERT = insert_sql('sbds_core_blocks_raw', BLOCK_RAW_COLUMNS)
+ACCOUNT_INSERT = 'INSERT INTO sbds_meta_accounts (name) VALUES($1) ON CONFLICT DO NOTHING'
+
+# one array per column, returns the block_nums which weren't already stored
+BLOCK_COLUMN_TYPES = ('int', 'text', 'timestamp', 'text', 'text', 'text', 'text')
+BLOCKS_INSERT = (
+    'INSERT INTO sbds_core_blocks ({columns}) SELECT * FROM unnest({arrays}) '
+    'ON CONFLICT DO NOTHING RETURNING block_num').format(
+        columns=', '.join(f'"{c}"' for c in BLOCK_COLUMNS),
+        arrays=', '.join(f'${i}::{t}[]'
+                         for i, t in enumerate(BLOCK_COLUMN_TYPES, 1)))
+BLOCKS_RAW_INSERT = (
+    'INSERT INTO sbds_core_blocks_raw (block_num, raw) '
+    'SELECT * FROM unnest($1::int[], $2::text[]) ON CONFLICT DO NOTHING')
+
+OPERATION_COUNT_INCREMENT = '''
+INSERT INTO sbds_meta_operation_counts (operation_type, bucket, count)
+VALUES ($1, $2, $3)
+ON CONFLICT (operation_type, bucket) DO UPDATE SET
+    count = sbds_meta_operation_counts.count + EXCLUDED.count'''
+
+OPERATION_ROLLUP_INCREMENT = '''
+INSERT INTO sbds_meta_operation_rollups (name, hour, count)
+VALUES ($1, $2, $3)
+ON CONFLICT (name, hour) DO UPDATE SET
+    count = sbds_meta_operation_rollups.count + EXCLUDED.count'''
+
+
+class IngestConnection(asyncpg.connection.Connection):
+    """asyncpg connection with a registry of prepared INSERT statements
+
+    Statements are prepared into asyncpg's per-connection statement cache,
+    which survives the connection being released back to the pool, and
+    registered by key. Executing a registered statement's sql only looks
+    it up in the cache.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # key -> sql of a statement in the statement cache
+        self.statements = dict()
+
+    async def statement(self, key, sql):
+        registered = self.statements.get(key)
+        if registered is None:
+            # pylint: disable=protected-access
+            await self._get_statement(sql, None)
+            registered = self.statements[key] = sql
+        return registered
+
+    async def block_statement(self):
+        return await self.statement('block', BLOCK_INSERT)
+
+    async def block_raw_statement(self):
+        return await self.statement('block_raw', BLOCK_RAW_INSERT)
+
+    async def account_statement(self):
+        return await self.statement('account', ACCOUNT_INSERT)
+
+    async def blocks_statement(self):
+        return await self.statement('blocks', BLOCKS_INSERT)
+
+    async def blocks_raw_statement(self):
+        return await self.statement('blocks_raw', BLOCKS_RAW_INSERT)
+
+    async def operation_count_statement(self):
+        return await self.statement('operation_count', OPERATION_COUNT_INCREMENT)
+
+    async def operation_rollup_statement(self):
+        return await self.statement('operation_rollup', OPERATION_ROLLUP_INCREMENT)
+
+    async def reversible_statement(self):
+        return await self.statement('reversible', REVERSIBLE_INSERT)
+
+    async def checkpoint_statement(self):
+        return await self.statement('checkpoint', RANGE_INSERT)
+
+    async def notify_statement(self):
+        return await self.statement('notify', NOTIFY_SQL)
+
+    async def op_statement(self, op_type, columns):
+        """Return the INSERT for op_type, for rows with these columns"""
+        key = (op_type, columns)
+        registered = self.statements.get(key)
+        if registered is None:
+            registered = await self.statement(key,
+                                              op_insert_sql(op_type, columns))
+        return registered
+
+    async def prepare_statements(self):
+        try:
+            await self.block_statement()
+            await self.block_raw_statement()
+            await self.account_statement()
+            await self.blocks_statement()
+            await self.blocks_raw_statement()
+            await self.operation_count_statement()
+            await self.operation_rollup_statement()
+            await self.checkpoint_statement()
+            await self.reversible_statement()
+            await self.notify_statement()
+            for op_type, op_cls in combined_ops_class_map.items():
+                await self.op_statement(op_type, op_cls._row_columns)
+        except asyncpg.exceptions.PostgresError as e:
+            # eg, tables don't exist yet, the rest are prepared on first use
+            logger.warning('unable to prepare ingest statements', e=e)
+        # preparing leaves its implicit transaction, and the locks it took on
+        # every op table, open until the next command; end it so idle
+        # connections never block DDL
+        await self.execute('SELECT 1')
+
+
+async def init_connection(conn):
+    await conn.prepare_statements()
+
+
+async def create_ingest_pool(database_url, min_size=40, max_size=40, **kwargs):
+    return await asyncpg.create_pool(database_url,
+                                     min_size=min_size,
+                                     max_size=max_size,
+                                     connection_class=IngestConnection,
+                                     init=init_connection,
+                                     statement_cache_size=max(
+                                         100, 2 * len(combined_ops_class_map)),
+                                     **kwargs)
@@ -9,7 +9,6 @@ import click
 
 from asyncio import Queue
 
-import aiofiles
 import uvloop
 from tqdm import tqdm
 import psycopg2
@@ -26,14 +25,45 @@ from aiohttp.connector import TCPConnector
 import asyncpg.exceptions
 
 from sbds.storages.db.tables.async_core import prepare_raw_block_for_storage
+from sbds.storages.db.tables.operations import op_class_for_type
 from sbds.storages.db.tables.operations import op_db_table_for_type
 from sbds.storages.db.tables.async_core import prepare_raw_operation_for_storage
+from sbds.storages.db.tables.async_core import prepare_raw_operation_row
 from sbds.storages.db.tables import Base
-from sbds.storages.db.tables.meta.accounts import extract_account_names
+from sbds.storages.db.tables.meta.operation_counts import POST_ROLLUP
+from sbds.storages.db.tables.meta.operation_counts import operation_count_bucket
+from sbds.storages.db.tables.meta.operation_counts import operation_rollup_hour
 
 from sbds.storages.db.tables import init_tables
 from sbds.storages.db.tables import test_connection
 from sbds.storages.db.utils import isolated_engine
+from sbds.storages.sources import SteemdSource
+from sbds.storages.sources import block_source
+from sbds.storages.db.change_feed import CHANNEL as CHANGE_FEED_CHANNEL
+from sbds.storages.db.change_feed import stored_payload
+from sbds.storages.db.scripts.ingest_metrics import record_rows
+from sbds.storages.db.scripts.ingest_statements import BLOCK_COLUMNS
+from sbds.storages.db.scripts.ingest_statements import create_ingest_pool
+from sbds.storages.db.scripts.backfill_leases import default_worker_id
+from sbds.storages.db.scripts.ingest_checkpoints import CHECKPOINT
+from sbds.storages.db.scripts.ingest_checkpoints import block_nums_in_ranges
+from sbds.storages.db.scripts.ingest_checkpoints import compact_checkpoint
+from sbds.storages.db.scripts.ingest_checkpoints import count_blocks_in_ranges
+from sbds.storages.db.scripts.ingest_checkpoints import covered_ranges
+from sbds.storages.db.scripts.ingest_checkpoints import load_checkpoint
+from sbds.storages.db.scripts.ingest_checkpoints import seed_checkpoint
+from sbds.storages.db.scripts.ingest_checkpoints import uncovered_ranges
+from sbds.storages.db.scripts.reversible_blocks import chain_block_id
+from sbds.storages.db.scripts.reversible_blocks import fork_block_num
+from sbds.storages.db.scripts.reversible_blocks import promote_blocks
+from sbds.storages.db.scripts.reversible_blocks import rollback_blocks
+from sbds.storages.db.scripts.reversible_blocks import staged_block_ids
+from sbds.storages.db.scripts.backfill_leases import lease_status
+from sbds.storages.db.scripts.backfill_leases import plan_leases
+from sbds.storages.db.scripts.backfill_leases import work_leases
+from sbds.storages.db.scripts.ingest_metrics import report_ingest_stats
+from sbds.storages.db.scripts.ingest_metrics import start_metrics_server
+from sbds.storages.db.scripts.ingest_metrics import timed
 from sbds.utils import chunkify
 
 import sbds.sbds_logging
@@ -43,10 +73,8 @@ logger = structlog.get_logger(__name__)
 
 TOTAL_TASKS = 7
 
-STATEMENT_CACHE = {
-    'account': 'INSERT INTO sbds_meta_accounts (name) VALUES($1) ON CONFLICT DO NOTHING',
-    'block': 'INSERT INTO sbds_core_blocks (raw, block_num, previous, timestamp, witness, witness_signature, transaction_merkle_root) VALUES ($1, $2, $3, $4, $5, $6, $7) ON CONFLICT DO NOTHING'
-}
+# batches stored between merging their checkpoint ranges
+COMPACT_INTERVAL_BATCHES = 20
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 loop = asyncio.get_event_loop()
@@ -62,18 +90,6 @@ pbar_kwargs = dict(
     bar_template='%(bar)s  %(info)s')
 
 
-def get_op_insert_stmt(prepared_op, db_tables):
-    stmt = STATEMENT_CACHE.get('type')
-    if stmt:
-        return stmt
-    op_type = prepared_op['operation_type']
-    table = db_tables[op_db_table_for_type(op_type)]
-    values_str = ', '.join(
-        f'${i}' for i in range(1, len(prepared_op.keys()) + 1))
-    columns_str = ', '.join(f'"{k}"' for k in prepared_op.keys())
-    STATEMENT_CACHE[op_type] = f'INSERT INTO {table} ({columns_str}) VALUES({values_str}) ON CONFLICT DO NOTHING'
-    return STATEMENT_CACHE[op_type]
-
 def create_async_engine(database_url, loop=None, minsize=40, maxsize=50, **kwargs):
     sa_db_url = make_url(database_url)
     loop = loop or asyncio.get_event_loop()
@@ -91,10 +107,10 @@ def create_async_engine(database_url, loop=None, minsize=40, maxsize=50, **kwarg
 
 def create_asyncpg_pool(database_url,loop=None,min_size=40, max_size=40, **kwargs):
     loop = loop or asyncio.get_event_loop()
-    return loop.run_until_complete(asyncpg.create_pool(database_url,
-                                                       min_size=min_size,
-                                                       max_size=max_size,
-                                                       **kwargs))
+    return loop.run_until_complete(create_ingest_pool(database_url,
+                                                      min_size=min_size,
+                                                      max_size=max_size,
+                                                      **kwargs))
 
 
 def as_completed_limit_concurrent(coros_or_futures, concurrency_limit):
@@ -206,14 +222,6 @@ def missing_account_name_from_error(e):
     return e.detail.split('=')[1].split(')')[0].replace('(', '')  # hehe
 
 
-async def get_existing_and_missing_count(engine, start_block, end_block):
-    async with engine.acquire() as conn:
-        existing_count = await conn.fetchval('SELECT COUNT(*) from sbds_core_blocks WHERE block_num >=$1 AND block_num <= $2', start_block, end_block)
-    range_count = len(range(start_block, end_block+1))
-    missing_count = range_count - existing_count
-    return existing_count, missing_count, range_count
-
-
 async def get_latest_db_block_num(engine):
     async with engine.acquire() as conn:
         last_block_num = await conn.scalar('SELECT MAX(block_num) from sbds_core_blocks')
@@ -226,255 +234,247 @@ async def get_last_irreversible_block_num(url, client):
     return jsonrpc_response['result']['last_irreversible_block_num']
 
 
-async def collect_missing_block_nums(engine, last_chain_block, missing_count, start_block=None, pbar=None):
-    BLOCKNUM_CHUNK_SEARCH_SIZE = 10_000
-    start_block = start_block or 1
-    complete_block_nums = range(start_block, last_chain_block + 1)
+async def get_missing_block_nums_from_checkpoint(pool, start_block, end_block,
+                                                 rescan=False):
+    """Return existing, missing and range counts, and the missing block_nums
 
-    if missing_count == last_chain_block:
-        return complete_block_nums
-    missing_block_nums = set(complete_block_nums)
-    query = 'SELECT block_num from sbds_core_blocks WHERE block_num>=$1'
-
-    async with engine.acquire() as conn:
-        async with conn.transaction():
-            cursor = await conn.cursor(query,start_block)
-            while True:
-                rows = await cursor.fetch(BLOCKNUM_CHUNK_SEARCH_SIZE)
-                if not rows:
-                    break
-                missing_block_nums.difference_update(set(b[0] for b in rows))
-                if pbar:
-                    pbar.update(BLOCKNUM_CHUNK_SEARCH_SIZE)
-    pbar.update(len(missing_block_nums))
-    return missing_block_nums
+    The checkpoint is seeded from sbds_core_blocks if there isn't one, or if
+    rescan is set.
+    """
+    if rescan or await load_checkpoint(pool) is None:
+        checkpoint = await seed_checkpoint(pool)
+    else:
+        # merge ranges left by a run which stopped before compacting them
+        checkpoint = await compact_checkpoint(pool)
+    missing_ranges = uncovered_ranges(*checkpoint, start_block, end_block)
+    range_count = len(range(start_block, end_block + 1))
+    missing_count = count_blocks_in_ranges(missing_ranges)
+    return (range_count - missing_count, missing_count, range_count,
+            block_nums_in_ranges(missing_ranges))
 
 
 # --- Blocks ---
-async def fetch_blocks_and_ops_in_blocks(url, client, block_nums):
-    request_data = ','.join(
-        f'{{"id":{block_num},"jsonrpc":"2.0","method":"get_block","params":[{block_num}]}},{{"id":{block_num},"jsonrpc":"2.0","method":"get_ops_in_block","params":[{block_num},false]}}'
-        for block_num in block_nums)
-    request_json = f'[{request_data}]'.encode()
-    response = 'n/a'
-    while True:
-        try:
-            response = await client.post(url, data=request_json)
-            jsonrpc_response = await response.json()
-            response_pairs = funcy.partition(2,jsonrpc_response)
-            results = []
-            for get_block, get_ops in response_pairs:
-                assert get_block['id'] == get_ops['id']
-                results.append((get_block['id'],get_block['result'],get_ops['result']))
-            assert len(results) == len(block_nums)
-            return results
-        except Exception as e:
-            logger.exception('error fetching ops in block',
-                             e=e, response=response)
+COMMENT_PARENT_AUTHOR = op_class_for_type('comment')._row_columns.index('parent_author')
 
-async def local_fetch_blocks_and_ops_in_blocks(local_path, block_nums):
-    try:
-        results = []
-        for block_num in block_nums:
-            with aiofiles.open(f'{local_path}/{block_num}/block.json') as f:
-                raw_block = await f.read()
-            with aiofiles.open(f'{local_path}/{block_num}/ops.json') as f:
-               raw_ops = await f.read()
-            block = json.loads(raw_block)
-            ops = json.loads(raw_ops)
-            results.append((block_num,block,ops))
-        assert len(results) == len(block_nums)
-        return results
-    except Exception as e:
-            logger.exception('error ly localfetching block and/or ops in block',
-                             e=e, local_path=local_path)
 
-async def s3_fetch_blocks_and_ops_in_blocks(s3_url, s3_client, block_nums):
+def operation_rollup_key(prepared_op):
+    # rows start with block_num, transaction_num, operation_num, trx_id, timestamp
+    op_type, row = prepared_op
+    return op_type, operation_rollup_hour(row[4])
 
-    response = 'n/a'
-    while True:
-        try:
-            response = await client.post(url, data=request_json)
-            jsonrpc_response = await response.json()
-            response_pairs = funcy.partition(2,jsonrpc_response)
-            results = []
-            for get_block, get_ops in response_pairs:
-                assert get_block['id'] == get_ops['id']
-                results.append((get_block['id'],get_block['result'],get_ops['result']))
-            assert len(results) == len(block_nums)
-            return results
-        except Exception as e:
-            logger.exception('error fetching ops in block',
-                             e=e, response=response)
 
+def is_post(prepared_op):
+    op_type, row = prepared_op
+    return op_type == 'comment' and row[COMMENT_PARENT_AUTHOR] == ''
 
-async def safe_store_block_and_ops(pool, db_tables, prepared_block, prepared_ops):
-    """Atomic add block,operations, and virtual operations in block
 
+async def store_block_batch(pool, prepared_blocks, checkpoint_ranges,
+                            checkpoint=CHECKPOINT, reversible=()):
+    """Atomic add blocks, their operations, counters and checkpoint ranges
 
+    Rows are grouped by statement and sent with one executemany each. Only
+    the operations of blocks which weren't already stored are counted, in
+    sbds_meta_operation_counts and sbds_meta_operation_rollups, and notified
+    on the change feed.
 
     :param pool:
-    :param db_tables:
-    :param prepared_block:
-    :param prepared_ops:
+    :param prepared_blocks: [(prepared_block, prepared_ops)]
+    :param checkpoint_ranges: [(first_block, last_block)] the batch covers
+    :param checkpoint:
+    :param reversible: block_nums to record in sbds_meta_reversible_blocks
     :return:
     """
-
-    raw_add_account_stmt = STATEMENT_CACHE['account']
-    raw_stmts = [(STATEMENT_CACHE['block'], prepared_block.values())]
-
-    # collect all account names referenced in block and ops
-    account_names_in_ops = extract_account_names(prepared_ops)
-    account_names_in_ops.add(prepared_block['witness'])
-    account_name_records = [(a,) for a in account_names_in_ops ]
-
-    for prepared_op in prepared_ops:
-        raw_stmts.append((get_op_insert_stmt(prepared_op, db_tables), prepared_op.values()))
-
     async with pool.acquire() as conn:
-        prepared_stmts = [await conn.prepare(stmt) for stmt,_ in raw_stmts]
-        add_acct_stmt = await conn.prepare(raw_add_account_stmt)
+        blocks_stmt = await conn.blocks_statement()
+        blocks_raw_stmt = await conn.blocks_raw_statement()
+        block_columns = [
+            [prepared_block[c] for prepared_block, _ in prepared_blocks]
+            for c in BLOCK_COLUMNS]
+        stmts = dict()
+        for _, prepared_ops in prepared_blocks:
+            for op_type, row in prepared_ops:
+                op_stmt = await conn.op_statement(
+                    op_type, op_class_for_type(op_type)._row_columns)
+                stmts.setdefault(op_stmt, []).append(row)
+        count_stmt = await conn.operation_count_statement()
+        rollup_stmt = await conn.operation_rollup_statement()
+        checkpoint_stmt = await conn.checkpoint_statement()
+        reversible_stmt = await conn.reversible_statement()
+        notify_stmt = await conn.notify_statement()
 
-        stmts = zip(prepared_stmts, (vals for _,vals in raw_stmts))
         async with conn.transaction():
-            # add accounts first
-            await conn.executemany(raw_add_account_stmt, account_name_records)
-
-        async with conn.transaction():
-            # add block and ops
-            for i,stmt in enumerate(stmts):
-                query, args = stmt
-                while True:
-                    stmt_tr = conn.transaction()
-                    await stmt_tr.start()
-                    try:
-                        await query.fetchval(*args)
-                        await stmt_tr.commit()
-                        break
-                    except (asyncpg.exceptions.ForeignKeyViolationError) as e:
-                        await stmt_tr.rollback()
-                        if is_name_missing_from_accounts_error(e):
-                            missing_account_name = missing_account_name_from_error(
-                                e)
-                            stmt2_tr = conn.transaction()
-                            await stmt2_tr.start()
-                            await add_acct_stmt.fetchval(missing_account_name)
-                            await stmt2_tr.commit()
-                        else:
-                            if i == 0:
-                                prepared = prepared_block
-                            else:
-                                prepared = prepared_ops[i - 1]
-                            logger.exception('error storing block and ops',
-                                             e=e,
-                                             accts=account_names_in_ops,
-                                             prepared=prepared,
-                                             stmt=stmt)
-                            raise e
-                    except Exception as e:
-                        await stmt_tr.rollback()
-                        if i == 0:
-                            prepared = prepared_block
-                        else:
-                            prepared = prepared_ops[i - 1]
-                        logger.exception('error storing block and ops',
-                                         e=e,
-                                         accts=account_names_in_ops,
-                                         prepared=prepared,
-                                         stmt=stmt,
-                                         type=prepared.get('operation_type'))
-                        raise e
-
-async def store_block_and_ops(pool, db_tables, prepared_block, prepared_ops):
-    """Atomic add block,operations, and virtual operations in block
-
-
-
-    :param pool:
-    :param db_tables:
-    :param prepared_block:
-    :param prepared_ops:
-    :return:
+            # block rows first, ops reference them
+            inserted = set(row[0] for row in
+                           await conn.fetch(blocks_stmt, *block_columns))
+            raw_blocks = [(prepared_block['block_num'], prepared_block['raw'])
+                          for prepared_block, _ in prepared_blocks
+                          if prepared_block['block_num'] in inserted]
+            await conn.execute(blocks_raw_stmt,
+                               [block_num for block_num, _ in raw_blocks],
+                               [raw for _, raw in raw_blocks])
+            for query, rows in stmts.items():
+                await conn.executemany(query, rows)
+            await conn.executemany(checkpoint_stmt,
+                                   [(checkpoint, first_block, last_block)
+                                    for first_block, last_block in checkpoint_ranges])
+            await conn.executemany(reversible_stmt, [
+                (prepared_block['block_num'], prepared_block['block_id'],
+                 prepared_block['previous'])
+                for prepared_block, _ in prepared_blocks
+                if prepared_block['block_num'] in reversible])
+            new_ops = [op for prepared_block, prepared_ops in prepared_blocks
+                       if prepared_block['block_num'] in inserted
+                       for op in prepared_ops]
+            counts = funcy.count_by(
+                lambda op: (op[0], operation_count_bucket(op[1][0])), new_ops)
+            timed_ops = [op for op in new_ops if op[1][4] is not None]
+            rollups = funcy.count_by(operation_rollup_key, timed_ops)
+            rollups.update(funcy.count_by(
+                lambda op: (POST_ROLLUP, operation_rollup_hour(op[1][4])),
+                filter(is_post, timed_ops)))
+            # last and in key order, so concurrent batches hold the counter
+            # rows briefly and lock them in the same order
+            await conn.executemany(count_stmt,
+                                   [(op_type, bucket, count) for
+                                    (op_type, bucket), count in sorted(counts.items())])
+            await conn.executemany(rollup_stmt,
+                                   [(name, hour, count) for
+                                    (name, hour), count in sorted(rollups.items())])
+            if inserted:
+                # delivered to listeners when the batch commits
+                await conn.execute(notify_stmt, CHANGE_FEED_CHANNEL,
+                                   stored_payload(inserted, new_ops))
+
+
+async def prepare_block(raw_block, raw_ops):
+    raw_ops = raw_ops or []
+    with timed('prepare', blocks=1, ops=len(raw_ops)):
+        prepared_block = await prepare_raw_block_for_storage(raw_block, loop=loop)
+        # one generated row builder call per op, no intermediate dicts
+        prepared_ops = [prepare_raw_operation_row(raw_op) for raw_op in raw_ops]
+    return prepared_block, prepared_ops
+
+
+async def store_prepared_blocks(pool, block_num_batch, block_nums, prepared_blocks,
+                                checkpoint=CHECKPOINT, reversible=()):
+    """Store a batch in one transaction, or block by block if that fails
+
+    :return: the prepared blocks which were stored
     """
+    ops_count = sum(len(prepared_ops) for _, prepared_ops in prepared_blocks)
+    try:
+        with timed('store', blocks=len(prepared_blocks), ops=ops_count):
+            await store_block_batch(pool, prepared_blocks,
+                                    covered_ranges(block_num_batch, block_nums),
+                                    checkpoint=checkpoint,
+                                    reversible=reversible)
+        return prepared_blocks
+    except Exception as e:
+        logger.warning('error storing batch, storing its blocks separately',
+                       e=e, first_block=block_nums[0], last_block=block_nums[-1])
+    stored = []
+    for block_num, (prepared_block, prepared_ops) in zip(block_nums, prepared_blocks):
+        try:
+            with timed('store', blocks=1, ops=len(prepared_ops)):
+                await store_block_batch(pool, [(prepared_block, prepared_ops)],
+                                        [(block_num, block_num)],
+                                        checkpoint=checkpoint,
+                                        reversible=reversible)
+            stored.append((prepared_block, prepared_ops))
+        except Exception as e:
+            logger.exception('error storing block and ops',
+                             e=e,
+                             prepared=prepared_block,
+                             types=[op[0] for op in prepared_ops])
+    return stored
+
+
+async def process_block_chunk(block_num_batch, source, pool, db_tables, blocks_pbar=None,ops_pbar=None):
+    results = await source.fetch(block_num_batch)
+    if not results:
+        return
+    block_nums = [block_num for block_num, _, _ in results]
+    prepared_blocks = await asyncio.gather(*(
+        prepare_block(raw_block, raw_ops_in_block)
+        for _, raw_block, raw_ops_in_block in results))
+    stored = await store_prepared_blocks(pool, block_num_batch, block_nums,
+                                         prepared_blocks)
+    for prepared_block, prepared_ops in stored:
+        record_rows('sbds_core_blocks')
+        for table, op_rows in funcy.count_by(
+                lambda op: op_db_table_for_type(op[0]),
+                prepared_ops).items():
+            record_rows(table, op_rows)
+        if blocks_pbar is not None:
+            blocks_pbar.update()
+        if ops_pbar is not None:
+            ops_pbar.update(len(prepared_ops))
+
+
+async def process_blocks(missing_block_nums, source, pool, db_meta, blocks_pbar=None,ops_pbar=None):
+    db_tables = db_meta.tables
+    # in order, archives read ahead and streams can only be read forwards
+    block_num_batches = chunkify(sorted(missing_block_nums), source.batch_size)
+    futures = (process_block_chunk(block_num_batch, source, pool, db_tables,blocks_pbar=blocks_pbar, ops_pbar=ops_pbar) for block_num_batch in block_num_batches)
 
-    raw_add_account_stmt = STATEMENT_CACHE['account']
-    raw_stmts = [(STATEMENT_CACHE['block'], prepared_block.values())]
-
-    # collect all account names referenced in block and ops
-    #account_names_in_ops = extract_account_names(prepared_ops)
-    #account_names_in_ops.add(prepared_block['witness'])
-    #account_name_records = [(a,) for a in account_names_in_ops ]
-
-    for prepared_op in prepared_ops:
-        raw_stmts.append((get_op_insert_stmt(prepared_op, db_tables), prepared_op.values()))
-
-    async with pool.acquire() as conn:
-        prepared_stmts = [await conn.prepare(stmt) for stmt,_ in raw_stmts]
-        stmts = zip(prepared_stmts, (vals for _,vals in raw_stmts))
+    for i, results_future in enumerate(
+            as_completed_limit_concurrent(futures, source.concurrency), 1):
+        results = await results_future
+        # chunks in flight keep storing while their ranges are merged
+        if i % COMPACT_INTERVAL_BATCHES == 0:
+            await compact_checkpoint(pool)
+    await compact_checkpoint(pool)
 
-        async with conn.transaction():
-            #await conn.executemany(raw_add_account_stmt, account_name_records)
-            # add block and ops
-            for i,stmt in enumerate(stmts):
-                query, args = stmt
-                try:
-                    await query.fetchval(*args)
-                except Exception as e:
-                    if i == 0:
-                        prepared = prepared_block
-                    else:
-                        prepared = prepared_ops[i - 1]
-                    logger.exception('error storing block and ops',
-                                     e=e,
-                                     #accts=account_names_in_ops,
-                                     prepared=prepared,
-                                     stmt=stmt,
-                                     type=prepared.get('operation_type'))
-                    raise e
-
-
-
-async def process_block(block_num, raw_block, raw_ops, pool, db_tables, blocks_pbar=None, ops_pbar=None):
-    prepared_futures = [prepare_raw_block_for_storage(raw_block, loop=loop)]
-    if raw_ops:
-        prepared_futures.extend(prepare_raw_operation_for_storage(raw_op, loop=loop)
-                            for raw_op in raw_ops)
-    prepared = await asyncio.gather(*prepared_futures)
-    prepared_block = prepared[0]
-    if raw_ops:
-        prepared_ops = prepared[1:]
-    else:
-        prepared_ops = []
-    await store_block_and_ops(pool, db_tables, prepared_block, prepared_ops)
-    blocks_pbar.update()
-    if len(raw_ops) < 50:
-        ops_pbar.total = ops_pbar.total - (50 - len(raw_ops))
-    ops_pbar.update(len(raw_ops))
-    return (block_num, raw_block, prepared_block, raw_ops, prepared_ops)
-
-
-async def process_block_chunk(block_num_batch, url, client, engine, db_tables, blocks_pbar=None,ops_pbar=None):
-    results = await fetch_blocks_and_ops_in_blocks(url, client, block_num_batch)
-    block_futures = [process_block(
-            block_num,
-            raw_block,
-            raw_ops_in_block,
-            engine,
-            db_tables,
-            blocks_pbar=blocks_pbar,
-            ops_pbar=ops_pbar) for block_num, raw_block, raw_ops_in_block in results]
-    return await asyncio.wait(block_futures)
-
-async def process_blocks(missing_block_nums, url, client, pool, db_meta, blocks_pbar=None,ops_pbar=None):
-    CONCURRENCY_LIMIT = 5
-    BATCH_SIZE = 100
 
-    db_tables = db_meta.tables
-    block_num_batches = chunkify(missing_block_nums, BATCH_SIZE)
-    futures = (process_block_chunk(block_num_batch, url, client, pool, db_tables,blocks_pbar=blocks_pbar, ops_pbar=ops_pbar) for block_num_batch in block_num_batches)
+async def follow_head(source, pool, db_meta, start_block, interval=3):
+    """Store blocks up to the head block, rolling back reversible ones on forks
 
-    for results_future in as_completed_limit_concurrent(futures, CONCURRENCY_LIMIT):
-        results = await results_future
+    Every poll re-reads the chain from the lowest stored reversible block, so
+    a fork anywhere above the last irreversible block is found.
+    """
+    while True:
+        props = await source.dynamic_global_properties()
+        last_irreversible = props['last_irreversible_block_num']
+        head = props['head_block_number']
+
+        # irreversible blocks not stored yet, eg from while populate was stopped
+        _, _, _, missing_block_nums = await get_missing_block_nums_from_checkpoint(
+            pool, start_block, last_irreversible)
+        if missing_block_nums:
+            await process_blocks(missing_block_nums, source, pool, db_meta)
+
+        staged = await staged_block_ids(pool)
+        first_block = min(list(staged) + [last_irreversible + 1])
+        results = []
+        for block_num_batch in chunkify(range(first_block, head + 1),
+                                        source.batch_size):
+            results.extend(await source.fetch(block_num_batch))
+        # blocks steemd doesn't have yet are null
+        results = [r for r in results if r[1]]
+        chain_ids = {block_num: chain_block_id(block)
+                     for block_num, block, _ in results}
+
+        fork = fork_block_num(staged, chain_ids, head)
+        if fork is not None:
+            logger.warning('fork detected', block_num=fork,
+                           stored=staged[fork], chain=chain_ids.get(fork))
+            await rollback_blocks(pool, fork)
+            staged = {n: block_id for n, block_id in staged.items() if n < fork}
+        await promote_blocks(pool, last_irreversible)
+
+        new = [r for r in results if r[0] not in staged]
+        if new:
+            block_nums = [block_num for block_num, _, _ in new]
+            prepared_blocks = await asyncio.gather(*(
+                prepare_block(raw_block, raw_ops) for _, raw_block, raw_ops in new))
+            await store_prepared_blocks(
+                pool, block_nums, block_nums, prepared_blocks,
+                reversible=set(n for n in block_nums if n > last_irreversible))
+            await compact_checkpoint(pool)
+            logger.info('stored blocks near head', first_block=block_nums[0],
+                        last_block=block_nums[-1], head=head,
+                        last_irreversible=last_irreversible)
+        await asyncio.sleep(interval)
 
 
 # --- Operations ---
@@ -509,24 +509,85 @@ async def task_stream_blocks(engine, steemd_http_url, client):
     metavar='STEEMD_HTTP_URL',
     envvar='STEEMD_HTTP_URL',
     help='Steemd HTTP server URL')
+@click.option('--source', type=str, default=None,
+              help='Read blocks from fs://path, s3://bucket/prefix or stdin:// instead of --steemd_http_url')
+@click.option('--s3_endpoint_url', type=str, envvar='S3_ENDPOINT_URL',
+              default=None, help='S3 endpoint for s3:// sources')
 @click.option('--start_block',type=int, default=1)
 @click.option('--end_block',type=int, default=-1)
 @click.option('--accounts_file', type=click.Path(dir_okay=False,exists=True))
-def populate(database_url, legacy_database_url, steemd_http_url, start_block, end_block, accounts_file):
-    _populate(database_url, legacy_database_url, steemd_http_url, start_block, end_block, accounts_file)
-
-
-def _populate(database_url, legacy_database_url, steemd_http_url, start_block, end_block,accounts_file):
-    CONNECTOR = TCPConnector(loop=loop, limit=100)
-    AIOHTTP_SESSION = aiohttp.ClientSession(loop=loop,
-                                            connector=CONNECTOR,
-                                            json_serialize=json.dumps,
-                                            headers={'Content-Type': 'application/json'})
+@click.option('--stats_interval', type=int, default=10,
+              help='Seconds between ingest stats log lines, 0 disables them')
+@click.option('--metrics_port', type=int, default=None,
+              help='Serve ingest metrics at http://127.0.0.1:<port>/metrics')
+@click.option('--backfill', type=click.Choice(['plan', 'work']), default=None,
+              help='plan: record leases for the gaps between --start_block and --end_block, '
+                   'work: load leased ranges until every lease is done')
+@click.option('--lease_size', type=int, default=10_000,
+              help='Blocks per backfill lease')
+@click.option('--lease_ttl', type=int, default=120,
+              help='Seconds without a heartbeat before a lease is reclaimed')
+@click.option('--worker_id', type=str, default=None,
+              help='Backfill worker name, hostname:pid by default')
+@click.option('--rescan', is_flag=True,
+              help='Rebuild the ingest checkpoint from the stored blocks')
+@click.option('--reversible', is_flag=True,
+              help='Keep following the head block, storing reversible blocks and rolling them back on forks')
+def populate(database_url, legacy_database_url, steemd_http_url, source, s3_endpoint_url, start_block, end_block, accounts_file, stats_interval, metrics_port,
+             backfill, lease_size, lease_ttl, worker_id, rescan, reversible):
+    _populate(database_url, legacy_database_url, steemd_http_url, start_block, end_block, accounts_file,
+              stats_interval=stats_interval, metrics_port=metrics_port, source=source,
+              s3_endpoint_url=s3_endpoint_url, backfill=backfill,
+              lease_size=lease_size, lease_ttl=lease_ttl, worker_id=worker_id,
+              rescan=rescan, reversible=reversible)
+
+
+def _backfill_work(pool, block_source_, db_meta, lease_ttl, worker_id):
+    worker_id = worker_id or default_worker_id()
+    status = loop.run_until_complete(lease_status(pool))
+    # an upper bound, other workers load some of these
+    unfinished_count = sum(status.get(s, (0, 0))[1] for s in ('pending', 'leased'))
+    blocks_progress_bar = tqdm(total=unfinished_count,
+                               dynamic_ncols=False,
+                               unit=' blocks')
+    ops_progress_bar = tqdm(bar_format='{n_fmt} [{rate_fmt}{postfix}]',
+                            dynamic_ncols=False,
+                            unit='    ops')
+    process_range = partial(process_blocks,
+                            source=block_source_,
+                            pool=pool,
+                            db_meta=db_meta,
+                            blocks_pbar=blocks_progress_bar,
+                            ops_pbar=ops_progress_bar)
+    finished = loop.run_until_complete(
+        work_leases(pool, worker_id, process_range, lease_ttl=lease_ttl))
+    click.echo(fmt_success_message('%s finished %s leases', worker_id,
+                                   finished))
+
+
+def _populate(database_url, legacy_database_url, steemd_http_url, start_block, end_block,accounts_file,
+              stats_interval=10, metrics_port=None, source=None, s3_endpoint_url=None,
+              backfill=None, lease_size=10_000, lease_ttl=120, worker_id=None,
+              rescan=False, reversible=False):
     DB_META = task_load_db_meta(legacy_database_url)
+    try:
+        block_source_ = block_source(source or steemd_http_url,
+                                     s3_endpoint_url=s3_endpoint_url)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    if reversible and not isinstance(block_source_, SteemdSource):
+        raise click.BadParameter(
+            '--reversible needs a steemd --source, archives only have irreversible blocks')
+    stats_task = None
+    metrics_runner = None
 
     try:
+        if stats_interval:
+            stats_task = loop.create_task(report_ingest_stats(stats_interval))
+        if metrics_port:
+            metrics_runner = loop.run_until_complete(
+                start_metrics_server('127.0.0.1', metrics_port))
 
-        pool = create_asyncpg_pool(database_url)
         task_num = 0
         # [1/7] confirm db connectivity
         task_num += 1
@@ -545,6 +606,18 @@ def _populate(database_url, legacy_database_url, steemd_http_url, start_block, e
             task_num=task_num)
         click.echo(task_message)
         task_init_db_if_required(database_url=database_url)
+        # after init, so connections can prepare their INSERTs up front
+        pool = create_asyncpg_pool(database_url)
+
+        if backfill == 'work':
+            # the leases were planned by `--backfill plan`, which knows the
+            # range, workers only need the source
+            if accounts_file:
+                with open(accounts_file) as f:
+                    loop.run_until_complete(
+                        preload_account_names(pool, json.load(f)))
+            _backfill_work(pool, block_source_, DB_META, lease_ttl, worker_id)
+            return
 
         # [3/7] find last irreversible block
         task_num += 1
@@ -554,11 +627,12 @@ def _populate(database_url, legacy_database_url, steemd_http_url, start_block, e
             emoji_code_point='\U0001F50E',
             task_num=task_num)
             click.echo(task_message)
-            last_chain_block_num = loop.run_until_complete(
-                get_last_irreversible_block_num(steemd_http_url, AIOHTTP_SESSION))
-            end_block = last_chain_block_num
+            end_block = loop.run_until_complete(block_source_.head())
+            if end_block is None:
+                raise click.BadParameter(
+                    f'--end_block is required with --source {source}')
             success_msg = fmt_success_message(
-                'last irreversible block number is %s',last_chain_block_num )
+                'highest source block number is %s', end_block)
             click.echo(success_msg)
         else:
             task_message = fmt_task_message(
@@ -567,25 +641,25 @@ def _populate(database_url, legacy_database_url, steemd_http_url, start_block, e
                 task_num=task_num)
             click.echo(task_message)
 
+        if backfill == 'plan':
+            leases = loop.run_until_complete(
+                plan_leases(pool, start_block, end_block, lease_size=lease_size))
+            status = loop.run_until_complete(lease_status(pool))
+            click.echo(fmt_success_message(
+                'planned %s leases with missing blocks, leases by status: %s',
+                leases, status))
+            return
+
         # [4/7] build list of blocks missing from db
-        existing_count, missing_count, range_count = loop.run_until_complete(get_existing_and_missing_count(pool, start_block, end_block))
+        existing_count, missing_count, range_count, missing_block_nums = \
+            loop.run_until_complete(get_missing_block_nums_from_checkpoint(
+                pool, start_block, end_block, rescan=rescan))
         task_message = fmt_task_message(
             f'Building list of {missing_count} blocks missing from db between {start_block}<<-->>{end_block}' ,
             emoji_code_point=u'\U0001F52D',
             task_num=4)
         click.echo(task_message)
 
-
-        with click.progressbar(length=end_block, **pbar_kwargs) as pbar:
-            pbar.update(existing_count)
-            missing_block_nums = loop.run_until_complete(
-                collect_missing_block_nums(
-                    pool,
-                    end_block,
-                    missing_count,
-                    start_block=start_block,
-                    pbar=pbar))
-
         # [5.1/7] preload accounts file
         if accounts_file:
             task_message = fmt_task_message(
@@ -617,16 +691,14 @@ def _populate(database_url, legacy_database_url, steemd_http_url, start_block, e
                                    dynamic_ncols=False,
                                    unit=' blocks',
                                    )
-        ops_progress_bar = tqdm(initial=existing_count * 50,
-                                total=range_count * 50,
-                                bar_format='{bar}| [{rate_fmt}{postfix}]',
+        # the number of ops per block isn't known ahead of time, so only count them
+        ops_progress_bar = tqdm(bar_format='{n_fmt} [{rate_fmt}{postfix}]',
                                 ncols=48,
                                 dynamic_ncols=False,
                                 unit='    ops')
 
         loop.run_until_complete(process_blocks(missing_block_nums,
-                                             steemd_http_url,
-                                             AIOHTTP_SESSION,
+                                             block_source_,
                                              pool,
                                              DB_META,
                                              blocks_pbar=blocks_progress_bar,
@@ -639,37 +711,25 @@ def _populate(database_url, legacy_database_url, steemd_http_url, start_block, e
             task_num=6)
         click.echo(task_message)
 
-        existing_count, missing_count, range_count = loop.run_until_complete(
-            get_existing_and_missing_count(pool, start_block, end_block))
+        existing_count, missing_count, range_count, missing_block_nums = \
+            loop.run_until_complete(get_missing_block_nums_from_checkpoint(
+                pool, start_block, end_block))
         task_message = fmt_task_message(
             f'Building list of {missing_count} blocks missing from db between {start_block}<<-->>{end_block}',
             emoji_code_point=u'\U0001F52D',
             task_num=4)
         click.echo(task_message)
 
-        with click.progressbar(length=end_block, **pbar_kwargs) as pbar:
-            pbar.update(existing_count)
-            missing_block_nums = loop.run_until_complete(
-                collect_missing_block_nums(
-                    pool,
-                    end_block,
-                    missing_count,
-                    start_block=start_block,
-                    pbar=pbar))
-
-
         blocks_progress_bar = tqdm(initial=existing_count,
                                    total=range_count,
                                    dynamic_ncols=False,
                                    unit=' blocks',
                                    )
-        ops_progress_bar = tqdm(initial=existing_count * 50,
-                                total=range_count * 50,
+        ops_progress_bar = tqdm(bar_format='{n_fmt} [{rate_fmt}{postfix}]',
                                 dynamic_ncols=False,
                                 unit='    ops')
         loop.run_until_complete(process_blocks(missing_block_nums,
-                                               steemd_http_url,
-                                               AIOHTTP_SESSION,
+                                               block_source_,
                                                pool,
                                                DB_META,
                                                blocks_pbar=blocks_progress_bar,
@@ -682,12 +742,23 @@ def _populate(database_url, legacy_database_url, steemd_http_url, start_block, e
             'Streaming blocks', emoji_code_point=u'\U0001F4DD',
             task_num=7)
         click.echo(task_message)
+        if reversible:
+            loop.run_until_complete(
+                follow_head(block_source_, pool, DB_META, start_block))
 
     except KeyboardInterrupt:
         pass
+    except click.ClickException:
+        raise
     except Exception as e:
         logger.exception('ERROR')
         raise e
+    finally:
+        if stats_task:
+            stats_task.cancel()
+        if metrics_runner:
+            loop.run_until_complete(metrics_runner.cleanup())
+        loop.run_until_complete(block_source_.close())
 
 
 # included only for debugging with pdb, all the above code should be called
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Reversible blocks for `populate --reversible`
+
+    Blocks above the last irreversible block are stored like any other, and
+    their block_id and previous are recorded in sbds_meta_reversible_blocks
+    in the same transaction. Each poll compares the recorded ids with the
+    chain's, and if they differ every block from the first mismatch up is
+    rolled back: its operation, block, counter and checkpoint rows. Recorded
+    blocks at or below the last irreversible block are promoted by deleting
+    their record, their rows are final.
+
+    .. code-block:: python
+
+        staged = await staged_block_ids(pool)
+        fork = fork_block_num(staged, chain_ids, head_block_num)
+        if fork is not None:
+            await rollback_blocks(pool, fork)
+        await promote_blocks(pool, last_irreversible_block_num)
+"""
+import collections
+
+import structlog
+
+from sbds.sbds_json import loads
+from sbds.storages.db.change_feed import CHANNEL as CHANGE_FEED_CHANNEL
+from sbds.storages.db.change_feed import NOTIFY_SQL
+from sbds.storages.db.change_feed import rolled_back_payload
+from sbds.storages.db.scripts.ingest_checkpoints import CHECKPOINT
+from sbds.storages.db.scripts.ingest_checkpoints import CHECKPOINTS_TABLE
+from sbds.storages.db.scripts.ingest_checkpoints import CHECKPOINT_INSERT
+from sbds.storages.db.scripts.ingest_checkpoints import CHECKPOINT_UPDATE
+from sbds.storages.db.scripts.ingest_checkpoints import RANGES_TABLE
+from sbds.storages.db.scripts.ingest_checkpoints import RANGE_INSERT
+from sbds.storages.db.scripts.ingest_checkpoints import subtract_range
+from sbds.storages.db.tables.meta.operation_counts import OPERATION_COUNT_BUCKET_SIZE
+from sbds.storages.db.tables.meta.operation_counts import POST_ROLLUP
+from sbds.storages.db.tables.operations import combined_ops_class_map
+from sbds.storages.db.tables.operations import op_db_table_for_type
+
+logger = structlog.get_logger(__name__)
+
+REVERSIBLE_TABLE = 'sbds_meta_reversible_blocks'
+
+# block_num is an int4
+MAX_BLOCK_NUM = 2**31 - 1
+
+REVERSIBLE_INSERT = f'''
+INSERT INTO {REVERSIBLE_TABLE} (block_num, block_id, previous) VALUES ($1, $2, $3)
+ON CONFLICT (block_num) DO UPDATE SET
+    block_id = EXCLUDED.block_id, previous = EXCLUDED.previous'''
+
+COUNT_DECREMENT = '''
+UPDATE sbds_meta_operation_counts SET count = count - $3
+WHERE operation_type = $1 AND bucket = $2'''
+
+ROLLUP_DECREMENT = '''
+UPDATE sbds_meta_operation_rollups SET count = count - $3
+WHERE name = $1 AND hour = $2'''
+
+
+def op_rollback_sql(op_type):
+    """Delete op_type's rows from block_nums $1 to $2, returning their counts"""
+    table = op_db_table_for_type(op_type)
+    if op_type == 'comment':
+        returning = 'block_num, timestamp, parent_author'
+        posts = "COUNT(*) FILTER (WHERE parent_author = '')"
+    else:
+        returning = 'block_num, timestamp'
+        posts = '0'
+    return f'''
+        WITH deleted AS (
+            DELETE FROM {table} WHERE block_num BETWEEN $1 AND $2
+            RETURNING {returning})
+        SELECT block_num / {OPERATION_COUNT_BUCKET_SIZE} AS bucket,
+               date_trunc('hour', timestamp) AS hour,
+               COUNT(*) AS count, {posts} AS posts
+        FROM deleted GROUP BY 1, 2'''
+
+
+OP_ROLLBACK_SQL = {op_type: op_rollback_sql(op_type)
+                   for op_type in sorted(combined_ops_class_map)}
+
+
+def chain_block_id(block):
+    if not isinstance(block, dict):
+        block = loads(block)
+    return block.get('block_id')
+
+
+def fork_block_num(staged, chain_ids, head_block_num):
+    """Return the lowest staged block_num the chain no longer has, or None
+
+    :param staged: {block_num: block_id} of stored reversible blocks
+    :param chain_ids: {block_num: block_id} of the chain's blocks
+    """
+    for block_num in sorted(staged):
+        if block_num > head_block_num or \
+                chain_ids.get(block_num) != staged[block_num]:
+            return block_num
+    return None
+
+
+async def staged_block_ids(pool):
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            f'SELECT block_num, block_id FROM {REVERSIBLE_TABLE}')
+    return dict((row[0], row[1]) for row in rows)
+
+
+async def rollback_blocks(pool, first_block, last_block=MAX_BLOCK_NUM,
+                          checkpoint=CHECKPOINT):
+    """Delete blocks first_block to last_block with their rows, in one transaction
+
+    The blocks are removed from the checkpoint too, so populate loads them
+    again.
+
+    :return: the number of operations deleted
+    """
+    counts = collections.Counter()
+    rollups = collections.Counter()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            for op_type, sql in OP_ROLLBACK_SQL.items():
+                for bucket, hour, count, posts in await conn.fetch(
+                        sql, first_block, last_block):
+                    counts[(op_type, bucket)] += count
+                    if hour is not None:
+                        rollups[(op_type, hour)] += count
+                        if posts:
+                            rollups[(POST_ROLLUP, hour)] += posts
+            await conn.execute(
+                'DELETE FROM sbds_core_blocks WHERE block_num BETWEEN $1 AND $2',
+                first_block, last_block)
+            await conn.execute(
+                f'DELETE FROM {REVERSIBLE_TABLE} WHERE block_num BETWEEN $1 AND $2',
+                first_block, last_block)
+            await conn.executemany(COUNT_DECREMENT,
+                                   [(op_type, bucket, count) for
+                                    (op_type, bucket), count in sorted(counts.items())])
+            await conn.executemany(ROLLUP_DECREMENT,
+                                   [(name, hour, count) for
+                                    (name, hour), count in sorted(rollups.items())])
+            # the blocks are missing again
+            await conn.execute(CHECKPOINT_INSERT, checkpoint)
+            high_water = await conn.fetchval(
+                f'SELECT high_water FROM {CHECKPOINTS_TABLE} '
+                'WHERE name = $1 FOR UPDATE', checkpoint)
+            # locked, so a batch can't extend a range between it being read
+            # and deleted below
+            rows = [tuple(row) for row in await conn.fetch(
+                f'SELECT first_block, last_block FROM {RANGES_TABLE} '
+                'WHERE name = $1 FOR UPDATE', checkpoint)]
+            high_water, ranges = subtract_range(
+                high_water, rows, first_block, last_block)
+            # ranges inserted since they were read are left alone
+            await conn.execute(
+                f'DELETE FROM {RANGES_TABLE} '
+                'WHERE name = $1 AND first_block = ANY($2::int[])',
+                checkpoint, [f for f, _ in rows])
+            await conn.executemany(RANGE_INSERT,
+                                   [(checkpoint, f, l) for f, l in ranges])
+            await conn.execute(CHECKPOINT_UPDATE, checkpoint, high_water)
+            await conn.execute(NOTIFY_SQL, CHANGE_FEED_CHANNEL,
+                               rolled_back_payload(first_block, last_block))
+    ops_count = sum(counts.values())
+    logger.warning('rolled back blocks', first_block=first_block,
+                   last_block=last_block, ops=ops_count)
+    return ops_count
+
+
+async def promote_blocks(pool, last_irreversible_block_num):
+    """Forget the reversible blocks which have become irreversible"""
+    async with pool.acquire() as conn:
+        await conn.execute(
+            f'DELETE FROM {REVERSIBLE_TABLE} WHERE block_num <= $1',
+            last_irreversible_block_num)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Chain integrity checks for `sbds db verify`
+
+    Streams block_num, block_id, previous and the number of operations in
+    each block's raw JSON through a server-side cursor, and checks a chunk of
+    blocks at a time:
+
+    - block_nums are contiguous
+    - previous names the block before it, by block_id where both are
+      stored, otherwise by the block_num in its first 8 hex digits
+    - the operations stored for a block are as many as its raw JSON has
+
+    Bad blocks are reported as ranges, which `rollback_blocks` deletes so
+    populate loads them again.
+
+    .. code-block:: python
+
+        async for problem, first_block, last_block in verify_blocks(pool, 1, end_block):
+            await rollback_blocks(pool, first_block, last_block)
+"""
+import itertools as it
+
+import structlog
+
+from sbds.storages.db.tables.async_core import NULL_BLOCK_ID
+from sbds.storages.db.tables.operations import op_class_map
+from sbds.storages.db.tables.operations import op_db_table_for_type
+
+logger = structlog.get_logger(__name__)
+
+MISSING = 'missing'
+PREVIOUS = 'previous'
+OPERATIONS = 'operations'
+
+# operations are counted by postgres, the raw JSON never leaves the server.
+# get_block returns [type, value] pairs, or {"type": "<type>_operation"}
+# objects from appbase nodes
+BLOCKS_SQL = '''
+SELECT b.block_num, b.block_id, b.previous,
+       CASE WHEN r.raw IS NULL THEN NULL ELSE (
+           SELECT COUNT(*)
+           FROM json_array_elements(r.raw::json->'transactions') AS t,
+                json_array_elements(t->'operations') AS o
+           WHERE COALESCE(o->>0, regexp_replace(o->>'type', '_operation$', ''))
+                 = ANY($3::text[]))
+       END
+FROM sbds_core_blocks AS b
+LEFT JOIN sbds_core_blocks_raw AS r ON r.block_num = b.block_num
+WHERE b.block_num BETWEEN $1 AND $2
+ORDER BY b.block_num'''
+
+# virtual operations aren't in the raw JSON, so they aren't counted
+STORED_OPERATIONS_SQL = '''
+SELECT block_num, SUM(count)::int FROM ({}) AS c GROUP BY block_num'''.format(
+    ' UNION ALL '.join(
+        f'SELECT block_num, COUNT(*) AS count FROM {op_db_table_for_type(op_type)} '
+        'WHERE block_num BETWEEN $1 AND $2 GROUP BY block_num'
+        for op_type in sorted(op_class_map)))
+
+
+def block_ranges(block_nums):
+    """Return sorted block_nums as (first_block, last_block) runs"""
+    return [(group[0][1], group[-1][1]) for group in (
+        list(g) for _, g in it.groupby(enumerate(sorted(set(block_nums))),
+                                       lambda x: x[1] - x[0]))]
+
+
+def previous_block_num(previous):
+    return int(previous[:8], base=16)
+
+
+def check_blocks(rows, stored_ops, before=None):
+    """Return {problem: [(first_block, last_block)]} for a chunk of blocks
+
+    :param rows: (block_num, block_id, previous, raw_ops) in block_num order
+    :param stored_ops: {block_num: stored operations}
+    :param before: the row before the chunk, if any
+    """
+    if not rows:
+        return {}
+    block_nums = [row[0] for row in rows]
+    block_ids = [row[1] for row in rows]
+    previous = [row[2] for row in rows]
+    raw_ops = [row[3] for row in rows]
+    if before is not None:
+        prior_nums = [before[0]] + block_nums[:-1]
+        prior_ids = [before[1]] + block_ids[:-1]
+    else:
+        prior_nums = [block_nums[0] - 1] + block_nums[:-1]
+        prior_ids = [None] + block_ids[:-1]
+
+    missing = [(prior + 1, n - 1) for n, prior in zip(block_nums, prior_nums)
+               if n - prior > 1]
+    bad_previous = [n for n, p in zip(block_nums, previous)
+                    if previous_block_num(p) != n - 1]
+    # a mismatched id could be either block's fault
+    bad_links = [(n - 1, n) for n, prior, p, prior_id in
+                 zip(block_nums, prior_nums, previous, prior_ids)
+                 if n - prior == 1 and prior_id and prior_id != NULL_BLOCK_ID
+                 and p != prior_id]
+    bad_ops = [n for n, count in zip(block_nums, raw_ops)
+               if count is not None and count != stored_ops.get(n, 0)]
+
+    problems = {
+        MISSING: missing,
+        PREVIOUS: block_ranges(
+            bad_previous + list(it.chain.from_iterable(bad_links))),
+        OPERATIONS: block_ranges(bad_ops)
+    }
+    return {problem: ranges for problem, ranges in problems.items() if ranges}
+
+
+def extend_pending(pending, problem, ranges):
+    """Add the ranges of bad blocks to the open range of their problem
+
+    :return: the ranges which can't grow any more
+    """
+    finished = []
+    for first_block, last_block in ranges:
+        bad = pending.get(problem)
+        if bad and first_block <= bad[1] + 1:
+            bad[1] = max(bad[1], last_block)
+            continue
+        if bad:
+            finished.append((problem, *bad))
+        pending[problem] = [first_block, last_block]
+    return finished
+
+
+async def verify_blocks(pool, start_block, end_block, chunk_size=100_000):
+    """Yield (problem, first_block, last_block) for the bad blocks
+
+    Adjacent bad blocks with the same problem are merged across chunks.
+    """
+    op_types = sorted(op_class_map)
+    pending = dict()
+    before = (start_block - 1, None, None, None)
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            cursor = await conn.cursor(BLOCKS_SQL, start_block, end_block,
+                                       op_types)
+            while True:
+                rows = await cursor.fetch(chunk_size)
+                if not rows:
+                    break
+                stored_ops = dict(await conn.fetch(
+                    STORED_OPERATIONS_SQL, rows[0][0], rows[-1][0]))
+                problems = check_blocks(rows, stored_ops, before=before)
+                before = rows[-1]
+                logger.debug('verified blocks', first_block=rows[0][0],
+                             last_block=rows[-1][0], problems=len(problems))
+                for problem, ranges in sorted(problems.items()):
+                    for bad in extend_pending(pending, problem, ranges):
+                        yield bad
+    if before[0] < end_block:
+        # blocks after the last stored one
+        for bad in extend_pending(pending, MISSING,
+                                  [(before[0] + 1, end_block)]):
+            yield bad
+    for problem, bad in sorted(pending.items()):
+        yield (problem, *bad)
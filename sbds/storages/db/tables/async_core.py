@@ -17,6 +17,8 @@ asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 LOOP = asyncio.get_event_loop()
 EXECUTOR = concurrent.futures.ThreadPoolExecutor()
 
+NULL_BLOCK_ID = '0' * 40
+
 async def prepare_raw_blocks_for_storage(raw_block, loop=None, executor=EXECUTOR):
     pass
 
@@ -29,7 +31,9 @@ async def prepare_raw_block_for_storage(raw_block, loop=None, executor=EXECUTOR)
         timestamp=block_dict['timestamp'],
         witness=block_dict['witness'],
         witness_signature=block_dict['witness_signature'],
-        transaction_merkle_root=block_dict['transaction_merkle_root'])
+        transaction_merkle_root=block_dict['transaction_merkle_root'],
+        # only steemd's get_block includes the block's own id
+        block_id=block_dict.get('block_id') or NULL_BLOCK_ID)
 
 
 async def load_raw_block(raw_block, loop=None, executor=EXECUTOR):
@@ -116,5 +120,15 @@ async def prepare_raw_operation_for_storage(raw_operation, loop=None, executor=E
     return op_dict
 
 
+def prepare_raw_operation_row(raw_operation):
+    """Return (operation_type, row) for an op from get_ops_in_block
+
+    The row is built by the op class's generated `_build_row`, in the order
+    of its `_row_columns`.
+    """
+    op_type = raw_operation['op'][0]
+    return op_type, op_class_for_type(op_type)._build_row(raw_operation)
+
+
 def prepare_op_class_fields(op_dict_data, fields):
     return {k: v(op_dict_data) for k, v in fields.items()}
@@ -11,6 +11,7 @@ from sqlalchemy import String
 from sqlalchemy import UnicodeText
 from sqlalchemy import ForeignKey
 from sqlalchemy import func
+from sqlalchemy.orm import relationship
 
 from toolz import dissoc
 
@@ -20,6 +21,24 @@ from sbds.storages.db.tables.core import prepare_raw_block
 from sbds.storages.db.utils import UniqueMixin
 
 
+class BlockRaw(Base):
+    """A block's JSON, kept out of sbds_core_blocks so scans of it stay narrow
+
+    Postgres compresses values this size when it TOASTs them.
+    """
+    __tablename__ = 'sbds_core_blocks_raw'
+
+    block_num = Column(
+        Integer,
+        ForeignKey('sbds_core_blocks.block_num', ondelete='CASCADE'),
+        primary_key=True,
+        autoincrement=False)
+    raw = Column(UnicodeText(), nullable=False)
+
+    def __repr__(self):
+        return "<BlockRaw(block_num='%s')>" % self.block_num
+
+
 class Block(Base, UniqueMixin):
     """Steem Block class
 
@@ -150,7 +169,6 @@ class Block(Base, UniqueMixin):
     # pylint: enable=line-too-long
     __tablename__ = 'sbds_core_blocks'
 
-    raw = Column(UnicodeText())
     block_num = Column(
         Integer, primary_key=True, autoincrement=False)
     block_id = Column(String(40), default='0000000000000000000000000000000000000000')
@@ -161,19 +179,31 @@ class Block(Base, UniqueMixin):
     witness_signature = Column(String(150))
     transaction_merkle_root = Column(String(40))
 
+    # loaded on first access
+    _raw = relationship(BlockRaw, uselist=False, lazy='select',
+                        cascade='all, delete-orphan', passive_deletes=True)
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            return None
+        return self._raw.raw
+
+    @raw.setter
+    def raw(self, value):
+        self._raw = None if value is None else BlockRaw(raw=value)
 
     def __repr__(self):
         return "<Block(block_num='%s', timestamp='%s')>" % (self.block_num,
                                                             self.timestamp)
 
     def dump(self):
-        return dissoc(self.__dict__, '_sa_instance_state')
+        return dissoc(self.__dict__, '_sa_instance_state', '_raw')
 
     def to_dict(self, include_raw=False):
         data = self.dump()
-        if not include_raw:
-            return dissoc(data, 'raw')
-
+        if include_raw:
+            data['raw'] = self.raw
         return data
 
     def to_json(self):
@@ -1,4 +1,10 @@
 from .accounts import Account
+from .backfill import BackfillLease
+from .checkpoints import IngestCheckpoint
+from .checkpoints import IngestCheckpointRange
+from .operation_counts import OperationCount
+from .operation_counts import OperationRollup
+from .reversible import ReversibleBlock
 
 
 
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Integer
+from sqlalchemy import SmallInteger
+from sqlalchemy import String
+
+from sbds.storages.db.tables import Base
+
+
+class BackfillLease(Base):
+    """A range of block_nums claimed by one `populate --backfill work` worker
+
+    Leases are planned from the gaps in sbds_core_blocks, aligned to
+    multiples of the lease size so replanning never creates overlapping
+    leases. A leased range whose heartbeat is older than the lease ttl is
+    claimable again.
+
+    status is one of pending, leased, done or failed
+    """
+
+    __tablename__ = 'sbds_meta_backfill_leases'
+
+    first_block = Column(Integer, primary_key=True, autoincrement=False)
+    last_block = Column(Integer, nullable=False)
+    status = Column(String(8), nullable=False, default='pending', index=True)
+    worker = Column(String(128))
+    attempts = Column(SmallInteger, nullable=False, default=0)
+    leased_at = Column(DateTime(timezone=False))
+    heartbeat_at = Column(DateTime(timezone=False))
+    done_at = Column(DateTime(timezone=False))
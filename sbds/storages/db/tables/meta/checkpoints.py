@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Integer
+from sqlalchemy import String
+
+from sbds.storages.db.tables import Base
+
+
+class IngestCheckpoint(Base):
+    """populate's progress: every block_num <= high_water is stored"""
+
+    __tablename__ = 'sbds_meta_ingest_checkpoints'
+
+    name = Column(String(64), primary_key=True)
+    high_water = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=False))
+
+
+class IngestCheckpointRange(Base):
+    """A range of stored block_nums above a checkpoint's high_water
+
+    A range is inserted in the same transaction as the batch of blocks it
+    covers, and ranges are merged into high_water once the blocks below them
+    are stored.
+    """
+
+    __tablename__ = 'sbds_meta_ingest_checkpoint_ranges'
+
+    name = Column(String(64), primary_key=True)
+    first_block = Column(Integer, primary_key=True, autoincrement=False)
+    last_block = Column(Integer, nullable=False)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import BigInteger
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Integer
+from sqlalchemy import String
+
+from sbds.storages.db.tables import Base
+
+# blocks per bucket, bucket n counts ops in blocks n * size to (n + 1) * size - 1
+OPERATION_COUNT_BUCKET_SIZE = 10_000
+
+
+def operation_count_bucket(block_num):
+    return block_num // OPERATION_COUNT_BUCKET_SIZE
+
+
+class OperationCount(Base):
+    """The number of operations of one type stored in a bucket of blocks
+
+    Incremented by populate in the same transaction as the operations, so
+    counting a type never reads its operation table.
+    """
+
+    __tablename__ = 'sbds_meta_operation_counts'
+
+    operation_type = Column(String(50), primary_key=True)
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(BigInteger, nullable=False, default=0)
+
+
+# rollup names besides operation types, comments without a parent are posts
+POST_ROLLUP = 'post'
+
+
+def operation_rollup_hour(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+class OperationRollup(Base):
+    """The number of operations of one type in an hour, by block timestamp
+
+    name is an operation type, or `POST_ROLLUP` for the comments which are
+    posts. Maintained by populate like `OperationCount`.
+    """
+
+    __tablename__ = 'sbds_meta_operation_rollups'
+
+    name = Column(String(50), primary_key=True)
+    hour = Column(DateTime(timezone=False), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
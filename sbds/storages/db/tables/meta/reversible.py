@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import String
+
+from sbds.storages.db.tables import Base
+
+
+class ReversibleBlock(Base):
+    """A stored block above the last irreversible block
+
+    Its block and operation rows are rolled back if the chain forks below
+    it, and this row is deleted once it becomes irreversible.
+    """
+
+    __tablename__ = 'sbds_meta_reversible_blocks'
+
+    block_num = Column(Integer, primary_key=True, autoincrement=False)
+    block_id = Column(String(40), nullable=False)
+    previous = Column(String(50), nullable=False)
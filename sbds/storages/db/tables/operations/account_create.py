@@ -25,7 +25,9 @@ from ...enums import operation_types_enum
 from ...field_handlers import json_string_field
 from ...field_handlers import amount_field
 from ...field_handlers import amount_symbol_field
+from ...field_handlers import asset_field
 from ...field_handlers import comment_body_field
+from ...field_handlers import datetime_field
 
 
 class AccountCreateOperation(Base):
@@ -100,7 +102,7 @@ class AccountCreateOperation(Base):
 
 
     _fields = dict(
-        fee=lambda x: amount_field(x.get('fee'), num_func=float), # steem_type:asset
+        fee=lambda x: amount_field(x.get('fee')), # steem_type:asset
         fee_symbol=lambda x: amount_symbol_field(x.get('fee')), # steem_type:asset
         owner=lambda x:json_string_field(x.get('owner')), # steem_type:authority
         active=lambda x: json_string_field(x.get('active')), # name:active
@@ -111,6 +113,29 @@ class AccountCreateOperation(Base):
 
     _account_fields = frozenset(['creator','new_account_name',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'fee', 'fee_symbol', 'creator', 'new_account_name', 'owner', 'active', 'posting', 'memo_key', 'json_metadata', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            *asset_field(x.get('fee')),
+            x.get('creator'),
+            x.get('new_account_name'),
+            json_string_field(x.get('owner')),
+            json_string_field(x.get('active')),
+            json_string_field(x.get('posting')),
+            x.get('memo_key'),
+            json_string_field(x.get('json_metadata')),
+            'account_create',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
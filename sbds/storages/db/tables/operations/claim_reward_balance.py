@@ -25,7 +25,9 @@ from ...enums import operation_types_enum
 from ...field_handlers import json_string_field
 from ...field_handlers import amount_field
 from ...field_handlers import amount_symbol_field
+from ...field_handlers import asset_field
 from ...field_handlers import comment_body_field
+from ...field_handlers import datetime_field
 
 
 class ClaimRewardBalanceOperation(Base):
@@ -65,17 +67,36 @@ class ClaimRewardBalanceOperation(Base):
 
 
     _fields = dict(
-        reward_steem=lambda x: amount_field(x.get('reward_steem'), num_func=float), # steem_type:asset
+        reward_steem=lambda x: amount_field(x.get('reward_steem')), # steem_type:asset
         reward_steem_symbol=lambda x: amount_symbol_field(x.get('reward_steem')), # steem_type:asset
-        reward_sbd=lambda x: amount_field(x.get('reward_sbd'), num_func=float), # steem_type:asset
+        reward_sbd=lambda x: amount_field(x.get('reward_sbd')), # steem_type:asset
         reward_sbd_symbol=lambda x: amount_symbol_field(x.get('reward_sbd')), # steem_type:asset
-        reward_vests=lambda x: amount_field(x.get('reward_vests'), num_func=float), # steem_type:asset
+        reward_vests=lambda x: amount_field(x.get('reward_vests')), # steem_type:asset
         reward_vests_symbol=lambda x: amount_symbol_field(x.get('reward_vests')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['account',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'account', 'reward_steem', 'reward_steem_symbol', 'reward_sbd', 'reward_sbd_symbol', 'reward_vests', 'reward_vests_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('account'),
+            *asset_field(x.get('reward_steem')),
+            *asset_field(x.get('reward_sbd')),
+            *asset_field(x.get('reward_vests')),
+            'claim_reward_balance',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
@@ -25,7 +25,9 @@ from ...enums import operation_types_enum
 from ...field_handlers import json_string_field
 from ...field_handlers import amount_field
 from ...field_handlers import amount_symbol_field
+from ...field_handlers import asset_field
 from ...field_handlers import comment_body_field
+from ...field_handlers import datetime_field
 
 
 class CommentOptionsOperation(Base):
@@ -69,7 +71,7 @@ class CommentOptionsOperation(Base):
 
 
     _fields = dict(
-        max_accepted_payout=lambda x: amount_field(x.get('max_accepted_payout'), num_func=float), # steem_type:asset
+        max_accepted_payout=lambda x: amount_field(x.get('max_accepted_payout')), # steem_type:asset
         max_accepted_payout_symbol=lambda x: amount_symbol_field(x.get('max_accepted_payout')), # steem_type:asset
         extensions=lambda x:json_string_field(x.get('extensions')), # steem_type:steemit::protocol::comment_options_extensions_type
         
@@ -77,6 +79,28 @@ class CommentOptionsOperation(Base):
 
     _account_fields = frozenset(['author',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'author', 'permlink', 'max_accepted_payout', 'max_accepted_payout_symbol', 'percent_steem_dollars', 'allow_votes', 'allow_curation_rewards', 'extensions', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('author'),
+            x.get('permlink'),
+            *asset_field(x.get('max_accepted_payout')),
+            x.get('percent_steem_dollars'),
+            x.get('allow_votes'),
+            x.get('allow_curation_rewards'),
+            json_string_field(x.get('extensions')),
+            'comment_options',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
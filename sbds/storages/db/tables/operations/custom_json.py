@@ -25,7 +25,9 @@ from ...enums import operation_types_enum
 from ...field_handlers import json_string_field
 from ...field_handlers import amount_field
 from ...field_handlers import amount_symbol_field
+from ...field_handlers import asset_field
 from ...field_handlers import comment_body_field
+from ...field_handlers import datetime_field
 
 
 class CustomJsonOperation(Base):
@@ -70,6 +72,25 @@ class CustomJsonOperation(Base):
 
     _account_fields = frozenset([])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'required_auths', 'required_posting_auths', 'id', 'json', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            json_string_field(x.get('required_auths')),
+            json_string_field(x.get('required_posting_auths')),
+            x.get('id'),
+            json_string_field(x.get('json')),
+            'custom_json',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
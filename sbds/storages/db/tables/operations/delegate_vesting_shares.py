@@ -25,7 +25,9 @@ from ...enums import operation_types_enum
 from ...field_handlers import json_string_field
 from ...field_handlers import amount_field
 from ...field_handlers import amount_symbol_field
+from ...field_handlers import asset_field
 from ...field_handlers import comment_body_field
+from ...field_handlers import datetime_field
 
 
 class DelegateVestingSharesOperation(Base):
@@ -63,13 +65,31 @@ class DelegateVestingSharesOperation(Base):
 
 
     _fields = dict(
-        vesting_shares=lambda x: amount_field(x.get('vesting_shares'), num_func=float), # steem_type:asset
+        vesting_shares=lambda x: amount_field(x.get('vesting_shares')), # steem_type:asset
         vesting_shares_symbol=lambda x: amount_symbol_field(x.get('vesting_shares')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['delegator','delegatee',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'delegator', 'delegatee', 'vesting_shares', 'vesting_shares_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('delegator'),
+            x.get('delegatee'),
+            *asset_field(x.get('vesting_shares')),
+            'delegate_vesting_shares',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
@@ -25,7 +25,9 @@ from ...enums import operation_types_enum
 from ...field_handlers import json_string_field
 from ...field_handlers import amount_field
 from ...field_handlers import amount_symbol_field
+from ...field_handlers import asset_field
 from ...field_handlers import comment_body_field
+from ...field_handlers import datetime_field
 
 
 class EscrowReleaseOperation(Base):
@@ -80,15 +82,38 @@ class EscrowReleaseOperation(Base):
 
 
     _fields = dict(
-        sbd_amount=lambda x: amount_field(x.get('sbd_amount'), num_func=float), # steem_type:asset
+        sbd_amount=lambda x: amount_field(x.get('sbd_amount')), # steem_type:asset
         sbd_amount_symbol=lambda x: amount_symbol_field(x.get('sbd_amount')), # steem_type:asset
-        steem_amount=lambda x: amount_field(x.get('steem_amount'), num_func=float), # steem_type:asset
+        steem_amount=lambda x: amount_field(x.get('steem_amount')), # steem_type:asset
         steem_amount_symbol=lambda x: amount_symbol_field(x.get('steem_amount')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['from','to','agent','who','receiver',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'from', 'to', 'agent', 'who', 'receiver', 'escrow_id', 'sbd_amount', 'sbd_amount_symbol', 'steem_amount', 'steem_amount_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('from'),
+            x.get('to'),
+            x.get('agent'),
+            x.get('who'),
+            x.get('receiver'),
+            x.get('escrow_id'),
+            *asset_field(x.get('sbd_amount')),
+            *asset_field(x.get('steem_amount')),
+            'escrow_release',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
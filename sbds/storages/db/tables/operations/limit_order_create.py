@@ -25,7 +25,9 @@ from ...enums import operation_types_enum
 from ...field_handlers import json_string_field
 from ...field_handlers import amount_field
 from ...field_handlers import amount_symbol_field
+from ...field_handlers import asset_field
 from ...field_handlers import comment_body_field
+from ...field_handlers import datetime_field
 
 
 class LimitOrderCreateOperation(Base):
@@ -68,9 +70,9 @@ class LimitOrderCreateOperation(Base):
 
 
     _fields = dict(
-        amount_to_sell=lambda x: amount_field(x.get('amount_to_sell'), num_func=float), # steem_type:asset
+        amount_to_sell=lambda x: amount_field(x.get('amount_to_sell')), # steem_type:asset
         amount_to_sell_symbol=lambda x: amount_symbol_field(x.get('amount_to_sell')), # steem_type:asset
-        min_to_receive=lambda x: amount_field(x.get('min_to_receive'), num_func=float), # steem_type:asset
+        min_to_receive=lambda x: amount_field(x.get('min_to_receive')), # steem_type:asset
         min_to_receive_symbol=lambda x: amount_symbol_field(x.get('min_to_receive')), # steem_type:asset
         expiration=lambda x: dateutil.parser.parse(x.get('expiration')), # steem_type:time_point_sec
         
@@ -78,6 +80,27 @@ class LimitOrderCreateOperation(Base):
 
     _account_fields = frozenset(['owner',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'owner', 'orderid', 'amount_to_sell', 'amount_to_sell_symbol', 'min_to_receive', 'min_to_receive_symbol', 'fill_or_kill', 'expiration', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('owner'),
+            x.get('orderid'),
+            *asset_field(x.get('amount_to_sell')),
+            *asset_field(x.get('min_to_receive')),
+            x.get('fill_or_kill'),
+            dateutil.parser.parse(x.get('expiration')),
+            'limit_order_create',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
@@ -25,7 +25,9 @@ from ...enums import operation_types_enum
 from ...field_handlers import json_string_field
 from ...field_handlers import amount_field
 from ...field_handlers import amount_symbol_field
+from ...field_handlers import asset_field
 from ...field_handlers import comment_body_field
+from ...field_handlers import datetime_field
 
 
 class TransferFromSavingsOperation(Base):
@@ -67,13 +69,33 @@ class TransferFromSavingsOperation(Base):
 
 
     _fields = dict(
-        amount=lambda x: amount_field(x.get('amount'), num_func=float), # steem_type:asset
+        amount=lambda x: amount_field(x.get('amount')), # steem_type:asset
         amount_symbol=lambda x: amount_symbol_field(x.get('amount')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['from','to',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'from', 'request_id', 'to', 'amount', 'amount_symbol', 'memo', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('from'),
+            x.get('request_id'),
+            x.get('to'),
+            *asset_field(x.get('amount')),
+            x.get('memo'),
+            'transfer_from_savings',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
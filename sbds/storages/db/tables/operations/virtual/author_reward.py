@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class AuthorRewardVirtualOperation(Base):
@@ -35,6 +37,21 @@ class AuthorRewardVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+        struct author_reward_operation : public virtual_operation {
+          author_reward_operation(){}
+          author_reward_operation( const account_name_type& a, const string& INFLECTOR, const asset& s, const asset& st, const asset& v )
+             :author(a), permlink(INFLECTOR), sbd_payout(s), steem_payout(st), vesting_payout(v){}
+
+          account_name_type author;
+          string            permlink;
+          asset             sbd_payout;
+          asset             steem_payout;
+          asset             vesting_payout;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_author_rewards'
@@ -62,17 +79,37 @@ class AuthorRewardVirtualOperation(Base):
 
 
     _fields = dict(
-        sbd_payout=lambda x: amount_field(x.get('sbd_payout'), num_func=float), # steem_type:asset
+        sbd_payout=lambda x: amount_field(x.get('sbd_payout')), # steem_type:asset
         sbd_payout_symbol=lambda x: amount_symbol_field(x.get('sbd_payout')), # steem_type:asset
-        steem_payout=lambda x: amount_field(x.get('steem_payout'), num_func=float), # steem_type:asset
+        steem_payout=lambda x: amount_field(x.get('steem_payout')), # steem_type:asset
         steem_payout_symbol=lambda x: amount_symbol_field(x.get('steem_payout')), # steem_type:asset
-        vesting_payout=lambda x: amount_field(x.get('vesting_payout'), num_func=float), # steem_type:asset
+        vesting_payout=lambda x: amount_field(x.get('vesting_payout')), # steem_type:asset
         vesting_payout_symbol=lambda x: amount_symbol_field(x.get('vesting_payout')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['author',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'author', 'permlink', 'sbd_payout', 'sbd_payout_symbol', 'steem_payout', 'steem_payout_symbol', 'vesting_payout', 'vesting_payout_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('author'),
+            x.get('permlink'),
+            *asset_field(x.get('sbd_payout')),
+            *asset_field(x.get('steem_payout')),
+            *asset_field(x.get('vesting_payout')),
+            'author_reward',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
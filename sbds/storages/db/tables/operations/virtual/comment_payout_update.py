@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class CommentPayoutUpdateVirtualOperation(Base):
@@ -35,6 +37,18 @@ class CommentPayoutUpdateVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+        struct comment_payout_update_operation : public virtual_operation
+       {
+          comment_payout_update_operation() {}
+          comment_payout_update_operation( const account_name_type& a, const string& INFLECTOR ) : author( a ), permlink( INFLECTOR ) {}
+
+          account_name_type author;
+          string            permlink;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_comment_payout_updates'
@@ -61,6 +75,23 @@ class CommentPayoutUpdateVirtualOperation(Base):
 
     _account_fields = frozenset(['author',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'author', 'permlink', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('author'),
+            x.get('permlink'),
+            'comment_payout_update',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
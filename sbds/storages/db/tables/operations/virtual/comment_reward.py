@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class CommentRewardVirtualOperation(Base):
@@ -35,6 +37,20 @@ class CommentRewardVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+        struct comment_reward_operation : public virtual_operation
+       {
+          comment_reward_operation(){}
+          comment_reward_operation( const account_name_type& a, const string& pl, const asset& INFLECTOR )
+             :author(a), permlink(pl), payout(INFLECTOR){}
+
+          account_name_type author;
+          string            permlink;
+          asset             payout;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_comment_rewards'
@@ -58,13 +74,31 @@ class CommentRewardVirtualOperation(Base):
 
 
     _fields = dict(
-        payout=lambda x: amount_field(x.get('payout'), num_func=float), # steem_type:asset
+        payout=lambda x: amount_field(x.get('payout')), # steem_type:asset
         payout_symbol=lambda x: amount_symbol_field(x.get('payout')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['author',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'author', 'permlink', 'payout', 'payout_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('author'),
+            x.get('permlink'),
+            *asset_field(x.get('payout')),
+            'comment_reward',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class CurationRewardVirtualOperation(Base):
@@ -35,6 +37,21 @@ class CurationRewardVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+        struct curation_reward_operation : public virtual_operation
+       {
+          curation_reward_operation(){}
+          curation_reward_operation( const string& c, const asset& r, const string& a, const string& INFLECTOR )
+             :curator(c), reward(r), comment_author(a), comment_permlink(INFLECTOR) {}
+
+          account_name_type curator;
+          asset             reward;
+          account_name_type comment_author;
+          string            comment_permlink;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_curation_rewards'
@@ -61,13 +78,32 @@ class CurationRewardVirtualOperation(Base):
 
 
     _fields = dict(
-        reward=lambda x: amount_field(x.get('reward'), num_func=float), # steem_type:asset
+        reward=lambda x: amount_field(x.get('reward')), # steem_type:asset
         reward_symbol=lambda x: amount_symbol_field(x.get('reward')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['curator','comment_author',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'curator', 'reward', 'reward_symbol', 'comment_author', 'comment_permlink', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('curator'),
+            *asset_field(x.get('reward')),
+            x.get('comment_author'),
+            x.get('comment_permlink'),
+            'curation_reward',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
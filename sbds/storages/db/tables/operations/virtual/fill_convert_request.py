@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class FillConvertRequestVirtualOperation(Base):
@@ -35,6 +37,21 @@ class FillConvertRequestVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+        struct fill_convert_request_operation : public virtual_operation
+       {
+          fill_convert_request_operation(){}
+          fill_convert_request_operation( const string& o, const uint32_t id, const asset& in, const asset& out )
+             :owner(o), requestid(id), amount_in(in), amount_out(out) {}
+
+          account_name_type owner;
+          uint32_t          requestid = 0;
+          asset             amount_in;
+          asset             amount_out;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_fill_convert_requests'
@@ -60,15 +77,34 @@ class FillConvertRequestVirtualOperation(Base):
 
 
     _fields = dict(
-        amount_in=lambda x: amount_field(x.get('amount_in'), num_func=float), # steem_type:asset
+        amount_in=lambda x: amount_field(x.get('amount_in')), # steem_type:asset
         amount_in_symbol=lambda x: amount_symbol_field(x.get('amount_in')), # steem_type:asset
-        amount_out=lambda x: amount_field(x.get('amount_out'), num_func=float), # steem_type:asset
+        amount_out=lambda x: amount_field(x.get('amount_out')), # steem_type:asset
         amount_out_symbol=lambda x: amount_symbol_field(x.get('amount_out')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['owner',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'owner', 'requestid', 'amount_in', 'amount_in_symbol', 'amount_out', 'amount_out_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('owner'),
+            x.get('requestid'),
+            *asset_field(x.get('amount_in')),
+            *asset_field(x.get('amount_out')),
+            'fill_convert_request',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class FillOrderVirtualOperation(Base):
@@ -35,6 +37,23 @@ class FillOrderVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+        struct fill_order_operation : public virtual_operation
+       {
+          fill_order_operation(){}
+          fill_order_operation( const string& c_o, uint32_t c_id, const asset& c_p, const string& o_o, uint32_t o_id, const asset& o_p )
+          :current_owner(c_o), current_orderid(c_id), current_pays(c_p), open_owner(o_o), open_orderid(o_id), open_pays(o_p) {}
+
+          account_name_type current_owner;
+          uint32_t          current_orderid = 0;
+          asset             current_pays;
+          account_name_type open_owner;
+          uint32_t          open_orderid = 0;
+          asset             open_pays;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_fill_orders'
@@ -64,15 +83,36 @@ class FillOrderVirtualOperation(Base):
 
 
     _fields = dict(
-        current_pays=lambda x: amount_field(x.get('current_pays'), num_func=float), # steem_type:asset
+        current_pays=lambda x: amount_field(x.get('current_pays')), # steem_type:asset
         current_pays_symbol=lambda x: amount_symbol_field(x.get('current_pays')), # steem_type:asset
-        open_pays=lambda x: amount_field(x.get('open_pays'), num_func=float), # steem_type:asset
+        open_pays=lambda x: amount_field(x.get('open_pays')), # steem_type:asset
         open_pays_symbol=lambda x: amount_symbol_field(x.get('open_pays')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['current_owner','open_owner',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'current_owner', 'current_orderid', 'current_pays', 'current_pays_symbol', 'open_owner', 'open_orderid', 'open_pays', 'open_pays_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('current_owner'),
+            x.get('current_orderid'),
+            *asset_field(x.get('current_pays')),
+            x.get('open_owner'),
+            x.get('open_orderid'),
+            *asset_field(x.get('open_pays')),
+            'fill_order',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class FillVestingWithdrawVirtualOperation(Base):
@@ -35,6 +37,21 @@ class FillVestingWithdrawVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+           struct fill_vesting_withdraw_operation : public virtual_operation
+       {
+          fill_vesting_withdraw_operation(){}
+          fill_vesting_withdraw_operation( const string& f, const string& t, const asset& w, const asset& d )
+             :from_account(f), to_account(t), withdrawn(w), deposited(d) {}
+
+          account_name_type from_account;
+          account_name_type to_account;
+          asset             withdrawn;
+          asset             deposited;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_fill_vesting_withdraws'
@@ -62,15 +79,34 @@ class FillVestingWithdrawVirtualOperation(Base):
 
 
     _fields = dict(
-        withdrawn=lambda x: amount_field(x.get('withdrawn'), num_func=float), # steem_type:asset
+        withdrawn=lambda x: amount_field(x.get('withdrawn')), # steem_type:asset
         withdrawn_symbol=lambda x: amount_symbol_field(x.get('withdrawn')), # steem_type:asset
-        deposited=lambda x: amount_field(x.get('deposited'), num_func=float), # steem_type:asset
+        deposited=lambda x: amount_field(x.get('deposited')), # steem_type:asset
         deposited_symbol=lambda x: amount_symbol_field(x.get('deposited')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['from_account','to_account',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'from_account', 'to_account', 'withdrawn', 'withdrawn_symbol', 'deposited', 'deposited_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('from_account'),
+            x.get('to_account'),
+            *asset_field(x.get('withdrawn')),
+            *asset_field(x.get('deposited')),
+            'fill_vesting_withdraw',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
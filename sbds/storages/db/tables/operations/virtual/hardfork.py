@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class HardforkVirtualOperation(Base):
@@ -35,6 +37,17 @@ class HardforkVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+        struct hardfork_operation : public virtual_operation
+       {
+          hardfork_operation() {}
+          hardfork_operation( uint32_t hf_id ) : hardfork_id( hf_id ) {}
+
+          uint32_t         hardfork_id = 0;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_hardforks'
@@ -58,6 +71,22 @@ class HardforkVirtualOperation(Base):
 
     _account_fields = frozenset([])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'hardfork_id', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('hardfork_id'),
+            'hardfork',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
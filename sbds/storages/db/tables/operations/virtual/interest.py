@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class InterestVirtualOperation(Base):
@@ -35,6 +37,18 @@ class InterestVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+        struct interest_operation : public virtual_operation
+       {
+          interest_operation( const string& o = "", const asset& i = asset(0,SBD_SYMBOL) )
+             :owner(o),interest(i){}
+
+          account_name_type owner;
+          asset             interest;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_interests'
@@ -57,13 +71,30 @@ class InterestVirtualOperation(Base):
 
 
     _fields = dict(
-        interest=lambda x: amount_field(x.get('interest'), num_func=float), # steem_type:asset
+        interest=lambda x: amount_field(x.get('interest')), # steem_type:asset
         interest_symbol=lambda x: amount_symbol_field(x.get('interest')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['owner',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'owner', 'interest', 'interest_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('owner'),
+            *asset_field(x.get('interest')),
+            'interest',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
@@ -25,7 +25,9 @@ from ....enums import operation_types_enum
 from ....field_handlers import json_string_field
 from ....field_handlers import amount_field
 from ....field_handlers import amount_symbol_field
+from ....field_handlers import asset_field
 from ....field_handlers import comment_body_field
+from ....field_handlers import datetime_field
 
 
 class ShutdownWitnessVirtualOperation(Base):
@@ -35,6 +37,17 @@ class ShutdownWitnessVirtualOperation(Base):
     ======================
     
 
+    Steem C++ Definition
+    ======================
+    
+           struct shutdown_witness_operation : public virtual_operation
+       {
+          shutdown_witness_operation(){}
+          shutdown_witness_operation( const string& o ):owner(o) {}
+
+          account_name_type owner;
+       };
+
     """
 
     __tablename__ = 'sbds_op_virtual_shutdown_witnesses'
@@ -60,6 +73,22 @@ class ShutdownWitnessVirtualOperation(Base):
 
     _account_fields = frozenset(['owner',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'owner', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('owner'),
+            'shutdown_witness',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
@@ -25,7 +25,9 @@ from ...enums import operation_types_enum
 from ...field_handlers import json_string_field
 from ...field_handlers import amount_field
 from ...field_handlers import amount_symbol_field
+from ...field_handlers import asset_field
 from ...field_handlers import comment_body_field
+from ...field_handlers import datetime_field
 
 
 class WitnessUpdateOperation(Base):
@@ -70,13 +72,33 @@ class WitnessUpdateOperation(Base):
 
     _fields = dict(
         props=lambda x:json_string_field(x.get('props')), # steem_type:chain_properties
-        fee=lambda x: amount_field(x.get('fee'), num_func=float), # steem_type:asset
+        fee=lambda x: amount_field(x.get('fee')), # steem_type:asset
         fee_symbol=lambda x: amount_symbol_field(x.get('fee')), # steem_type:asset
         
     )
 
     _account_fields = frozenset(['owner',])
 
+    _row_columns = ('block_num', 'transaction_num', 'operation_num', 'trx_id', 'timestamp', 'owner', 'url', 'block_signing_key', 'props', 'fee', 'fee_symbol', 'operation_type')
+
+    @staticmethod
+    def _build_row(raw_op):
+        """Return an op from get_ops_in_block as a tuple in _row_columns order"""
+        x = raw_op['op'][1]
+        return (
+            raw_op['block'],
+            raw_op['trx_in_block'],
+            raw_op['op_in_trx'],
+            raw_op['trx_id'],
+            datetime_field(raw_op['timestamp']),
+            x.get('owner'),
+            x.get('url'),
+            x.get('block_signing_key'),
+            json_string_field(x.get('props')),
+            *asset_field(x.get('fee')),
+            'witness_update',
+        )
+
     def dump(self):
         return dissoc(self.__dict__, '_sa_instance_state')
 
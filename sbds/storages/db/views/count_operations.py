@@ -1,123 +1,101 @@
 # -*- coding: utf-8 -*-
+"""Operation counts from sbds_meta_operation_counts
+
+    Counts are summed from the buckets of blocks wholly inside the requested
+    range, only the blocks at either end which don't fill a bucket are
+    counted from the operation table.
+
+    .. code-block:: python
+
+        sql = count_operations_in_range_sql('vote')
+        args = count_operations_in_range_args(1, 2_500_000)
+        count = await conn.fetchval(sql, *args)
+"""
+from sbds.storages.db.tables.meta.operation_counts import OPERATION_COUNT_BUCKET_SIZE
+from sbds.storages.db.tables.meta.operation_counts import POST_ROLLUP
+from sbds.storages.db.tables.operations import combined_ops_class_map
+from sbds.storages.db.tables.operations import op_db_table_for_type
+
 from .views import view
 
 
 COUNT_OPERATIONS_SELECT_SQL = '''
-    
-        SELECT 'sbds_op_account_creates' AS operation_type, COUNT(*) AS count FROM sbds_op_account_creates GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_account_create_with_delegations' AS operation_type, COUNT(*) AS count FROM sbds_op_account_create_with_delegations GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_account_updates' AS operation_type, COUNT(*) AS count FROM sbds_op_account_updates GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_comments' AS operation_type, COUNT(*) AS count FROM sbds_op_comments GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_comment_option' AS operation_type, COUNT(*) AS count FROM sbds_op_comment_option GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_challenge_authorities' AS operation_type, COUNT(*) AS count FROM sbds_op_challenge_authorities GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_prove_authorities' AS operation_type, COUNT(*) AS count FROM sbds_op_prove_authorities GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_delete_comments' AS operation_type, COUNT(*) AS count FROM sbds_op_delete_comments GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_votes' AS operation_type, COUNT(*) AS count FROM sbds_op_votes GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_transfers' AS operation_type, COUNT(*) AS count FROM sbds_op_transfers GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_escrow_transfers' AS operation_type, COUNT(*) AS count FROM sbds_op_escrow_transfers GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_escrow_approves' AS operation_type, COUNT(*) AS count FROM sbds_op_escrow_approves GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_escrow_disputes' AS operation_type, COUNT(*) AS count FROM sbds_op_escrow_disputes GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_escrow_releases' AS operation_type, COUNT(*) AS count FROM sbds_op_escrow_releases GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_transfer_to_vestings' AS operation_type, COUNT(*) AS count FROM sbds_op_transfer_to_vestings GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_withdraw_vestings' AS operation_type, COUNT(*) AS count FROM sbds_op_withdraw_vestings GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_set_withdraw_vesting_routes' AS operation_type, COUNT(*) AS count FROM sbds_op_set_withdraw_vesting_routes GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_witness_updates' AS operation_type, COUNT(*) AS count FROM sbds_op_witness_updates GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_account_witness_votes' AS operation_type, COUNT(*) AS count FROM sbds_op_account_witness_votes GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_account_witness_proxies' AS operation_type, COUNT(*) AS count FROM sbds_op_account_witness_proxies GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_customs' AS operation_type, COUNT(*) AS count FROM sbds_op_customs GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_custom_jsons' AS operation_type, COUNT(*) AS count FROM sbds_op_custom_jsons GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_custom_binaries' AS operation_type, COUNT(*) AS count FROM sbds_op_custom_binaries GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_feed_publishes' AS operation_type, COUNT(*) AS count FROM sbds_op_feed_publishes GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_converts' AS operation_type, COUNT(*) AS count FROM sbds_op_converts GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_limit_order_creates' AS operation_type, COUNT(*) AS count FROM sbds_op_limit_order_creates GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_limit_order_create2s' AS operation_type, COUNT(*) AS count FROM sbds_op_limit_order_create2s GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_limit_order_cancels' AS operation_type, COUNT(*) AS count FROM sbds_op_limit_order_cancels GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_pows' AS operation_type, COUNT(*) AS count FROM sbds_op_pows GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_pow2s' AS operation_type, COUNT(*) AS count FROM sbds_op_pow2s GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_report_over_productions' AS operation_type, COUNT(*) AS count FROM sbds_op_report_over_productions GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_request_account_recoveries' AS operation_type, COUNT(*) AS count FROM sbds_op_request_account_recoveries GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_recover_accounts' AS operation_type, COUNT(*) AS count FROM sbds_op_recover_accounts GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_reset_accounts' AS operation_type, COUNT(*) AS count FROM sbds_op_reset_accounts GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_set_reset_accounts' AS operation_type, COUNT(*) AS count FROM sbds_op_set_reset_accounts GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_change_recovery_accounts' AS operation_type, COUNT(*) AS count FROM sbds_op_change_recovery_accounts GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_transfer_to_saving' AS operation_type, COUNT(*) AS count FROM sbds_op_transfer_to_saving GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_transfer_from_saving' AS operation_type, COUNT(*) AS count FROM sbds_op_transfer_from_saving GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_cancel_transfer_from_saving' AS operation_type, COUNT(*) AS count FROM sbds_op_cancel_transfer_from_saving GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_decline_voting_right' AS operation_type, COUNT(*) AS count FROM sbds_op_decline_voting_right GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_claim_reward_balances' AS operation_type, COUNT(*) AS count FROM sbds_op_claim_reward_balances GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_delegate_vesting_share' AS operation_type, COUNT(*) AS count FROM sbds_op_delegate_vesting_share GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_author_rewards' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_author_rewards GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_curation_rewards' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_curation_rewards GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_comment_rewards' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_comment_rewards GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_liquidity_rewards' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_liquidity_rewards GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_interests' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_interests GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_fill_convert_requests' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_fill_convert_requests GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_fill_vesting_withdraws' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_fill_vesting_withdraws GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_shutdown_witnesses' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_shutdown_witnesses GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_fill_orders' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_fill_orders GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_fill_transfer_from_saving' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_fill_transfer_from_saving GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_hardforks' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_hardforks GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_comment_payout_updates' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_comment_payout_updates GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_return_vesting_delegations' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_return_vesting_delegations GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_comment_benefactor_rewards' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_comment_benefactor_rewards GROUP BY operation_type
-    UNION ALL
-        SELECT 'sbds_op_virtual_producer_rewards' AS operation_type, COUNT(*) AS count FROM sbds_op_virtual_producer_rewards GROUP BY operation_type
-    ;
+        SELECT operation_type, SUM(count) AS count
+        FROM sbds_meta_operation_counts
+        GROUP BY operation_type;
+'''
+
+COUNT_OPERATIONS_FOR_TYPE_SQL = '''
+        SELECT COALESCE(SUM(count), 0)::bigint
+        FROM sbds_meta_operation_counts
+        WHERE operation_type = $1
+'''
+
+# the lowest and highest block_num with timestamp in [$1, $2)
+BLOCK_RANGE_FOR_TIME_SQL = '''
+        SELECT
+            (SELECT block_num FROM sbds_core_blocks
+             WHERE timestamp >= $1 ORDER BY timestamp LIMIT 1),
+            (SELECT block_num FROM sbds_core_blocks
+             WHERE timestamp < $2 ORDER BY timestamp DESC LIMIT 1)
 '''
 
 
+def count_operations_in_range_sql(op_type):
+    """Count op_type between block_nums $1 and $2
+
+    $3 and $4 are the first and last whole buckets, $5 and $6 the end of the
+    partial range before them and the start of the one after them.
+    """
+    table = op_db_table_for_type(op_type)
+    return f'''
+        SELECT (
+            SELECT COALESCE(SUM(count), 0) FROM sbds_meta_operation_counts
+            WHERE operation_type = '{op_type}' AND bucket BETWEEN $3 AND $4
+        ) + (
+            SELECT COUNT(*) FROM {table} WHERE block_num >= $1 AND block_num <= $5
+        ) + (
+            SELECT COUNT(*) FROM {table} WHERE block_num >= $6 AND block_num <= $2
+        )
+'''
+
+
+def count_operations_in_range_args(first_block, last_block,
+                                   bucket_size=OPERATION_COUNT_BUCKET_SIZE):
+    first_bucket = -(-first_block // bucket_size)
+    last_bucket = (last_block + 1) // bucket_size - 1
+    if first_bucket > last_bucket:
+        # no whole bucket, count the range from the table
+        return (first_block, last_block, first_bucket, last_bucket,
+                last_block, last_block + 1)
+    return (first_block, last_block, first_bucket, last_bucket,
+            first_bucket * bucket_size - 1, (last_bucket + 1) * bucket_size)
+
+
+def rebuild_operation_counts_sql(bucket_size=OPERATION_COUNT_BUCKET_SIZE):
+    """Yield statements which recount every bucket from the operation tables"""
+    yield 'DELETE FROM sbds_meta_operation_counts'
+    for op_type in sorted(combined_ops_class_map):
+        yield f'''
+        INSERT INTO sbds_meta_operation_counts (operation_type, bucket, count)
+        SELECT '{op_type}', block_num / {bucket_size}, COUNT(*)
+        FROM {op_db_table_for_type(op_type)}
+        GROUP BY block_num / {bucket_size}'''
+
+
+def rebuild_operation_rollups_sql():
+    """Yield statements which recount every hourly rollup"""
+    yield 'DELETE FROM sbds_meta_operation_rollups'
+    for op_type in sorted(combined_ops_class_map):
+        yield f'''
+        INSERT INTO sbds_meta_operation_rollups (name, hour, count)
+        SELECT '{op_type}', date_trunc('hour', timestamp), COUNT(*)
+        FROM {op_db_table_for_type(op_type)}
+        WHERE timestamp IS NOT NULL
+        GROUP BY date_trunc('hour', timestamp)'''
+    yield f'''
+        INSERT INTO sbds_meta_operation_rollups (name, hour, count)
+        SELECT '{POST_ROLLUP}', date_trunc('hour', timestamp), COUNT(*)
+        FROM {op_db_table_for_type('comment')}
+        WHERE timestamp IS NOT NULL AND parent_author = ''
+        GROUP BY date_trunc('hour', timestamp)'''
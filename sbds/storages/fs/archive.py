@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""Append-only segment archive of blocks and ops
+
+    Blocks are grouped into segments of `segment_size` consecutive block
+    numbers. Each segment is a pair of files:
+
+        <path>/archive.json          {"version": 1, "segment_size": 10000}
+        <path>/0000010000.seg        raw block and ops json, appended
+        <path>/0000010000.idx        one fixed size slot per block_num
+
+    An index slot is 24 bytes, `<QIQI`: block offset, block length, ops offset,
+    ops length. A slot of zeroes (or past the end of the index file) is a block
+    which hasn't been stored. Data is only ever appended to a segment;
+    storing a block again appends it and repoints its index slot.
+
+    Archives created with `compress=True` store zstd frames made with the
+    dictionaries kept in the archive directory (see sbds.storages.compression),
+    reads decompress transparently.
+
+    .. code-block:: python
+
+        with SegmentArchive('blocks_archive') as archive:
+            archive.put(block_num, block, ops)
+            raw_block, raw_ops = archive.get(block_num)
+            for block_num, raw_block, raw_ops in archive.iter_range(1, 1000):
+                ...
+"""
+import os
+import struct
+
+import structlog
+
+from sbds.sbds_json import dumps
+from sbds.sbds_json import loads
+from sbds.storages.compression import Codec
+
+logger = structlog.get_logger(__name__)
+
+ARCHIVE_VERSION = 1
+DEFAULT_SEGMENT_SIZE = 10_000
+METADATA_FILENAME = 'archive.json'
+
+SLOT = struct.Struct('<QIQI')
+EMPTY_SLOT = (0, 0, 0, 0)
+
+
+def as_bytes(data):
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode()
+    return dumps(data).encode()
+
+
+class SegmentArchive:
+    def __init__(self, path, segment_size=None, compress=None):
+        """
+        :param path: directory holding the archive, created if missing
+        :param segment_size: blocks per segment, only used by new archives
+        :param compress: compress newly stored blocks, defaults to the
+            archive's current setting
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        metadata_path = os.path.join(path, METADATA_FILENAME)
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                self.metadata = loads(f.read())
+            if self.metadata.get('version') != ARCHIVE_VERSION:
+                raise ValueError(
+                    f'unsupported archive version: {self.metadata.get("version")}')
+            if segment_size and segment_size != self.segment_size:
+                raise ValueError(f'{path} uses segment_size {self.segment_size}')
+        else:
+            self.metadata = dict(version=ARCHIVE_VERSION,
+                                 segment_size=segment_size or DEFAULT_SEGMENT_SIZE,
+                                 compression=None)
+            self.write_metadata()
+        if compress is not None and compress != self.compress:
+            self.metadata['compression'] = 'zstd' if compress else None
+            self.write_metadata()
+        self.codec = Codec.from_dir(path)
+        # first block_num -> (seg file, idx file) opened for writing
+        self._writers = dict()
+
+    @property
+    def segment_size(self):
+        return self.metadata['segment_size']
+
+    @property
+    def compress(self):
+        return self.metadata.get('compression') == 'zstd'
+
+    def write_metadata(self):
+        metadata_path = os.path.join(self.path, METADATA_FILENAME)
+        with open(f'{metadata_path}.tmp', 'w') as f:
+            f.write(dumps(self.metadata))
+        os.replace(f'{metadata_path}.tmp', metadata_path)
+
+    def segment_first(self, block_num):
+        return block_num - block_num % self.segment_size
+
+    def segment_path(self, first, ext):
+        return os.path.join(self.path, f'{first:010d}.{ext}')
+
+    def segments(self):
+        """Sorted first block_nums of every segment in the archive"""
+        return sorted(int(name[:-4]) for name in os.listdir(self.path)
+                      if name.endswith('.idx'))
+
+    # --- writing ---
+    def _writer(self, first):
+        writer = self._writers.get(first)
+        if writer is None:
+            seg = open(self.segment_path(first, 'seg'), 'ab')
+            idx_path = self.segment_path(first, 'idx')
+            idx = open(idx_path, 'r+b' if os.path.exists(idx_path) else 'w+b')
+            writer = self._writers[first] = (seg, idx)
+        return writer
+
+    def put(self, block_num, block, ops):
+        """Append a block and its ops to the block's segment
+
+        :param block: block as bytes, str or a json-serializable object
+        :param ops: ops in block as bytes, str or a json-serializable object
+        """
+        block = as_bytes(block)
+        ops = as_bytes(ops)
+        if self.compress:
+            block = self.codec.compress(block)
+            ops = self.codec.compress(ops)
+        seg, idx = self._writer(self.segment_first(block_num))
+        block_offset = seg.seek(0, os.SEEK_END)
+        seg.write(block)
+        seg.write(ops)
+        # flush data before the index so a slot never points past the data
+        seg.flush()
+        idx.seek((block_num % self.segment_size) * SLOT.size)
+        idx.write(SLOT.pack(block_offset, len(block),
+                            block_offset + len(block), len(ops)))
+
+    def flush(self):
+        for seg, idx in self._writers.values():
+            seg.flush()
+            idx.flush()
+
+    def close(self):
+        for seg, idx in self._writers.values():
+            seg.close()
+            idx.close()
+        self._writers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- reading ---
+    def read_index(self, first):
+        """Return the index of a segment as a list of slot tuples"""
+        idx_path = self.segment_path(first, 'idx')
+        if first in self._writers:
+            self._writers[first][1].flush()
+        try:
+            with open(idx_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        slots = list(SLOT.iter_unpack(data[:len(data) - len(data) % SLOT.size]))
+        slots.extend([EMPTY_SLOT] * (self.segment_size - len(slots)))
+        return slots
+
+    def read_slot(self, block_num):
+        first = self.segment_first(block_num)
+        if first in self._writers:
+            self._writers[first][1].flush()
+        try:
+            with open(self.segment_path(first, 'idx'), 'rb') as f:
+                f.seek((block_num % self.segment_size) * SLOT.size)
+                data = f.read(SLOT.size)
+        except FileNotFoundError:
+            return EMPTY_SLOT
+        if len(data) < SLOT.size:
+            return EMPTY_SLOT
+        return SLOT.unpack(data)
+
+    def __contains__(self, block_num):
+        return self.read_slot(block_num)[1] > 0
+
+    def get(self, block_num):
+        """Return (raw block, raw ops) bytes, or None if block_num isn't stored"""
+        block_offset, block_len, ops_offset, ops_len = self.read_slot(block_num)
+        if not block_len:
+            return None
+        with open(self.segment_path(self.segment_first(block_num), 'seg'),
+                  'rb') as f:
+            f.seek(block_offset)
+            block = f.read(block_len)
+            f.seek(ops_offset)
+            ops = f.read(ops_len)
+        return self.codec.decompress(block), self.codec.decompress(ops)
+
+    def get_block_and_ops(self, block_num):
+        """Return decoded (block, ops), or None if block_num isn't stored"""
+        raw = self.get(block_num)
+        if raw is None:
+            return None
+        return loads(raw[0]), loads(raw[1])
+
+    def iter_range(self, start, end):
+        """Yield (block_num, raw block, raw ops) for stored blocks in [start, end)
+
+        Segments are read front to back with large buffered reads, so replay
+        is sequential IO rather than one open/seek per block.
+        """
+        for first in range(self.segment_first(start), end, self.segment_size):
+            slots = self.read_index(first)
+            seg_path = self.segment_path(first, 'seg')
+            if not os.path.exists(seg_path):
+                continue
+            with open(seg_path, 'rb', buffering=1024 * 1024) as f:
+                for block_num in range(max(start, first),
+                                       min(end, first + self.segment_size)):
+                    block_offset, block_len, ops_offset, ops_len = slots[
+                        block_num - first]
+                    if not block_len:
+                        continue
+                    if f.tell() != block_offset:
+                        f.seek(block_offset)
+                    block = f.read(block_len)
+                    if ops_offset != block_offset + block_len:
+                        f.seek(ops_offset)
+                    ops = f.read(ops_len)
+                    yield (block_num, self.codec.decompress(block),
+                           self.codec.decompress(ops))
+
+    def missing(self, start, end):
+        """Yield block_nums in [start, end) which aren't stored"""
+        for first in range(self.segment_first(start), end, self.segment_size):
+            slots = self.read_index(first)
+            for block_num in range(max(start, first),
+                                   min(end, first + self.segment_size)):
+                if not slots[block_num - first][1]:
+                    yield block_num
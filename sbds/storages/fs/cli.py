@@ -1,15 +1,25 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 import json
 import click
 import shutil
 import os
 import pathlib
+import random
 import requests
 import structlog
 import hashlib
 
 from sbds.sbds_json import dumps
+from sbds.storages.compression import DEFAULT_DICT_SIZE
+from sbds.storages.compression import PLAIN_CODEC
+from sbds.storages.compression import Codec
+from sbds.storages.compression import save_dictionary
+from sbds.storages.compression import train_dictionary
+from sbds.storages.fs.archive import DEFAULT_SEGMENT_SIZE
+from sbds.storages.fs.archive import SegmentArchive
+from sbds.storages.fs.mirror import Mirror
 
 logger = structlog.get_logger(__name__)
 
@@ -40,17 +50,37 @@ def key(block_num, name, base_path):
         base_path, block_num_sha[:2], block_num_sha[2:4], block_num_sha[4:6], str(block_num), f'{name}'))
 
 
-def put(pathobj, data):
+def read(pathobj, codec=PLAIN_CODEC):
+    return codec.decompress(pathobj.read_bytes())
+
+
+def read_ops(block_num, base_path, codec=PLAIN_CODEC):
+    # older commands stored ops as ops_in_block.json, put-ops as ops.json
+    for name in ('ops.json', 'ops_in_block.json'):
+        ops_key = key(block_num, name, base_path)
+        if ops_key.exists():
+            return read(ops_key, codec)
+    return None
+
+
+def put(pathobj, data, codec=None):
     pathobj.parent.mkdir(parents=True, exist_ok=True)
-    pathobj.write_bytes(dumps(data).encode())
+    data = dumps(data).encode()
+    if codec:
+        data = codec.compress(data)
+    pathobj.write_bytes(data)
 
 
 @click.group(name='fs')
 @click.option('--path', type=click.Path(file_okay=False), default='blocks_data')
+@click.option('--compress', is_flag=True,
+              help='zstd compress new files using the dictionary in --path')
 @click.pass_context
-def fs(ctx, path):
+def fs(ctx, path, compress):
     """Interact with a filesystem storage backend"""
-    ctx.obj = dict(path=path)
+    codec = Codec.from_dir(path)
+    ctx.obj = dict(path=path, codec=codec,
+                   put_codec=codec if compress else None)
 
 
 @fs.command('init')
@@ -74,6 +104,7 @@ def init(ctx):
 def put_blocks_and_ops(ctx, steemd_url, start, end, skip_existing):
     session = requests.Session()
     base_path = ctx.obj['path']
+    codec = ctx.obj['put_codec']
     for block_num in range(start, end + 1):
         ops_key = None
         block_key = None
@@ -85,7 +116,7 @@ def put_blocks_and_ops(ctx, steemd_url, start, end, skip_existing):
 
             raw, block = fetch(session, steemd_url, block_num, 'get_block')
             block = block['result']
-            put(block_key, block)
+            put(block_key, block, codec)
             logger.info('put_blocks_and_ops', block_num=block_num, key=block_key)
 
             ops_key = key(block_num, 'ops_in_block.json', base_path)
@@ -96,7 +127,7 @@ def put_blocks_and_ops(ctx, steemd_url, start, end, skip_existing):
             raw, ops = fetch(session, steemd_url, block_num, 'get_ops_in_block')
 
             ops = ops['result']
-            put(ops_key, ops)
+            put(ops_key, ops, codec)
             logger.info('put_blocks_and_ops', block_num=block_num, key=ops_key)
         except Exception as e:
             logger.error('put_blocks_and_ops', error=e, block_num=block_num,
@@ -112,6 +143,7 @@ def put_blocks_and_ops(ctx, steemd_url, start, end, skip_existing):
 def put_blocks(ctx, steemd_url, start, end, skip_existing):
     session = requests.Session()
     base_path = ctx.obj['path']
+    codec = ctx.obj['put_codec']
     for block_num in range(start, end + 1):
         block_key = None
         try:
@@ -121,7 +153,7 @@ def put_blocks(ctx, steemd_url, start, end, skip_existing):
                 continue
             raw, block = fetch(session, steemd_url, block_num, 'get_block')
             block = block['result']
-            put(block_key, block)
+            put(block_key, block, codec)
             logger.info('put_blocks', block_num=block_num, key=block_key)
 
         except Exception as e:
@@ -137,6 +169,7 @@ def put_blocks(ctx, steemd_url, start, end, skip_existing):
 def put_ops(ctx, steemd_url, start, end, skip_existing):
     session = requests.Session()
     base_path = ctx.obj['path']
+    codec = ctx.obj['put_codec']
     for block_num in range(start, end + 1):
         ops_key = None
         try:
@@ -147,7 +180,118 @@ def put_ops(ctx, steemd_url, start, end, skip_existing):
                 continue
             raw, ops = fetch(session, steemd_url, block_num, 'get_ops_in_block')
             ops = ops['result']
-            put(ops_key, ops)
+            put(ops_key, ops, codec)
             logger.info('put ops', block_num=block_num, key=ops_key)
         except Exception as e:
             logger.error('put_ops', error=e, block_num=block_num, key=ops_key)
+
+
+@fs.command(name='pack')
+@click.argument('archive_path', type=click.Path(file_okay=False))
+@click.option('--start', type=click.INT, default=1)
+@click.option('--end', type=click.INT, default=20000000)
+@click.option('--segment_size', type=click.INT, default=None,
+              help=f'Blocks per segment for a new archive, default {DEFAULT_SEGMENT_SIZE}')
+@click.option('--skip_existing', type=click.BOOL, default=True)
+@click.option('--compress', is_flag=True,
+              help='zstd compress blocks using the dictionary in the archive')
+@click.pass_context
+def pack(ctx, archive_path, start, end, segment_size, skip_existing, compress):
+    """Copy blocks and ops from the directory tree into a segment archive"""
+    base_path = ctx.obj['path']
+    codec = ctx.obj['codec']
+    packed = 0
+    with SegmentArchive(archive_path, segment_size=segment_size,
+                        compress=compress or None) as archive:
+        missing = set(archive.missing(start, end + 1)) if skip_existing else None
+        for block_num in range(start, end + 1):
+            if missing is not None and block_num not in missing:
+                continue
+            block_key = key(block_num, 'block.json', base_path)
+            if not block_key.exists():
+                continue
+            ops = read_ops(block_num, base_path, codec)
+            if ops is None:
+                logger.error('pack', error='missing ops', block_num=block_num)
+                continue
+            archive.put(block_num, read(block_key, codec), ops)
+            packed += 1
+            if packed % 10000 == 0:
+                logger.info('pack', block_num=block_num, packed=packed)
+    logger.info('pack', packed=packed, archive_path=archive_path)
+
+
+@fs.command(name='mirror')
+@click.argument('archive_path', type=click.Path(file_okay=False))
+@click.argument('steemd_url', type=click.STRING, default='https://api.steemit.com')
+@click.option('--start', type=click.INT, default=1,
+              help='First block to mirror, ignored when resuming from a checkpoint')
+@click.option('--end', type=click.INT, default=None,
+              help='Last block to mirror, defaults to the last irreversible block')
+@click.option('--batch_size', type=click.INT, default=50)
+@click.option('--concurrency', type=click.INT, default=8)
+@click.option('--retries', type=click.INT, default=5)
+@click.option('--segment_size', type=click.INT, default=None,
+              help=f'Blocks per segment for a new archive, default {DEFAULT_SEGMENT_SIZE}')
+@click.option('--compress', is_flag=True,
+              help='zstd compress blocks using the dictionary in the archive')
+def mirror(archive_path, steemd_url, start, end, batch_size, concurrency,
+           retries, segment_size, compress):
+    """Concurrently copy blocks and ops from steemd into a segment archive
+
+    Progress is checkpointed to mirror.json in the archive, rerunning the
+    command resumes from it and retries any failed ranges.
+    """
+    block_mirror = Mirror(archive_path, steemd_url, batch_size=batch_size,
+                          concurrency=concurrency, retries=retries,
+                          segment_size=segment_size,
+                          compress=compress or None)
+    loop = asyncio.get_event_loop()
+    checkpoint = loop.run_until_complete(block_mirror.run(start=start, end=end))
+    click.echo(json.dumps(checkpoint.to_dict()))
+
+
+def sample_archive(archive, count, max_segments=100):
+    """Return raw blocks and ops of up to `count` random stored blocks"""
+    segments = archive.segments()
+    segments = random.sample(segments, min(len(segments), max_segments))
+    per_segment = max(1, count // max(1, len(segments)))
+    samples = []
+    for first in segments:
+        stored = [first + i for i, slot in enumerate(archive.read_index(first))
+                  if slot[1]]
+        for block_num in random.sample(stored, min(len(stored), per_segment)):
+            samples.extend(archive.get(block_num))
+    return samples
+
+
+@fs.command(name='train-dictionary')
+@click.argument('archive_path', type=click.Path(file_okay=False, exists=True))
+@click.option('--samples', type=click.INT, default=10000,
+              help='Number of blocks to sample')
+@click.option('--dict_size', type=click.INT, default=DEFAULT_DICT_SIZE)
+@click.option('--output', type=click.Path(file_okay=False), default=None,
+              help='Directory to save the dictionary to, defaults to the archive')
+@click.option('--enable/--no-enable', default=True,
+              help='Compress blocks stored in the archive from now on')
+def train(archive_path, samples, dict_size, output, enable):
+    """Train a zstd dictionary on blocks sampled from a segment archive
+
+    Previous dictionaries are kept so existing data stays readable.
+    """
+    with SegmentArchive(archive_path) as archive:
+        sampled = sample_archive(archive, samples)
+        if not sampled:
+            raise click.ClickException(f'no blocks in {archive_path}')
+        dictionary = train_dictionary(sampled, dict_size=dict_size)
+        save_dictionary(dictionary, output or archive_path)
+        if enable and not output:
+            archive.metadata['compression'] = 'zstd'
+            archive.write_metadata()
+        codec = Codec(dictionary=dictionary)
+        raw_size = sum(len(s) for s in sampled)
+        compressed_size = sum(len(codec.compress(bytes(s))) for s in sampled)
+    click.echo(json.dumps(dict(
+        dict_id=dictionary.dict_id(),
+        samples=len(sampled) // 2,
+        ratio=round(raw_size / compressed_size, 2))))
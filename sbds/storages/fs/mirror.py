@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""Mirror blocks and ops from steemd into a SegmentArchive
+
+    Batches of block_nums are fetched concurrently with one batched
+    JSON-RPC request each (get_block and get_ops_in_block for every block)
+    and appended to the archive by a single writer thread.
+
+    Progress is kept in a small checkpoint file next to the archive rather
+    than by checking the archive block by block:
+
+        {"high_water_mark": 1234000, "gaps": [[1000, 1049]]}
+
+    Every block_num <= high_water_mark is stored except those in `gaps`, the
+    inclusive ranges of batches which failed after all retries. Resuming
+    retries the gaps, then continues from the high water mark.
+"""
+import asyncio
+import concurrent.futures
+import itertools as it
+import os
+import time
+
+import aiohttp
+import structlog
+
+from sbds.sbds_json import dumps
+from sbds.sbds_json import loads
+from sbds.storages.fs.archive import SegmentArchive
+
+logger = structlog.get_logger(__name__)
+
+CHECKPOINT_FILENAME = 'mirror.json'
+
+
+class Checkpoint:
+    def __init__(self, path, high_water_mark=0, gaps=None):
+        self.path = path
+        self.high_water_mark = high_water_mark
+        self.gaps = [tuple(gap) for gap in gaps or []]
+        # gap batches being retried, still gaps until they're stored
+        self._retrying = set()
+        # first block_num -> last block_num of batches finished above the hwm
+        self._finished = dict()
+
+    @classmethod
+    def load(cls, path, start=1):
+        """Load a checkpoint, or start a new one at block_num `start`"""
+        try:
+            with open(path) as f:
+                data = loads(f.read())
+        except FileNotFoundError:
+            return cls(path, high_water_mark=start - 1)
+        return cls(path, data['high_water_mark'], data['gaps'])
+
+    def to_dict(self):
+        return dict(high_water_mark=self.high_water_mark,
+                    gaps=sorted(self.gaps + list(self._retrying)))
+
+    def save(self, data=None):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(dumps(data or self.to_dict()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def finish(self, first, last, failed=False):
+        """Record a batch of block_nums [first, last] as stored or failed"""
+        if failed:
+            self.gaps.append((first, last))
+        if (first, last) in self._retrying:
+            self._retrying.discard((first, last))
+            return
+        self._finished[first] = last
+        while self.high_water_mark + 1 in self._finished:
+            self.high_water_mark = self._finished.pop(self.high_water_mark + 1)
+
+    def retry_gaps(self, batch_size):
+        """Return the gaps as batches, which stay gaps until they're stored"""
+        gap_batches = list(batches(sorted(self.gaps), batch_size))
+        self._retrying.update(gap_batches)
+        self.gaps = []
+        return gap_batches
+
+    def pending(self, end, batch_size):
+        """Yield (first, last) batches above the high water mark up to end"""
+        return batches([(self.high_water_mark + 1, end)], batch_size)
+
+
+def batches(ranges, batch_size):
+    for first, last in ranges:
+        for batch_first in range(first, last + 1, batch_size):
+            yield batch_first, min(last, batch_first + batch_size - 1)
+
+
+async def jsonrpc_batch(client, url, requests):
+    async with client.post(url, data=dumps(requests)) as response:
+        response.raise_for_status()
+        return loads(await response.read())
+
+
+async def get_last_irreversible_block_num(client, url):
+    response = await jsonrpc_batch(
+        client, url,
+        dict(id=1, jsonrpc='2.0', method='get_dynamic_global_properties'))
+    return response['result']['last_irreversible_block_num']
+
+
+async def fetch_batch(client, url, first, last):
+    """Return [(block_num, raw block, raw ops)] for block_nums [first, last]"""
+    requests = []
+    for block_num in range(first, last + 1):
+        # even ids for get_block, odd for get_ops_in_block
+        requests.append(dict(id=2 * block_num, jsonrpc='2.0',
+                             method='get_block', params=[block_num]))
+        requests.append(dict(id=2 * block_num + 1, jsonrpc='2.0',
+                             method='get_ops_in_block',
+                             params=[block_num, False]))
+    responses = await jsonrpc_batch(client, url, requests)
+    if not isinstance(responses, list):
+        # eg a single error object for the whole batch
+        raise ValueError(f'bad batch response {responses!r:.200}')
+    responses = {response['id']: response for response in responses}
+    results = []
+    for block_num in range(first, last + 1):
+        block = responses.get(2 * block_num)
+        ops = responses.get(2 * block_num + 1)
+        if block is None or ops is None:
+            raise ValueError(f'missing response for block {block_num}')
+        if 'error' in block or 'error' in ops:
+            raise ValueError(block.get('error') or ops.get('error'))
+        if not isinstance(block.get('result'), dict):
+            raise ValueError(f'bad response for block {block_num}')
+        results.append((block_num, dumps(block['result']),
+                        dumps(ops['result'])))
+    return results
+
+
+class Mirror:
+    def __init__(self, archive_path, url, batch_size=50, concurrency=8,
+                 retries=5, checkpoint_interval=10, segment_size=None,
+                 compress=None):
+        self.url = url
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.checkpoint_interval = checkpoint_interval
+        self.archive = SegmentArchive(archive_path, segment_size=segment_size,
+                                      compress=compress)
+        self.checkpoint_path = os.path.join(archive_path, CHECKPOINT_FILENAME)
+        # a single thread appends to the archive so writes never interleave
+        self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.checkpoint = None
+        self.stored = 0
+        self.last_save = time.monotonic()
+
+    def write(self, results):
+        for block_num, block, ops in results:
+            self.archive.put(block_num, block, ops)
+
+    def save_checkpoint(self, data):
+        # stored blocks must be on disk before the checkpoint includes them
+        self.archive.flush()
+        self.checkpoint.save(data)
+
+    async def fetch_with_retries(self, client, first, last):
+        for attempt in range(1, self.retries + 1):
+            try:
+                return await fetch_batch(client, self.url, first, last)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError,
+                    KeyError) as e:
+                logger.warning('mirror fetch failed', first=first, last=last,
+                               attempt=attempt, e=e)
+                await asyncio.sleep(min(2 ** attempt, 30))
+        return None
+
+    async def worker(self, client, queue):
+        while True:
+            first, last = await queue.get()
+            try:
+                await self.mirror_batch(client, first, last)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # a dead worker would leave run() waiting on the queue forever
+                logger.exception('mirror batch failed', first=first, last=last,
+                                 e=e)
+            finally:
+                queue.task_done()
+
+    async def mirror_batch(self, client, first, last):
+        loop = asyncio.get_event_loop()
+        try:
+            results = await self.fetch_with_retries(client, first, last)
+            if results is not None:
+                await loop.run_in_executor(self.writer, self.write, results)
+                self.stored += len(results)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # eg a malformed response or an OSError writing the archive,
+            # the batch is left as a gap
+            self.checkpoint.finish(first, last, failed=True)
+            raise
+        self.checkpoint.finish(first, last, failed=results is None)
+        if time.monotonic() - self.last_save > self.checkpoint_interval:
+            self.last_save = time.monotonic()
+            await loop.run_in_executor(self.writer, self.save_checkpoint,
+                                       self.checkpoint.to_dict())
+            logger.info('mirror progress',
+                        high_water_mark=self.checkpoint.high_water_mark,
+                        gaps=len(self.checkpoint.gaps),
+                        stored=self.stored)
+
+    async def run(self, start=1, end=None):
+        loop = asyncio.get_event_loop()
+        # an existing checkpoint takes precedence over start
+        self.checkpoint = Checkpoint.load(self.checkpoint_path, start=start)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(
+                connector=connector,
+                headers={'Content-Type': 'application/json'}) as client:
+            if end is None:
+                end = await get_last_irreversible_block_num(client, self.url)
+            gap_batches = self.checkpoint.retry_gaps(self.batch_size)
+            pending = it.chain(gap_batches,
+                               self.checkpoint.pending(end, self.batch_size))
+            logger.info('mirror starting', end=end, gap_batches=len(gap_batches),
+                        high_water_mark=self.checkpoint.high_water_mark)
+            queue = asyncio.Queue(maxsize=self.concurrency * 2)
+            workers = [asyncio.ensure_future(self.worker(client, queue))
+                       for _ in range(self.concurrency)]
+            try:
+                for batch in pending:
+                    await queue.put(batch)
+                await queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await loop.run_in_executor(self.writer, self.save_checkpoint,
+                                           self.checkpoint.to_dict())
+                self.archive.close()
+                self.writer.shutdown()
+        logger.info('mirror finished',
+                    high_water_mark=self.checkpoint.high_water_mark,
+                    gaps=self.checkpoint.gaps, stored=self.stored)
+        return self.checkpoint
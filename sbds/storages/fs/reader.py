@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Memory mapped, random access reader for a SegmentArchive
+
+    Segment and index files are mapped once and block bytes are served as
+    memoryview slices of the mapping, so reading a block doesn't copy it or
+    open any files.
+
+    .. code-block:: python
+
+        reader = ArchiveReader('blocks_archive')
+        raw_block, raw_ops = reader.get_view(block_num)
+        results = await reader.fetch_blocks_and_ops_in_blocks(block_nums)
+"""
+import asyncio
+import mmap
+import os
+
+import structlog
+
+from sbds.sbds_json import loads
+from sbds.storages.fs.archive import METADATA_FILENAME
+from sbds.storages.fs.archive import SLOT
+from sbds.storages.fs.archive import SegmentArchive
+
+logger = structlog.get_logger(__name__)
+
+
+def map_file(path):
+    """Return a read-only mmap of path, or None if it's missing or empty"""
+    try:
+        with open(path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+
+class ArchiveReader:
+    def __init__(self, path):
+        if not os.path.exists(os.path.join(path, METADATA_FILENAME)):
+            raise FileNotFoundError(f'no block archive at {path}')
+        self.archive = SegmentArchive(path)
+        self.segment_size = self.archive.segment_size
+        # first block_num -> mmap, remapped when a segment has grown
+        self._segments = dict()
+        self._indexes = dict()
+
+    def _mapping(self, cache, first, ext, min_size):
+        mm = cache.get(first)
+        if mm is None or len(mm) < min_size:
+            # the old mapping is left for gc, views of it may still be in use
+            mm = cache[first] = map_file(self.archive.segment_path(first, ext))
+        return mm
+
+    def read_slot(self, block_num):
+        first = block_num - block_num % self.segment_size
+        slot_offset = (block_num - first) * SLOT.size
+        idx = self._mapping(self._indexes, first, 'idx', slot_offset + SLOT.size)
+        if idx is None or len(idx) < slot_offset + SLOT.size:
+            return first, None
+        return first, SLOT.unpack_from(idx, slot_offset)
+
+    def get_view(self, block_num):
+        """Return (block, ops) as memoryviews of the mapped segment
+
+        The views are only valid until the reader is closed, and hold zstd
+        frames if the archive is compressed, see `read`.
+
+        :raises KeyError: if block_num isn't in the archive
+        """
+        first, slot = self.read_slot(block_num)
+        if not slot or not slot[1]:
+            raise KeyError(block_num)
+        block_offset, block_len, ops_offset, ops_len = slot
+        seg = self._mapping(self._segments, first, 'seg', ops_offset + ops_len)
+        if seg is None or len(seg) < ops_offset + ops_len:
+            # the index was written before the segment data reached disk
+            raise KeyError(block_num)
+        view = memoryview(seg)
+        return (view[block_offset:block_offset + block_len],
+                view[ops_offset:ops_offset + ops_len])
+
+    def read(self, block_num):
+        """Return (block, ops) buffers, decompressed if needed"""
+        block, ops = self.get_view(block_num)
+        decompress = self.archive.codec.decompress
+        return decompress(block), decompress(ops)
+
+    def __contains__(self, block_num):
+        slot = self.read_slot(block_num)[1]
+        return bool(slot and slot[1])
+
+    def head(self):
+        """Return the highest block_num in the archive, or None if it's empty"""
+        for first in reversed(self.archive.segments()):
+            slots = self.archive.read_index(first)
+            for i in reversed(range(len(slots))):
+                if slots[i][1]:
+                    return first + i
+        return None
+
+    def read_blocks_and_ops(self, block_nums):
+        """Return [(block_num, raw block bytes, decoded ops)]
+
+        The raw block is passed through undecoded, block storage keeps it
+        verbatim and parses it once while preparing it. Block_nums which
+        aren't in the archive are left out.
+        """
+        results = []
+        for block_num in block_nums:
+            try:
+                block, ops = self.read(block_num)
+            except KeyError:
+                continue
+            results.append((block_num, bytes(block), loads(bytes(ops))))
+        return results
+
+    async def fetch_blocks_and_ops_in_blocks(self, block_nums, loop=None,
+                                             executor=None):
+        """Async equivalent of populate's steemd fetcher, reading from disk"""
+        loop = loop or asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, self.read_blocks_and_ops,
+                                          list(block_nums))
+
+    def close(self):
+        for cache in (self._segments, self._indexes):
+            for mm in cache.values():
+                try:
+                    if mm is not None:
+                        mm.close()
+                except BufferError:
+                    # still referenced by a view, unmapped once it's released
+                    pass
+            cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import collections
+import concurrent.futures
 import json
 
 import boto3
@@ -7,19 +9,27 @@ import click
 import structlog
 
 import sbds.sbds_logging
+from sbds.storages.compression import Codec
+from sbds.storages.compression import dictionary_filename
+from sbds.storages.s3.segments import dictionary_key
+from sbds.storages.s3.segments import upload_archive
+from sbds.storages.s3.segments import with_retries
 
 logger = structlog.get_logger(__name__)
 
 
 @click.group(name='s3')
 @click.argument('bucket', type=click.STRING)
+@click.option('--endpoint_url', type=click.STRING, envvar='S3_ENDPOINT_URL',
+              default=None,
+              help='S3 compatible endpoint to use instead of AWS, eg a local stand-in')
 @click.pass_context
-def s3(ctx, bucket):
+def s3(ctx, bucket, endpoint_url):
     """Interact with an S3 storage backend"""
     ctx.obj = dict(
         bucket=bucket,
-        s3_resource=boto3.resource('s3'),
-        s3_client=boto3.client('s3'),
+        s3_resource=boto3.resource('s3', endpoint_url=endpoint_url),
+        s3_client=boto3.client('s3', endpoint_url=endpoint_url),
         region='us-east-1')
 
 
@@ -35,24 +45,82 @@ def create_bucket(ctx):
         CreateBucketConfiguration={'LocationConstraint': region})
 
 
-def put_json_block(s3_resource, block, bucket):
+def put_dictionaries(s3_client, bucket, prefix, codec):
+    """Upload the codec's dictionaries so readers can decompress blocks
+
+    They go where `put-segments` puts them, so a bucket has one set.
+    """
+    for dict_data in codec.dictionaries.values():
+        key = dictionary_key(prefix, dictionary_filename(dict_data))
+        s3_client.put_object(Bucket=bucket, Key=key,
+                             Body=dict_data.as_bytes())
+
+
+def put_json_block(s3_client, block, bucket, codec=None):
     blocknum = str(block['block_num'])
     key = '/'.join([blocknum, 'block.json'])
     data = bytes(json.dumps(block), 'utf8')
-    result = s3_resource.Object(bucket, key).put(
-        Body=data, ContentEncoding='UTF-8', ContentType='application/json')
+    if codec:
+        data = codec.compress(data)
+        result = s3_client.put_object(
+            Bucket=bucket, Key=key, Body=data, ContentEncoding='zstd',
+            ContentType='application/json')
+    else:
+        result = s3_client.put_object(
+            Bucket=bucket, Key=key, Body=data, ContentEncoding='UTF-8',
+            ContentType='application/json')
     return block, bucket, blocknum, key, result
 
 
 @s3.command(name='put-blocks')
 @click.argument('blocks', type=click.File('r'))
+@click.option('--compress', is_flag=True, help='zstd compress blocks')
+@click.option('--dictionary_dir', type=click.Path(file_okay=False, exists=True),
+              default=None, help='Directory holding zstd dictionaries')
+@click.option('--prefix', type=click.STRING, default='blocks',
+              help='Prefix the zstd dictionaries are uploaded under, as for '
+                   'put-segments')
+@click.option('--workers', type=click.INT, default=16,
+              help='Number of blocks uploaded at once')
+@click.option('--retries', type=click.INT, default=5)
 @click.pass_context
-def put_json_blocks(ctx, blocks):
+def put_json_blocks(ctx, blocks, compress, dictionary_dir, prefix, workers,
+                    retries):
     """Store JSON blocks"""
-    s3_resource = ctx.obj['s3_resource']
+    # clients are thread safe, resources aren't
+    s3_client = ctx.obj['s3_client']
     bucket = ctx.obj['bucket']
-    for block in blocks:
-        block = json.loads(block)
-        # pylint: disable=unused-variable
-        res_block, res_bucket, res_blocknum, res_key, s3_result = put_json_block(
-            s3_resource, block, bucket)
+    codec = None
+    if compress:
+        codec = Codec.from_dir(dictionary_dir) if dictionary_dir else Codec()
+        put_dictionaries(s3_client, bucket, prefix, codec)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = collections.deque()
+        for block in blocks:
+            block = json.loads(block)
+            in_flight.append(pool.submit(
+                with_retries, put_json_block, s3_client, block, bucket,
+                codec=codec, retries=retries, key=block.get('block_num')))
+            # bound memory use by the number of puts waiting to run
+            while len(in_flight) >= workers * 4:
+                in_flight.popleft().result()
+        for future in in_flight:
+            future.result()
+
+
+@s3.command(name='put-segments')
+@click.argument('archive_path', type=click.Path(file_okay=False, exists=True))
+@click.option('--prefix', type=click.STRING, default='blocks')
+@click.option('--workers', type=click.INT, default=8,
+              help='Number of segments uploaded at once')
+@click.option('--retries', type=click.INT, default=5)
+@click.option('--force', is_flag=True, help='Upload unchanged segments again')
+@click.pass_context
+def put_segments(ctx, archive_path, prefix, workers, retries, force):
+    """Upload a segment archive and write its manifest"""
+    manifest = upload_archive(ctx.obj['s3_client'], archive_path,
+                              ctx.obj['bucket'], prefix, max_workers=workers,
+                              retries=retries, force=force)
+    click.echo(json.dumps(dict(
+        segments=len(manifest['segments']),
+        blocks=sum(s['blocks'] for s in manifest['segments']))))
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Read blocks and ops from a segment archive uploaded to S3
+
+    The manifest written by `s3 put-segments` maps block ranges to segment
+    objects. Blocks are read in chunks of `chunk_blocks` consecutive block
+    numbers, each with a single ranged GET covering the chunk's slots in its
+    segment. GETs run concurrently in a thread pool and the chunks after the
+    last one requested are fetched ahead of time, so a sequential replay
+    rarely waits on S3.
+
+    .. code-block:: python
+
+        reader = S3ArchiveReader('bucket', 'blocks')
+        results = await reader.fetch_blocks_and_ops_in_blocks(range(1, 101))
+"""
+import asyncio
+import collections
+import concurrent.futures
+
+import boto3
+import structlog
+import zstandard as zstd
+
+from sbds.sbds_json import loads
+from sbds.storages.compression import Codec
+from sbds.storages.fs.archive import SLOT
+from sbds.storages.s3.segments import get_manifest
+
+logger = structlog.get_logger(__name__)
+
+# gaps in a chunk's byte range larger than this are read with separate GETs
+MAX_RANGE_GAP = 1024 * 1024
+
+
+def byte_ranges(slots, max_gap=MAX_RANGE_GAP):
+    """Group (block_num, slot) by offset into ranges read with one GET each"""
+    slots = sorted(slots, key=lambda s: s[1][0])
+    ranges = []
+    for block_num, slot in slots:
+        block_offset, block_len, ops_offset, ops_len = slot
+        end = max(block_offset + block_len, ops_offset + ops_len)
+        if ranges and block_offset - ranges[-1][1] <= max_gap:
+            ranges[-1][1] = max(ranges[-1][1], end)
+            ranges[-1][2].append((block_num, slot))
+        else:
+            ranges.append([block_offset, end, [(block_num, slot)]])
+    return ranges
+
+
+class S3ArchiveReader:
+    def __init__(self, bucket, prefix='blocks', s3_client=None,
+                 endpoint_url=None, chunk_blocks=100, prefetch_chunks=8,
+                 max_workers=16):
+        """
+        :param chunk_blocks: consecutive block_nums read by each ranged GET
+        :param prefetch_chunks: chunks to read ahead of the last one requested
+        :param max_workers: concurrent GETs
+        """
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_client = s3_client or boto3.client('s3',
+                                                   endpoint_url=endpoint_url)
+        self.chunk_blocks = chunk_blocks
+        self.prefetch_chunks = prefetch_chunks
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers)
+        self.manifest = get_manifest(self.s3_client, bucket, prefix)
+        if self.manifest is None:
+            raise FileNotFoundError(f'no manifest in s3://{bucket}/{prefix}')
+        self.segment_size = self.manifest['segment_size']
+        self.segments = {s['first']: s for s in self.manifest['segments']}
+        self.codec = Codec(dictionaries=[
+            zstd.ZstdCompressionDict(self.get_object(key))
+            for key in self.manifest.get('dictionaries', [])])
+        # first block_num -> segment index bytes
+        self._indexes = dict()
+        # chunk number -> future of {block_num: (block, ops)}, oldest first
+        self._chunks = collections.OrderedDict()
+        self._max_chunks = prefetch_chunks + max_workers * 2
+
+    def get_object(self, key, byte_range=None):
+        kwargs = dict(Bucket=self.bucket, Key=key)
+        if byte_range:
+            kwargs['Range'] = 'bytes=%d-%d' % byte_range
+        return self.s3_client.get_object(**kwargs)['Body'].read()
+
+    def index(self, first):
+        idx = self._indexes.get(first)
+        if idx is None:
+            segment = self.segments.get(first)
+            idx = self.get_object(segment['idx_key']) if segment else b''
+            self._indexes[first] = idx
+        return idx
+
+    def slot(self, block_num):
+        first = block_num - block_num % self.segment_size
+        idx = self.index(first)
+        offset = (block_num - first) * SLOT.size
+        if len(idx) < offset + SLOT.size:
+            return None
+        slot = SLOT.unpack_from(idx, offset)
+        return slot if slot[1] else None
+
+    def head(self):
+        """Return the highest block_num in the archive, or None if it's empty"""
+        for first in sorted(self.segments, reverse=True):
+            idx = self.index(first)
+            for i in reversed(range(len(idx) // SLOT.size)):
+                if SLOT.unpack_from(idx, i * SLOT.size)[1]:
+                    return first + i
+        return None
+
+    def chunk_of(self, block_num):
+        # block_nums start at 1, so chunks line up with batches of
+        # chunk_blocks starting at block 1
+        return (block_num - 1) // self.chunk_blocks
+
+    def read_chunk(self, chunk):
+        """Read every stored block in a chunk with as few GETs as possible"""
+        first_block_num = chunk * self.chunk_blocks + 1
+        block_nums = range(first_block_num,
+                           first_block_num + self.chunk_blocks)
+        by_segment = collections.defaultdict(list)
+        for block_num in block_nums:
+            slot = self.slot(block_num)
+            if slot:
+                by_segment[block_num - block_num % self.segment_size].append(
+                    (block_num, slot))
+        results = dict()
+        for first, slots in by_segment.items():
+            seg_key = self.segments[first]['seg_key']
+            for start, end, range_slots in byte_ranges(slots):
+                data = memoryview(self.get_object(seg_key, (start, end - 1)))
+                for block_num, slot in range_slots:
+                    block_offset, block_len, ops_offset, ops_len = slot
+                    block = data[block_offset - start:
+                                 block_offset - start + block_len]
+                    ops = data[ops_offset - start:ops_offset - start + ops_len]
+                    results[block_num] = (bytes(self.codec.decompress(block)),
+                                          loads(bytes(self.codec.decompress(ops))))
+        return results
+
+    def _chunk_future(self, chunk, loop):
+        future = self._chunks.get(chunk)
+        if future is None:
+            future = self._chunks[chunk] = loop.run_in_executor(
+                self.executor, self.read_chunk, chunk)
+            # least recently used chunks go first
+            while len(self._chunks) > self._max_chunks:
+                self._chunks.popitem(last=False)
+        else:
+            self._chunks.move_to_end(chunk)
+        return future
+
+    async def fetch_blocks_and_ops_in_blocks(self, block_nums, loop=None):
+        """Return [(block_num, raw block bytes, decoded ops)]
+
+        Block_nums which aren't in the archive are left out.
+        """
+        loop = loop or asyncio.get_event_loop()
+        block_nums = list(block_nums)
+        chunks = sorted(set(map(self.chunk_of, block_nums)))
+        futures = {c: self._chunk_future(c, loop) for c in chunks}
+        # read ahead of the furthest chunk requested
+        for chunk in range(chunks[-1] + 1,
+                           chunks[-1] + 1 + self.prefetch_chunks):
+            self._chunk_future(chunk, loop)
+        results = []
+        for block_num in block_nums:
+            chunk = self.chunk_of(block_num)
+            try:
+                blocks = await futures[chunk]
+            except Exception:
+                # a failed read is retried from scratch
+                if self._chunks.get(chunk) is futures[chunk]:
+                    del self._chunks[chunk]
+                raise
+            if block_num in blocks:
+                block, ops = blocks[block_num]
+                results.append((block_num, block, ops))
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False)
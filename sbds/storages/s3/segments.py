@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Upload SegmentArchive segments to S3
+
+    Segments are uploaded whole, with multipart uploads for large ones, by a
+    bounded pool of upload threads. A manifest is written once the segment
+    uploads have finished, listing those which succeeded, and maps block
+    ranges to object keys:
+
+    .. code-block:: json
+
+        {"version": 1, "segment_size": 10000, "compression": "zstd",
+         "dictionaries": ["blocks/dictionaries/zstd-850652566.dict"],
+         "segments": [{"first": 0, "last": 9999, "blocks": 9999,
+                       "seg_key": "blocks/segments/0000000000.seg",
+                       "idx_key": "blocks/segments/0000000000.idx",
+                       "seg_size": 51234123, "idx_size": 240000}]}
+
+    Segments whose size matches the existing manifest are skipped, so the
+    upload can be rerun as the archive grows.
+"""
+import concurrent.futures
+import glob
+import os
+import time
+
+import structlog
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import BotoCoreError
+from botocore.exceptions import ClientError
+
+from sbds.sbds_json import dumps
+from sbds.sbds_json import loads
+from sbds.storages.fs.archive import SLOT
+from sbds.storages.fs.archive import SegmentArchive
+
+logger = structlog.get_logger(__name__)
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=4)
+
+
+def manifest_key(prefix):
+    return '/'.join([prefix, MANIFEST_NAME])
+
+
+def segment_key(prefix, first, ext):
+    return '/'.join([prefix, 'segments', f'{first:010d}.{ext}'])
+
+
+def dictionary_key(prefix, filename):
+    return '/'.join([prefix, 'dictionaries', filename])
+
+
+def get_manifest(s3_client, bucket, prefix):
+    """Return the manifest under prefix, or None if there isn't one"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=manifest_key(prefix))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    return loads(response['Body'].read())
+
+
+def put_manifest(s3_client, bucket, prefix, manifest):
+    s3_client.put_object(Bucket=bucket, Key=manifest_key(prefix),
+                         Body=dumps(manifest).encode(),
+                         ContentType='application/json')
+
+
+def segment_entry(archive, prefix, first, slots=None):
+    slots = slots or archive.read_index(first)
+    return dict(
+        first=first,
+        last=first + archive.segment_size - 1,
+        blocks=sum(1 for slot in slots if slot[1]),
+        seg_key=segment_key(prefix, first, 'seg'),
+        idx_key=segment_key(prefix, first, 'idx'),
+        seg_size=os.path.getsize(archive.segment_path(first, 'seg')),
+        idx_size=len(slots) * SLOT.size)
+
+
+def with_retries(func, *args, retries=5, key=None, **kwargs):
+    for attempt in range(1, retries + 1):
+        # upload_file raises S3UploadFailedError for the errors of its puts
+        try:
+            return func(*args, **kwargs)
+        except (BotoCoreError, ClientError, S3UploadFailedError) as e:
+            if attempt == retries:
+                raise
+            logger.warning('upload failed, retrying', key=key,
+                           attempt=attempt, e=e)
+            time.sleep(min(2 ** attempt, 30))
+
+
+def upload_segment(s3_client, archive, bucket, prefix, first, retries=5):
+    """Upload a segment and its index, return its manifest entry"""
+    # read the index before the segment size is taken, so the uploaded
+    # index never points past the uploaded data if the segment is growing
+    slots = archive.read_index(first)
+    entry = segment_entry(archive, prefix, first, slots=slots)
+    with_retries(s3_client.upload_file, archive.segment_path(first, 'seg'),
+                 bucket, entry['seg_key'], Config=TRANSFER_CONFIG,
+                 retries=retries, key=entry['seg_key'])
+    # the index is uploaded padded to segment_size slots
+    idx = b''.join(SLOT.pack(*slot) for slot in slots)
+    with_retries(s3_client.put_object, Bucket=bucket, Key=entry['idx_key'],
+                 Body=idx, retries=retries, key=entry['idx_key'])
+    return entry
+
+
+def upload_archive(s3_client, archive_path, bucket, prefix, max_workers=8,
+                   retries=5, force=False):
+    """Upload new or changed segments of an archive, then its manifest
+
+    The manifest is written even if some segment uploads fail, listing the
+    ones which finished, before the first failure is raised.
+
+    :return: the new manifest
+    """
+    archive = SegmentArchive(archive_path)
+    manifest = get_manifest(s3_client, bucket, prefix)
+    if manifest and manifest['segment_size'] != archive.segment_size:
+        raise ValueError(f'{bucket}/{prefix} uses segment_size '
+                         f'{manifest["segment_size"]}')
+    uploaded = {s['first']: s for s in (manifest or {}).get('segments', [])}
+
+    segments = archive.segments()
+    pending = [
+        first for first in segments
+        if force or uploaded.get(first, {}).get('seg_size') !=
+        os.path.getsize(archive.segment_path(first, 'seg'))]
+    logger.info('uploading segments', segments=len(segments),
+                pending=len(pending), bucket=bucket, prefix=prefix)
+
+    dictionaries = []
+    for path in glob.glob(os.path.join(archive_path, 'zstd-*.dict')):
+        key = dictionary_key(prefix, os.path.basename(path))
+        with_retries(s3_client.upload_file, path, bucket, key,
+                     retries=retries, key=key)
+        dictionaries.append(key)
+
+    errors = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(upload_segment, s3_client, archive, bucket,
+                               prefix, first, retries): first
+                   for first in pending}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                entry = future.result()
+            except Exception as e:
+                logger.error('segment upload failed', first=futures[future],
+                             e=e)
+                errors.append(e)
+                continue
+            uploaded[entry['first']] = entry
+            logger.info('uploaded segment', first=entry['first'],
+                        seg_size=entry['seg_size'])
+
+    manifest = dict(
+        version=MANIFEST_VERSION,
+        segment_size=archive.segment_size,
+        compression=archive.metadata.get('compression'),
+        dictionaries=sorted(set(dictionaries) | set(
+            (manifest or {}).get('dictionaries', []))),
+        segments=[uploaded[first] for first in sorted(uploaded)])
+    # failed segments keep their old entry, if any, and are retried on the
+    # next run since their size doesn't match it
+    put_manifest(s3_client, bucket, prefix, manifest)
+    if errors:
+        logger.error('segment uploads failed', failed=len(errors),
+                     uploaded=len(pending) - len(errors))
+        raise errors[0]
+    return manifest
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""Block sources for populate, selected by URL
+
+    ==========================  ==============================================
+    http://host:port            steemd, batched get_block + get_ops_in_block
+    fs://path/to/archive        a local SegmentArchive
+    s3://bucket/prefix          a SegmentArchive uploaded with put-segments
+    stdin:// or -               JSON lines on stdin, see `StdinSource`
+    ==========================  ==============================================
+
+    Every source returns [(block_num, block, ops)] for a batch of block_nums,
+    where block is a dict, JSON str or JSON bytes and ops is a list, and
+    declares the batch size and number of concurrent batches it works best
+    with.
+
+    .. code-block:: python
+
+        source = block_source('s3://sbds-blocks/blocks')
+        end_block = await source.head()
+        results = await source.fetch(range(1, source.batch_size + 1))
+        await source.close()
+"""
+import asyncio
+import sys
+
+import aiohttp
+import funcy
+import structlog
+
+from sbds.sbds_json import loads
+from sbds.storages.db.scripts.ingest_checkpoints import covered_ranges
+from sbds.storages.db.scripts.ingest_metrics import record_bytes
+from sbds.storages.db.scripts.ingest_metrics import record_ops
+from sbds.storages.db.scripts.ingest_metrics import timed
+from sbds.storages.fs.reader import ArchiveReader
+from sbds.storages.s3.reader import S3ArchiveReader
+from sbds.utils import block_num_from_previous
+
+logger = structlog.get_logger(__name__)
+
+
+class BlockSource:
+    batch_size = 100
+    concurrency = 5
+
+    async def fetch(self, block_nums):
+        """Return [(block_num, block, ops)] for block_nums"""
+        raise NotImplementedError
+
+    async def head(self):
+        """Return the highest block_num available, or None if it isn't known"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class SteemdSource(BlockSource):
+    batch_size = 100
+    concurrency = 5
+
+    def __init__(self, url, client=None, batch_size=None, concurrency=None):
+        self.url = url
+        self.client = client
+        # only a session created here is closed by `close`
+        self._owns_client = client is None
+        self.batch_size = batch_size or self.batch_size
+        self.concurrency = concurrency or self.concurrency
+
+    def _client(self):
+        if self.client is None:
+            self.client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100),
+                headers={'Content-Type': 'application/json'})
+        return self.client
+
+    async def dynamic_global_properties(self):
+        response = await self._client().post(
+            self.url,
+            data=b'{"id":1,"jsonrpc":"2.0","method":"get_dynamic_global_properties"}')
+        jsonrpc_response = loads(await response.read())
+        return jsonrpc_response['result']
+
+    async def head(self):
+        props = await self.dynamic_global_properties()
+        return props['last_irreversible_block_num']
+
+    async def fetch(self, block_nums):
+        """Fetch blocks and ops with one batched request, retrying until it succeeds"""
+        request_data = ','.join(
+            f'{{"id":{block_num},"jsonrpc":"2.0","method":"get_block","params":[{block_num}]}},{{"id":{block_num},"jsonrpc":"2.0","method":"get_ops_in_block","params":[{block_num},false]}}'
+            for block_num in block_nums)
+        request_json = f'[{request_data}]'.encode()
+        response = 'n/a'
+        while True:
+            try:
+                with timed('fetch', blocks=len(block_nums)):
+                    response = await self._client().post(self.url,
+                                                         data=request_json)
+                    raw_response = await response.read()
+                record_bytes('fetch', len(raw_response))
+                with timed('decode', blocks=len(block_nums),
+                           nbytes=len(raw_response)):
+                    jsonrpc_response = loads(raw_response)
+                    results = []
+                    for get_block, get_ops in funcy.partition(2, jsonrpc_response):
+                        assert get_block['id'] == get_ops['id']
+                        results.append((get_block['id'], get_block['result'],
+                                        get_ops['result']))
+                    assert len(results) == len(block_nums)
+                ops_count = sum(len(ops) for _, _, ops in results if ops)
+                record_ops('fetch', ops_count)
+                record_ops('decode', ops_count)
+                return results
+            except Exception as e:
+                logger.exception('error fetching ops in block',
+                                 e=e, response=response)
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._owns_client and self.client is not None:
+            await self.client.close()
+
+
+class ArchiveSource(BlockSource):
+    """Blocks from an fs `ArchiveReader` or an `S3ArchiveReader`"""
+
+    def __init__(self, reader, batch_size=500, concurrency=4):
+        self.reader = reader
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+    async def head(self):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.reader.head)
+
+    async def fetch(self, block_nums):
+        with timed('fetch', blocks=len(block_nums)):
+            results = await self.reader.fetch_blocks_and_ops_in_blocks(
+                block_nums)
+        if len(results) < len(block_nums):
+            # eg gaps left by `fs mirror`, they stay missing in the checkpoint
+            missing = set(block_nums).difference(
+                block_num for block_num, _, _ in results)
+            logger.warning('blocks missing from archive',
+                           missing=covered_ranges(
+                               range(min(missing), max(missing) + 1), missing))
+        record_bytes('fetch', sum(len(block) for _, block, _ in results))
+        record_ops('fetch', sum(len(ops) for _, _, ops in results))
+        return results
+
+    async def close(self):
+        self.reader.close()
+
+
+def parse_block_line(line):
+    """Return (block_num, block, ops) from a line of JSON
+
+    A line is either {"block_num": 1, "block": {...}, "ops": [...]} or a bare
+    block, as written by `sbds chain stream-blocks`, which has no ops.
+    """
+    data = loads(line)
+    if 'block' in data:
+        block = data['block']
+        ops = data.get('ops') or []
+    else:
+        block = data
+        ops = []
+    block_num = data.get('block_num') or block.get('block_num') or \
+        block_num_from_previous(block['previous'])
+    return block_num, block, ops
+
+
+class StdinSource(BlockSource):
+    """Blocks read from a stream of JSON lines, in increasing block_num order
+
+    The stream can only be read forwards, so lines for block_nums which
+    weren't asked for (eg those already stored) are skipped, and batches must
+    be requested in order.
+    """
+    batch_size = 100
+    concurrency = 4
+
+    def __init__(self, stream=None, batch_size=None):
+        self.stream = stream or sys.stdin.buffer
+        self.batch_size = batch_size or self.batch_size
+        self._lock = None
+        # a line read past the end of a batch, returned first by next_block
+        self._pending = None
+
+    async def head(self):
+        return None
+
+    def next_block(self):
+        """Return the next (block_num, block, ops, nbytes), or None at eof"""
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            return pending
+        for line in self.stream:
+            if line.strip():
+                return parse_block_line(line) + (len(line),)
+        return None
+
+    def read_until(self, block_nums):
+        wanted = set(block_nums)
+        last = max(wanted)
+        results = dict()
+        nbytes = 0
+        while True:
+            parsed = self.next_block()
+            if parsed is None:
+                break
+            block_num, block, ops, line_bytes = parsed
+            if block_num > last:
+                # it belongs to a later batch, leave it for that one
+                self._pending = parsed
+                break
+            nbytes += line_bytes
+            if block_num in wanted:
+                results[block_num] = (block_num, block, ops)
+            if block_num == last:
+                break
+        if len(results) < len(wanted):
+            logger.warning('blocks missing from stream',
+                           missing=len(wanted) - len(results))
+        record_bytes('fetch', nbytes)
+        return [results[n] for n in block_nums if n in results]
+
+    async def fetch(self, block_nums):
+        loop = asyncio.get_event_loop()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # batches are started in order and the lock is fifo, so the stream
+        # is read in block_num order even with several batches in flight
+        async with self._lock:
+            with timed('fetch', blocks=len(block_nums)):
+                results = await loop.run_in_executor(None, self.read_until,
+                                                     list(block_nums))
+        record_ops('fetch', sum(len(ops) for _, _, ops in results))
+        return results
+
+
+def block_source(url, client=None, s3_endpoint_url=None, batch_size=None,
+                 concurrency=None):
+    """Return the BlockSource for url
+
+    :param client: aiohttp session for steemd sources
+    :param s3_endpoint_url: S3 endpoint for s3:// sources
+    """
+    kwargs = funcy.compact(dict(batch_size=batch_size, concurrency=concurrency))
+    if url in ('-', 'stdin://'):
+        kwargs.pop('concurrency', None)
+        return StdinSource(**kwargs)
+    if url.startswith(('http://', 'https://')):
+        return SteemdSource(url, client=client, **kwargs)
+    if url.startswith('fs://'):
+        return ArchiveSource(ArchiveReader(url[len('fs://'):]), **kwargs)
+    if url.startswith('s3://'):
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        reader = S3ArchiveReader(bucket, prefix.strip('/') or 'blocks',
+                                 endpoint_url=s3_endpoint_url)
+        kwargs.setdefault('batch_size', reader.chunk_blocks)
+        kwargs.setdefault('concurrency', 8)
+        return ArchiveSource(reader, **kwargs)
+    raise ValueError(f'unsupported block source: {url}')
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Block/ops corpora replayed by the ingest benchmark
+
+    A corpus file holds consecutive blocks from one era of the chain along
+    with the result of `get_ops_in_block(block_num, false)` for each block:
+
+    .. code-block:: json
+
+        {"era": "2017-hf19", "source": "https://api.steemit.com",
+         "blocks": [{"block_num": 1, "block": {...}, "ops": [...]}, ...]}
+
+    Record a corpus from a steemd node with:
+
+        python -m tests.benchmarks.corpus record https://api.steemit.com \
+            2017-hf19 20000000 200 > tests/data/ingest_corpus/2017-hf19.json
+
+    The corpora checked in under tests/data/ingest_corpus are synthesized
+    from the transaction fixtures in tests/data/get_block by running:
+
+        python -m tests.benchmarks.corpus synthesize tests/data/ingest_corpus
+"""
+import glob
+import hashlib
+import itertools as it
+import os
+import sys
+from datetime import datetime
+from datetime import timedelta
+
+import rapidjson as json
+import requests
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+CORPUS_DIR = os.path.join(TEST_DATA_DIR, 'ingest_corpus')
+GET_BLOCK_DATA_DIR = os.path.join(TEST_DATA_DIR, 'get_block')
+
+# era -> (first block_num, first timestamp, get_block fixtures, virtual ops)
+ERAS = {
+    '2016-genesis': (1, '2016-03-24T16:05:00', [], []),
+    '2016-launch': (
+        1_000, '2016-03-24T18:00:00',
+        ['pow', 'transfer', 'account_witness_vote', 'transfer_to_vesting',
+         'account_create', 'withdraw_vesting'],
+        []),
+    '2016-social': (
+        3_000_000, '2016-07-01T13:33:00',
+        ['block', 'comment', 'feed_publish', 'witness_update',
+         'account_witness_proxy', 'delete_comment', 'limit_order_create',
+         'limit_order_cancel', 'set_withdraw_vesting_route',
+         'request_account_recovery', 'recover_account'],
+        ['author_reward', 'curation_reward', 'fill_order']),
+    '2017-savings': (
+        9_000_000, '2017-01-20T17:43:00',
+        ['vote', 'comment_options', 'transfer_to_savings',
+         'transfer_from_savings', 'cancel_transfer_from_savings', 'pow2',
+         'comment'],
+        ['producer_reward', 'author_reward', 'curation_reward']),
+}
+
+VIRTUAL_OPS = {
+    'author_reward': {
+        'author': 'mindfreak', 'permlink': 'coffee-delivered',
+        'sbd_payout': '0.812 SBD', 'steem_payout': '0.000 STEEM',
+        'vesting_payout': '1816.371402 VESTS'},
+    'curation_reward': {
+        'curator': 'roadscape', 'reward': '254.011204 VESTS',
+        'comment_author': 'mindfreak', 'comment_permlink': 'coffee-delivered'},
+    'fill_order': {
+        'current_owner': 'nxt6', 'current_orderid': 1467380003,
+        'current_pays': '1.000 SBD', 'open_owner': 'roadscape',
+        'open_orderid': 1467379001, 'open_pays': '2.412 STEEM'},
+    'producer_reward': {
+        'producer': 'roadscape', 'vesting_shares': '1021.456022 VESTS'},
+}
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+BLOCK_INTERVAL = timedelta(seconds=3)
+
+
+def previous_for_block_num(block_num, previous=None):
+    """Block id of block_num - 1, keeping any hash bytes of `previous`"""
+    suffix = (previous or '')[8:] or '0' * 32
+    return f'{block_num - 1:08x}{suffix}'
+
+
+def load_corpus(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_corpora(corpus_dir=CORPUS_DIR):
+    return [load_corpus(path)
+            for path in sorted(glob.glob(f'{corpus_dir}/*.json'))]
+
+
+def replay(corpus, first_block_num, count):
+    """Yield (block_num, block, ops) for `count` blocks from `first_block_num`
+
+    Blocks are cycled through, with block numbers, previous ids and op block
+    numbers rewritten so the output looks like a contiguous chain.
+    """
+    entries = it.cycle(corpus['blocks'])
+    for block_num in range(first_block_num, first_block_num + count):
+        entry = next(entries)
+        block = dict(entry['block'])
+        block['previous'] = previous_for_block_num(block_num,
+                                                   block.get('previous'))
+        ops = [dict(op, block=block_num) for op in entry['ops']]
+        yield block_num, block, ops
+
+
+# --- recording ---
+def record_corpus(url, era, first_block_num, count, session=None):
+    session = session or requests.Session()
+    block_nums = range(first_block_num, first_block_num + count)
+    request = list(it.chain.from_iterable(
+        ({'id': block_num, 'jsonrpc': '2.0', 'method': 'get_block',
+          'params': [block_num]},
+         {'id': block_num, 'jsonrpc': '2.0', 'method': 'get_ops_in_block',
+          'params': [block_num, False]})
+        for block_num in block_nums))
+    response = session.post(url, data=json.dumps(request))
+    response.raise_for_status()
+    results = response.json()
+    blocks = []
+    for get_block, get_ops in zip(results[::2], results[1::2]):
+        assert get_block['id'] == get_ops['id']
+        blocks.append(dict(block_num=get_block['id'],
+                           block=get_block['result'],
+                           ops=get_ops['result']))
+    return dict(era=era, source=url, blocks=blocks)
+
+
+# --- synthesizing ---
+def load_transactions(name):
+    with open(os.path.join(GET_BLOCK_DATA_DIR, f'{name}.json')) as f:
+        data = json.load(f)
+    if 'transactions' in data:
+        return data['transactions']
+    return [data]
+
+
+def trx_id(transaction):
+    return hashlib.sha1(json.dumps(transaction).encode()).hexdigest()
+
+
+def synthesize_block(block_num, timestamp, transactions, virtual_ops):
+    block = {
+        'previous': previous_for_block_num(block_num),
+        'timestamp': timestamp.strftime(TIMESTAMP_FORMAT),
+        'witness': 'roadscape',
+        'transaction_merkle_root': '0' * 40,
+        'extensions': [],
+        'witness_signature': '1f' + '0' * 128,
+        'transactions': transactions
+    }
+    ops = []
+    for trx_in_block, transaction in enumerate(transactions):
+        for op_in_trx, op in enumerate(transaction['operations']):
+            ops.append(dict(trx_id=trx_id(transaction), block=block_num,
+                            trx_in_block=trx_in_block, op_in_trx=op_in_trx,
+                            virtual_op=0, timestamp=block['timestamp'],
+                            op=op))
+    for op_in_trx, op_type in enumerate(virtual_ops):
+        ops.append(dict(trx_id='0' * 40, block=block_num,
+                        trx_in_block=len(transactions), op_in_trx=op_in_trx,
+                        virtual_op=1, timestamp=block['timestamp'],
+                        op=[op_type, VIRTUAL_OPS[op_type]]))
+    return dict(block_num=block_num, block=block, ops=ops)
+
+
+def synthesize_corpus(era, count=20):
+    first_block_num, timestamp, fixtures, virtual_ops = ERAS[era]
+    timestamp = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    transactions = list(
+        it.chain.from_iterable(load_transactions(name) for name in fixtures))
+    transaction_cycle = it.cycle(transactions)
+    blocks = []
+    for i in range(count):
+        block_num = first_block_num + i
+        # vary transactions per block so blocks differ in size
+        block_transactions = list(
+            it.islice(transaction_cycle, i % 4)) if transactions else []
+        blocks.append(
+            synthesize_block(block_num, timestamp + i * BLOCK_INTERVAL,
+                             block_transactions, virtual_ops))
+    return dict(era=era, source='synthesized from tests/data/get_block',
+                blocks=blocks)
+
+
+def main(argv):
+    command, *args = argv
+    if command == 'record':
+        url, era, first_block_num, count = args
+        corpus = record_corpus(url, era, int(first_block_num), int(count))
+        sys.stdout.write(json.dumps(corpus, indent=2))
+    elif command == 'synthesize':
+        corpus_dir, = args
+        os.makedirs(corpus_dir, exist_ok=True)
+        for era in ERAS:
+            with open(os.path.join(corpus_dir, f'{era}.json'), 'w') as f:
+                f.write(json.dumps(synthesize_corpus(era), indent=2))
+    else:
+        raise SystemExit(f'unknown command: {command}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
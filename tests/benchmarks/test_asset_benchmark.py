@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Asset parsing micro-benchmark
+
+    Times `asset_field`, which fills both columns of an asset from one
+    parse, against the previous float based amount_field/amount_symbol_field
+    pair, over every asset in the ingest corpora.
+
+        SBDS_BENCHMARK_MICRO=1 pytest -s tests/benchmarks/test_asset_benchmark.py
+
+    The exactness checks run without SBDS_BENCHMARK_MICRO.
+"""
+import os
+import timeit
+from decimal import Decimal
+
+import pytest
+
+from sbds.storages.db.field_handlers import asset_field
+from sbds.storages.db.field_handlers import parse_asset
+
+from .corpus import load_corpora
+
+ROUNDS = int(os.environ.get('SBDS_BENCHMARK_ROUNDS', 200))
+
+
+def legacy_amount_field(value, num_func=int, no_value=0):
+    if not value:
+        return num_func(no_value)
+    try:
+        return num_func(value.split()[0])
+    except Exception:
+        return num_func(no_value)
+
+
+def legacy_amount_symbol_field(value, no_value=''):
+    if not value:
+        return no_value
+    try:
+        return value.split()[1]
+    except Exception:
+        return no_value
+
+
+def corpus_assets():
+    assets = []
+    for corpus in load_corpora():
+        for block in corpus['blocks']:
+            for op in block['ops']:
+                assets.extend(v for v in op['op'][1].values()
+                              if isinstance(v, str) and parse_asset(v))
+    return assets
+
+
+ASSETS = corpus_assets()
+
+
+def test_asset_field_is_exact():
+    assert ASSETS
+    for value in ASSETS:
+        amount, precision, symbol = parse_asset(value)
+        assert asset_field(value) == (Decimal(amount).scaleb(-precision), symbol)
+        assert str(asset_field(value)[0]) == value.split()[0]
+    assert asset_field('123456789.123457 VESTS')[0] == Decimal('123456789.123457')
+    assert asset_field({'amount': '634', 'precision': 3,
+                        'nai': '@@000000013'}) == (Decimal('0.634'), 'SBD')
+    assert asset_field('nan STEEM') == (Decimal(0), '')
+    assert asset_field(None) == (Decimal(0), '')
+
+
+@pytest.mark.skipif(not os.environ.get('SBDS_BENCHMARK_MICRO'),
+                    reason='set SBDS_BENCHMARK_MICRO to run micro-benchmarks')
+@pytest.mark.parametrize('name,func', [
+    ('legacy float', lambda v: (legacy_amount_field(v, num_func=float),
+                                legacy_amount_symbol_field(v))),
+    ('legacy int', lambda v: (legacy_amount_field(v),
+                              legacy_amount_symbol_field(v))),
+    ('parse_asset', parse_asset),
+    ('asset_field', asset_field),
+])
+def test_asset_parsing_speed(name, func):
+    assets = ASSETS
+
+    def run():
+        for value in assets:
+            func(value)
+
+    seconds = min(timeit.repeat(run, number=ROUNDS, repeat=3))
+    usec = seconds / (ROUNDS * len(assets)) * 1e6
+    print(f'\n{name}: {usec:.3f} usec/asset ({len(assets)} assets)')
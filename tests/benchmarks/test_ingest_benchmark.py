@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Ingest throughput benchmark
+
+    Replays each corpus in tests/data/ingest_corpus through populate's
+    fetch, decode, prepare and store stages, using a local steemd stub and
+    the Postgres database at SBDS_BENCHMARK_DATABASE_URL.
+
+    THE BENCHMARK DATABASE'S BLOCK, OPERATION AND ACCOUNT TABLES ARE TRUNCATED.
+
+        SBDS_BENCHMARK_DATABASE_URL=postgresql://localhost/sbds_bench \
+            pytest -s tests/benchmarks
+
+    Optional settings:
+        SBDS_BENCHMARK_BLOCKS                 blocks replayed per era (500)
+        SBDS_BENCHMARK_REPORT                 path to write a JSON report to
+        SBDS_BENCHMARK_MIN_BLOCKS_PER_SEC     fail eras stored slower than this
+"""
+import json
+import os
+
+import aiohttp
+import pytest
+from aiohttp.connector import TCPConnector
+
+from sbds.storages.db.scripts import ingest_metrics
+from sbds.storages.db.scripts import populate
+from sbds.storages.db.tables import Base
+from sbds.storages.db.tables import init_tables
+from sbds.storages.db.tables.meta.accounts import ACCOUNT_NAME_EXTRACTORS
+from sbds.storages.sources import SteemdSource
+
+from .corpus import load_corpora
+from .corpus import replay
+from .steemd_stub import SteemdStub
+
+DATABASE_URL = os.environ.get('SBDS_BENCHMARK_DATABASE_URL')
+BLOCKS_PER_ERA = int(os.environ.get('SBDS_BENCHMARK_BLOCKS', 500))
+REPORT_PATH = os.environ.get('SBDS_BENCHMARK_REPORT')
+MIN_BLOCKS_PER_SEC = float(
+    os.environ.get('SBDS_BENCHMARK_MIN_BLOCKS_PER_SEC', 0))
+
+CORPORA = load_corpora()
+REPORT = dict()
+
+pytestmark = pytest.mark.skipif(
+    not DATABASE_URL, reason='SBDS_BENCHMARK_DATABASE_URL is not set')
+
+
+def account_names(blocks):
+    names = set()
+    for _, block, ops in blocks:
+        names.add(block['witness'])
+        for op in ops:
+            op_type, data = op['op']
+            extractor = ACCOUNT_NAME_EXTRACTORS.get(op_type)
+            if extractor:
+                names.update(extractor(dict(data, operation_type=op_type)))
+    # top level comments reference parent_author '', which must exist
+    # for the deferred account foreign keys to be satisfied
+    names.discard(None)
+    return names
+
+
+async def reset_benchmark_tables(pool, names):
+    async with pool.acquire() as conn:
+        tables = await conn.fetch(
+            "SELECT tablename FROM pg_tables WHERE tablename LIKE 'sbds_op_%' "
+            "OR tablename LIKE 'sbds_meta_ingest_%' "
+            "OR tablename LIKE 'sbds_meta_operation_%' "
+            "OR tablename IN ('sbds_core_blocks', 'sbds_core_blocks_raw', "
+            "'sbds_meta_accounts')")
+        tables = ', '.join(t['tablename'] for t in tables)
+        await conn.execute(f'TRUNCATE {tables}')
+        await conn.copy_records_to_table(
+            'sbds_meta_accounts', records=[(name,) for name in names])
+
+
+async def count_stored_blocks(pool, block_nums):
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            'SELECT COUNT(*) FROM sbds_core_blocks '
+            'WHERE block_num >= $1 AND block_num <= $2',
+            block_nums[0], block_nums[-1])
+
+
+@pytest.fixture(scope='module')
+def ingest():
+    loop = populate.loop
+    init_tables(DATABASE_URL, Base.metadata)
+    db_meta = populate.task_load_db_meta(DATABASE_URL)
+    pool = populate.create_asyncpg_pool(
+        DATABASE_URL, loop=loop, min_size=10, max_size=10)
+    client = aiohttp.ClientSession(
+        loop=loop, connector=TCPConnector(loop=loop, limit=100))
+    yield loop, pool, client, db_meta
+    loop.run_until_complete(client.close())
+    loop.run_until_complete(pool.close())
+    if REPORT_PATH:
+        with open(REPORT_PATH, 'w') as f:
+            json.dump(REPORT, f, indent=2, sort_keys=True)
+
+
+@pytest.mark.parametrize('corpus', CORPORA, ids=[c['era'] for c in CORPORA])
+def test_ingest_throughput(ingest, corpus):
+    loop, pool, client, db_meta = ingest
+    first_block_num = corpus['blocks'][0]['block_num']
+    blocks = list(replay(corpus, first_block_num, BLOCKS_PER_ERA))
+    block_nums = [block_num for block_num, _, _ in blocks]
+    loop.run_until_complete(
+        reset_benchmark_tables(pool, account_names(blocks)))
+
+    with SteemdStub(blocks) as steemd:
+        before = ingest_metrics.snapshot()
+        loop.run_until_complete(
+            populate.process_blocks(block_nums,
+                                    SteemdSource(steemd.url, client=client),
+                                    pool, db_meta))
+        after = ingest_metrics.snapshot()
+
+    stages, rows = ingest_metrics.rates(before, after)
+    elapsed = after['time'] - before['time']
+    ops = sum(len(ops) for _, _, ops in blocks)
+    REPORT[corpus['era']] = dict(
+        source=corpus['source'],
+        blocks=len(blocks),
+        ops=ops,
+        seconds=round(elapsed, 3),
+        blocks_per_sec=round(len(blocks) / elapsed, 1),
+        ops_per_sec=round(ops / elapsed, 1),
+        stages=stages,
+        rows_per_sec=rows)
+    print(f'\n{corpus["era"]}: {json.dumps(REPORT[corpus["era"]], indent=2)}')
+
+    assert loop.run_until_complete(
+        count_stored_blocks(pool, block_nums)) == len(blocks)
+    assert all(stages[s]['errors'] == 0 for s in ingest_metrics.STAGES)
+    assert REPORT[corpus['era']]['blocks_per_sec'] >= MIN_BLOCKS_PER_SEC
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sbds.storages.db.scripts.ingest_checkpoints import covered_ranges
+from sbds.storages.db.scripts.ingest_checkpoints import merge_ranges
+from sbds.storages.db.scripts.ingest_checkpoints import subtract_range
+from sbds.storages.db.scripts.ingest_checkpoints import uncovered_ranges
+
+
+@pytest.mark.parametrize('requested,stored,expected', [
+    ([], [], []),
+    ([1, 2, 3], [1, 2, 3], [(1, 3)]),
+    ([1, 2, 3], [], []),
+    ([1, 2, 3, 4, 5], [1, 2, 4, 5], [(1, 2), (4, 5)]),
+    ([1, 2, 3], [3], [(3, 3)]),
+    # block_nums between requested ones were already stored
+    ([10, 20, 30], [10, 20, 30], [(10, 30)]),
+    ([10, 20, 30], [10, 30], [(10, 10), (30, 30)]),
+    ([3, 1, 2], [2, 3, 1], [(1, 3)]),
+])
+def test_covered_ranges(requested, stored, expected):
+    assert covered_ranges(requested, stored) == expected
+
+
+@pytest.mark.parametrize('ranges,high_water,expected', [
+    ([], 0, (0, [])),
+    ([], 10, (10, [])),
+    # adjacent to high_water is absorbed, one past it isn't
+    ([(11, 20)], 10, (20, [])),
+    ([(12, 20)], 10, (10, [(12, 20)])),
+    # ranges inside high_water are dropped
+    ([(3, 5)], 10, (10, [])),
+    ([(5, 15)], 10, (15, [])),
+    ([(1, 5)], 0, (5, [])),
+    ([(2, 5)], 0, (0, [(2, 5)])),
+    # adjacent and overlapping ranges merge, a gap of one doesn't
+    ([(20, 30), (31, 40)], 0, (0, [(20, 40)])),
+    ([(20, 30), (25, 28)], 0, (0, [(20, 30)])),
+    ([(20, 30), (32, 40)], 0, (0, [(20, 30), (32, 40)])),
+    # unsorted input, and a merge reaching high_water
+    ([(32, 40), (11, 20), (21, 31)], 10, (40, [])),
+])
+def test_merge_ranges(ranges, high_water, expected):
+    assert merge_ranges(ranges, high_water) == expected
+
+
+@pytest.mark.parametrize('high_water,ranges,start,end,expected', [
+    (0, [], 1, 10, [(1, 10)]),
+    (10, [], 1, 10, []),
+    (9, [], 1, 10, [(10, 10)]),
+    (5, [], 1, 10, [(6, 10)]),
+    (0, [], 5, 10, [(5, 10)]),
+    (5, [(8, 9)], 1, 10, [(6, 7), (10, 10)]),
+    (5, [(6, 10)], 1, 10, []),
+    (5, [(7, 7)], 1, 10, [(6, 6), (8, 10)]),
+    # ranges outside start..end
+    (0, [(20, 30)], 1, 10, [(1, 10)]),
+    (0, [(1, 30)], 5, 10, []),
+    (0, [(3, 6)], 5, 10, [(7, 10)]),
+    (0, [(8, 20)], 1, 10, [(1, 7)]),
+    # start above high_water and ranges
+    (5, [(8, 9)], 9, 12, [(10, 12)]),
+    (0, [], 10, 9, []),
+])
+def test_uncovered_ranges(high_water, ranges, start, end, expected):
+    assert uncovered_ranges(high_water, ranges, start, end) == expected
+
+
+@pytest.mark.parametrize('high_water,ranges,first,last,expected', [
+    # from the top of high_water
+    (100, [], 91, 100, (90, [])),
+    # from inside high_water, the rest above it becomes a range
+    (100, [], 41, 50, (40, [(51, 100)])),
+    (100, [], 1, 100, (0, [])),
+    (100, [], 1, 1, (0, [(2, 100)])),
+    (100, [], 100, 100, (99, [])),
+    # above everything
+    (100, [(120, 130)], 200, 300, (100, [(120, 130)])),
+    # through a range
+    (100, [(120, 130)], 125, 125, (100, [(120, 124), (126, 130)])),
+    (100, [(120, 130)], 120, 130, (100, [])),
+    (100, [(120, 130)], 110, 125, (100, [(126, 130)])),
+    (100, [(120, 130)], 125, 200, (100, [(120, 124)])),
+    # from inside high_water through the ranges, as rollbacks do
+    (100, [(120, 130), (140, 150)], 91, 2 ** 31 - 1, (90, [])),
+    (100, [(120, 130), (140, 150)], 101, 2 ** 31 - 1, (100, [])),
+])
+def test_subtract_range(high_water, ranges, first, last, expected):
+    assert subtract_range(high_water, ranges, first, last) == expected
+
+
+def test_subtract_then_merge_round_trip():
+    high_water, ranges = subtract_range(100, [(120, 130)], 41, 50)
+    assert merge_ranges(ranges + [(41, 50)], high_water) == (100, [(120, 130)])
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import json
+from unittest import mock
+
+import pytest
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import ClientError
+from click.testing import CliRunner
+
+from sbds.sbds_json import loads
+from sbds.storages.fs.archive import SLOT
+from sbds.storages.fs.archive import SegmentArchive
+from sbds.storages.s3.cli import s3
+from sbds.storages.s3.segments import manifest_key
+from sbds.storages.s3.segments import upload_archive
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class FakeS3Client:
+    """In-memory stand-in for the parts of a boto3 S3 client used here"""
+
+    def __init__(self, fail_keys=()):
+        self.objects = dict()
+        self.fail_keys = set(fail_keys)
+        self.uploads = []
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self.uploads.append(Key)
+        if Key in self.fail_keys:
+            raise S3UploadFailedError(f'failed to upload {Key}')
+        with open(Filename, 'rb') as f:
+            self.objects[(Bucket, Key)] = f.read()
+
+    def get_object(self, Bucket, Key):
+        try:
+            return dict(Body=FakeBody(self.objects[(Bucket, Key)]))
+        except KeyError:
+            raise ClientError(dict(Error=dict(Code='NoSuchKey')), 'GetObject')
+
+
+@pytest.fixture
+def archive_path(tmpdir):
+    path = str(tmpdir.join('archive'))
+    with SegmentArchive(path, segment_size=10) as archive:
+        for block_num in range(1, 30):
+            archive.put(block_num, dict(block_num=block_num), [])
+    return path
+
+
+def stored_manifest(s3_client):
+    return loads(s3_client.objects[('bucket', manifest_key('blocks'))])
+
+
+def test_upload_archive(archive_path):
+    s3_client = FakeS3Client()
+    manifest = upload_archive(s3_client, archive_path, 'bucket', 'blocks')
+    assert stored_manifest(s3_client) == manifest
+    assert [(s['first'], s['blocks']) for s in manifest['segments']] == [
+        (0, 9), (10, 10), (20, 10)]
+    for entry in manifest['segments']:
+        seg = s3_client.objects[('bucket', entry['seg_key'])]
+        idx = s3_client.objects[('bucket', entry['idx_key'])]
+        assert len(seg) == entry['seg_size']
+        assert len(idx) == entry['idx_size'] == 10 * SLOT.size
+
+    # unchanged segments aren't uploaded again
+    s3_client.uploads.clear()
+    assert upload_archive(s3_client, archive_path, 'bucket',
+                          'blocks') == manifest
+    assert s3_client.uploads == []
+
+
+def test_upload_archive_writes_manifest_on_failure(archive_path):
+    s3_client = FakeS3Client(fail_keys={'blocks/segments/0000000010.seg'})
+    with pytest.raises(S3UploadFailedError):
+        upload_archive(s3_client, archive_path, 'bucket', 'blocks',
+                       retries=1)
+    manifest = stored_manifest(s3_client)
+    assert [s['first'] for s in manifest['segments']] == [0, 20]
+
+    # the next run only uploads the failed segment
+    s3_client.fail_keys.clear()
+    s3_client.uploads.clear()
+    manifest = upload_archive(s3_client, archive_path, 'bucket', 'blocks')
+    assert s3_client.uploads == ['blocks/segments/0000000010.seg']
+    assert [s['first'] for s in manifest['segments']] == [0, 10, 20]
+
+
+def test_put_json_blocks(tmpdir):
+    blocks = tmpdir.join('blocks.json')
+    blocks.write('\n'.join(json.dumps(dict(block_num=block_num))
+                           for block_num in range(1, 101)))
+    s3_client = FakeS3Client()
+    with mock.patch('boto3.client', return_value=s3_client):
+        result = CliRunner().invoke(s3, ['bucket', 'put-blocks', str(blocks)])
+    assert result.exit_code == 0, result.output
+    assert sorted(s3_client.objects) == sorted(
+        ('bucket', f'{block_num}/block.json') for block_num in range(1, 101))
+    assert json.loads(s3_client.objects[('bucket', '7/block.json')]) == dict(
+        block_num=7)